@@ -30,7 +30,7 @@ setup(name='mdscripts', author='Andras Wacha',
       description='Various scripts for molecular dynamics simulations',
       package_dir={'': 'src'},
       packages=['mdscripts', 'mdscripts.io', 'mdscripts.rama_analyzer', 'mdscripts.rtpbrowser', 'mdscripts.core',
-                'mdscripts.mdpmaker', 'mdscripts.mdpmaker.pages', 'mdscripts.updtopocount'],
+                'mdscripts.mdpmaker', 'mdscripts.mdpmaker.pages', 'mdscripts.updtopocount', 'mdscripts.analysis'],
       entry_points={'gui_scripts': ['gmx_extract_energy = mdscripts.extract_energy:run',
                                     'gmx_rama_analyzer = mdscripts.rama_analyzer.__main__:run',
                                     'gmx_rtp_browser = mdscripts.rtpbrowser.__main__:run',
@@ -0,0 +1,186 @@
+"""Autocorrelation and the standard error of the mean of correlated time series.
+
+Consecutive frames of a simulation are correlated, so the standard error of the mean is larger than std / sqrt(N).
+Two estimates are given, both for all columns of a 2-D array at once:
+
+- from the statistical inefficiency g = 1 + 2 sum_t (1 - t/N) C(t), where C(t) is the normalized autocorrelation
+  function, summed up to its first non-positive value: SEM = std * sqrt(g / N).
+- by block averaging (Flyvbjerg and Petersen): the series is halved repeatedly by averaging pairs of values, and the
+  largest of the naive estimates of the levels with enough blocks is taken.
+
+The autocorrelation function is computed by FFT. As only its first part is needed for the statistical inefficiency,
+it is computed in segments of `maxlag` values (cost O(N log maxlag)), and `maxlag` is doubled only for the columns
+which are still correlated.
+"""
+import numpy as np
+
+# the number of elements processed at once: the columns are taken in groups of about this size
+chunkelements = 1 << 24
+
+
+def _columngroups(ncolumns, width):
+    """Slices of the columns, `width` elements per column being processed at once"""
+    step = max(1, chunkelements // max(width, 1))
+    return [slice(first, min(first + step, ncolumns)) for first in range(0, ncolumns, step)]
+
+
+def autocorrelation(values, maxlag=None):
+    """The normalized autocorrelation function of the columns of `values` for the lags 0, 1, ..., maxlag - 1.
+
+    The mean of each column is subtracted. The lag-t term is averaged over the N - t pairs and divided by the
+    variance, so C(0) = 1 (NaN for constant columns). 1-D input gives 1-D output.
+    """
+    values = np.asarray(values, np.float64)
+    onedim = values.ndim == 1
+    if onedim:
+        values = values[:, np.newaxis]
+    n, ncolumns = values.shape
+    maxlag = n if maxlag is None else max(1, min(int(maxlag), n))
+    nsegments = -(-n // maxlag)
+    # the cross terms of consecutive segments are the products of the spectrum of one with the spectrum of the next,
+    # shifted by maxlag (by half of the padded length): this multiplies the spectrum by (-1)^f.
+    sign = np.where(np.arange(maxlag + 1) % 2, -1.0, 1.0)[:, np.newaxis]
+    result = np.empty((maxlag, ncolumns))
+    for columns in _columngroups(ncolumns, 2 * nsegments * maxlag):
+        y = np.zeros((nsegments * maxlag, columns.stop - columns.start))
+        y[:n] = values[:, columns]
+        y[:n] -= y[:n].mean(axis=0)
+        spectrum = np.fft.rfft(y.reshape(nsegments, maxlag, -1), n=2 * maxlag, axis=1)
+        del y
+        power = (spectrum.real ** 2 + spectrum.imag ** 2).sum(axis=0)
+        if nsegments > 1:
+            power = power + sign * np.einsum('ijk,ijk->jk', spectrum[:-1].conj(), spectrum[1:])
+        del spectrum
+        result[:, columns] = np.fft.irfft(power, n=2 * maxlag, axis=0)[:maxlag]
+    with np.errstate(invalid='ignore', divide='ignore'):
+        result /= (n - np.arange(maxlag))[:, np.newaxis]
+        result /= result[:1]
+    return result[:, 0] if onedim else result
+
+
+def statistical_inefficiency(values, maxlag=1024):
+    """The statistical inefficiency of the columns of `values`: the number of frames per independent sample.
+
+    The autocorrelation function is summed until its first non-positive value. It is first computed up to `maxlag`,
+    which is doubled for the columns where it is still positive there. The result is at least 1 (also for constant
+    columns). 1-D input gives a scalar.
+    """
+    values = np.asarray(values, np.float64)
+    onedim = values.ndim == 1
+    if onedim:
+        values = values[:, np.newaxis]
+    n, ncolumns = values.shape
+    g = np.ones(ncolumns)
+    pending = np.arange(ncolumns)
+    maxlag = max(2, min(maxlag, n))
+    while len(pending) and n > 1:
+        acf = autocorrelation(values if len(pending) == ncolumns else values[:, pending], maxlag)[1:]
+        # only the lags before the first non-positive value count; NaN (constant columns) stops the sum
+        positive = np.logical_and.accumulate(acf > 0, axis=0)
+        weights = 1 - np.arange(1, maxlag) / n
+        g[pending] = 1 + 2 * (np.where(positive, acf, 0) * weights[:, np.newaxis]).sum(axis=0)
+        if maxlag >= n:
+            break
+        pending = pending[positive[-1]]
+        maxlag = min(2 * maxlag, n)
+    g = np.maximum(g, 1)
+    return g[0] if onedim else g
+
+
+def blocking_sem(values, minblocks=16):
+    """The standard error of the mean of the columns of `values` by the block averaging method of Flyvbjerg and
+    Petersen. Levels with less than `minblocks` blocks are not considered. 1-D input gives a scalar."""
+    values = np.asarray(values, np.float64)
+    onedim = values.ndim == 1
+    if onedim:
+        values = values[:, np.newaxis]
+    n, ncolumns = values.shape
+    sem = np.full(ncolumns, np.nan)
+    for columns in _columngroups(ncolumns, n):
+        y = values[:, columns] - values[:, columns].mean(axis=0) if n else values[:, columns]
+        estimates = []
+        while len(y) >= max(minblocks, 2):
+            m = len(y)
+            variance = np.maximum((y * y).mean(axis=0) - y.mean(axis=0) ** 2, 0)
+            estimates.append(np.sqrt(variance / (m - 1)))
+            y = 0.5 * (y[0:m - m % 2:2] + y[1:m:2])
+        if estimates:
+            sem[columns] = np.max(estimates, axis=0)
+    return sem[0] if onedim else sem
+
+
+def detect_equilibration(values, ncandidates=40, maxlag=1024):
+    """Find the start of the equilibrated part of the columns of `values`: the first row which maximizes the number
+    of uncorrelated samples in the rest of the series, (N - start) / g(start).
+
+    The candidate starts are the first row and a geometric grid up to the middle of the series, rounded to multiples
+    of `maxlag`. The spectra of the segments of `maxlag` rows are computed once: the autocorrelation function of the
+    series starting at a segment boundary is the inverse FFT of the sums of the spectral terms of the following
+    segments, corrected for the mean of that part. `maxlag` is doubled for the columns where the autocorrelation
+    function is still positive there for any candidate.
+
+    Returns the start rows, the statistical inefficiencies and the numbers of uncorrelated samples at the start.
+    """
+    values = np.asarray(values, np.float64)
+    onedim = values.ndim == 1
+    if onedim:
+        values = values[:, np.newaxis]
+    n, ncolumns = values.shape
+    starts = np.zeros(ncolumns, np.int64)
+    g = np.ones(ncolumns)
+    neff = np.full(ncolumns, float(n))
+    pending = np.arange(ncolumns)
+    maxlag = max(2, min(maxlag, n))
+    while len(pending) and n > 1:
+        nsegments = -(-n // maxlag)
+        candidates = np.unique(np.concatenate(
+            [[0], np.geomspace(1, max(nsegments // 2, 1), ncandidates - 1).astype(np.int64)]))
+        candidates = candidates[candidates <= nsegments // 2]
+        sign = np.where(np.arange(maxlag + 1) % 2, -1.0, 1.0)[:, np.newaxis]
+        lags = np.arange(maxlag)
+        stillcorrelated = np.zeros(ncolumns, bool)
+        for group in _columngroups(len(pending), 2 * nsegments * maxlag):
+            columns = pending[group]
+            y = np.zeros((nsegments * maxlag, len(columns)))
+            y[:n] = values[:, columns]
+            y[:n] -= y[:n].mean(axis=0)
+            prefix = np.zeros((n + 1, len(columns)))
+            np.cumsum(y[:n], axis=0, out=prefix[1:])
+            spectrum = np.fft.rfft(y.reshape(nsegments, maxlag, -1), n=2 * maxlag, axis=1)
+            del y
+            # the sums of the spectral terms from each candidate segment to the next one, then to the end
+            cross = np.zeros_like(spectrum)
+            np.multiply(spectrum[:-1].conj(), spectrum[1:], out=cross[:-1])
+            power = (np.add.reduceat(spectrum.real ** 2 + spectrum.imag ** 2, candidates, axis=0) +
+                     sign * np.add.reduceat(cross, candidates, axis=0))
+            del spectrum, cross
+            power = np.cumsum(power[::-1], axis=0)[::-1]
+            for candidate, p in zip(candidates, power):
+                first = candidate * maxlag
+                length = n - first
+                valid = lags[lags < length]
+                raw = np.fft.irfft(p, n=2 * maxlag, axis=0)[:len(valid)]
+                # subtract the mean of the part from the sums of the products
+                mean = (prefix[n] - prefix[first]) / length
+                left = prefix[n - valid] - prefix[first]
+                right = prefix[n] - prefix[first + valid]
+                counts = (length - valid)[:, np.newaxis]
+                with np.errstate(invalid='ignore', divide='ignore'):
+                    acf = (raw - mean * (left + right)) / counts + mean * mean
+                    acf = acf[1:] / acf[:1]
+                positive = np.logical_and.accumulate(acf > 0, axis=0)
+                inefficiency = np.maximum(
+                    1 + 2 * (np.where(positive, acf, 0) * (1 - valid[1:] / length)[:, np.newaxis]).sum(axis=0), 1)
+                if len(valid) == maxlag and maxlag < n:
+                    stillcorrelated[columns] |= positive[-1]
+                better = length / inefficiency > neff[columns] if candidate else np.ones(len(columns), bool)
+                starts[columns[better]] = first
+                g[columns[better]] = inefficiency[better]
+                neff[columns[better]] = length / inefficiency[better]
+        pending = pending[stillcorrelated[pending]]
+        if maxlag >= n:
+            break
+        maxlag = min(2 * maxlag, n)
+    if onedim:
+        return starts[0], g[0], neff[0]
+    return starts, g, neff
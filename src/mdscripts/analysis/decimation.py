@@ -0,0 +1,166 @@
+"""Level-of-detail decimation of long curves for plotting.
+
+A line plot of millions of points cannot show more detail than a few points per pixel column: in each column only the
+first, the last, the lowest and the highest point matter. `MinMaxPyramid` keeps the indices of the minima and the
+maxima of the curve in buckets of 2**k points for every level k, so the representative points of any visible x range
+can be looked up at the resolution matching the width of the axes. The decimated curve is a subsequence of the
+original one, including all extrema at the chosen resolution, so it looks the same when drawn.
+
+`DecimatedLine` is a matplotlib line, which is decimated again when the x limits of the axes change (zooming and
+panning) or the canvas is resized.
+"""
+import numpy as np
+
+from .timeseries import reserve
+
+
+class MinMaxPyramid(object):
+    """Indices of the minima and maxima of a curve in buckets of `basesize` * 2**k consecutive points.
+
+    The abscissa must be sorted in ascending order.
+    """
+    # the size of the buckets on the finest level
+    basesize = 16
+    # the number of buckets per pixel column in the decimated curve
+    bucketsperpixel = 2
+
+    def __init__(self, x, y):
+        self.x = self._xbuffer = np.asarray(x)
+        self.y = self._ybuffer = np.asarray(y)
+        # the index arrays of the levels are views of buffers with room for appending
+        self.argmin = []
+        self.argmax = []
+        self._buffers = []
+        self._update(0)
+
+    def append(self, x, y):
+        """Append points to the curve. Only the buckets containing new points are updated."""
+        n = len(self.y)
+        self._xbuffer = reserve(self._xbuffer, n + len(y))
+        self._ybuffer = reserve(self._ybuffer, n + len(y))
+        self._xbuffer[n:n + len(y)] = x
+        self._ybuffer[n:n + len(y)] = y
+        self.x = self._xbuffer[:n + len(y)]
+        self.y = self._ybuffer[:n + len(y)]
+        self._update(n)
+
+    def _update(self, oldlength):
+        """Compute the buckets from the one containing point #`oldlength`"""
+        n = len(self.y)
+        first = oldlength // self.basesize
+        nbuckets = -(-n // self.basesize)
+        padded = np.empty((nbuckets - first) * self.basesize, self.y.dtype)
+        padded[:n - first * self.basesize] = self.y[first * self.basesize:]
+        padded[n - first * self.basesize:] = np.inf
+        offsets = np.arange(first, nbuckets, dtype=np.intp) * self.basesize
+        minima = padded.reshape(-1, self.basesize).argmin(axis=1) + offsets
+        padded[n - first * self.basesize:] = -np.inf
+        maxima = padded.reshape(-1, self.basesize).argmax(axis=1) + offsets
+        level = 0
+        while True:
+            if level == len(self.argmin):
+                self.argmin.append(np.empty(0, np.intp))
+                self.argmax.append(np.empty(0, np.intp))
+                self._buffers.append([self.argmin[level], self.argmax[level]])
+            length = first + len(minima)
+            for i, (indices, new) in enumerate([(self.argmin, minima), (self.argmax, maxima)]):
+                self._buffers[level][i] = reserve(self._buffers[level][i], length)
+                self._buffers[level][i][first:length] = new
+                indices[level] = self._buffers[level][i][:length]
+            if length <= 1:
+                break
+            # the next level: pairs of buckets of this one, the last one paired with itself if the number is odd
+            first = first // 2
+            minima = self._merge(self.argmin[level], first, np.less)
+            maxima = self._merge(self.argmax[level], first, np.greater)
+            level += 1
+        del self.argmin[level + 1:], self.argmax[level + 1:], self._buffers[level + 1:]
+
+    def _merge(self, indices, first, better):
+        """Combine pairs of buckets of the previous level from pair #`first`"""
+        left = indices[2 * first::2]
+        right = indices[np.minimum(np.arange(2 * first + 1, len(indices) + 1, 2), len(indices) - 1)]
+        return np.where(better(self.y[right], self.y[left]), right, left)
+
+    def __len__(self):
+        return len(self.y)
+
+    def decimate(self, xmin=None, xmax=None, width=1000):
+        """The points to be drawn between xmin and xmax (None for the ends of the curve) on `width` pixels.
+
+        One point beyond each end is included, so the line continues to the edges of the axes."""
+        n = len(self.y)
+        first = 0 if xmin is None else max(int(np.searchsorted(self.x, xmin, side='left')) - 1, 0)
+        last = n if xmax is None else min(int(np.searchsorted(self.x, xmax, side='right')) + 1, n)
+        buckets = max(int(width), 1) * self.bucketsperpixel
+        if last - first <= buckets * self.basesize:
+            return self.x[first:last], self.y[first:last]
+        # the coarsest level whose buckets are not larger than (last - first) / buckets points
+        level = min(int(np.log2((last - first) / buckets / self.basesize)), len(self.argmin) - 1)
+        bucketsize = self.basesize * 2 ** level
+        firstbucket = first // bucketsize
+        lastbucket = -(-last // bucketsize)
+        bucketstarts = np.arange(firstbucket, lastbucket, dtype=np.int64) * bucketsize
+        indices = np.stack([np.maximum(bucketstarts, first),
+                            self.argmin[level][firstbucket:lastbucket],
+                            self.argmax[level][firstbucket:lastbucket],
+                            np.minimum(bucketstarts + bucketsize, last) - 1], axis=1)
+        # the extrema of the partial buckets at the ends can be outside [first, last): that is harmless, as they are
+        # still points of the curve
+        indices.sort(axis=1)
+        indices = indices.ravel()
+        indices = indices[np.concatenate([[True], indices[1:] != indices[:-1]])]
+        return self.x[indices], self.y[indices]
+
+
+class DecimatedLine(object):
+    """A line in matplotlib axes, showing a decimated curve matching the current view.
+
+    Further arguments are passed to `axes.plot()`. The matplotlib line is available as the `line` attribute."""
+
+    def __init__(self, axes, x, y, *args, **kwargs):
+        self.axes = axes
+        self.pyramid = MinMaxPyramid(x, y)
+        self.line = axes.plot(*self._decimate(), *args, **kwargs)[0]
+        # axes sharing the x axis (e.g. twins) do not get the callbacks of each other
+        self._callbacks = [(ax, ax.callbacks.connect('xlim_changed', self.update))
+                           for ax in axes.get_shared_x_axes().get_siblings(axes)]
+        self._resizecallback = axes.figure.canvas.mpl_connect('resize_event', self.update)
+
+    def _decimate(self):
+        if self.axes.get_autoscalex_on():
+            # the limits are still to be determined from the whole curve
+            xmin = xmax = None
+        else:
+            xmin, xmax = sorted(self.axes.get_xlim())
+        return self.pyramid.decimate(xmin, xmax, self.axes.get_window_extent().width)
+
+    def set_data(self, x, y):
+        """Change the curve. Nothing is done if the same arrays are given again, or new views of the same memory (e.g.
+        the columns of a dataset taken again)."""
+        if self._same(x, self.pyramid.x) and self._same(y, self.pyramid.y):
+            return
+        self.pyramid = MinMaxPyramid(x, y)
+        self.update()
+
+    @staticmethod
+    def _same(a, b):
+        # the pyramid keeps its arrays alive, so their memory cannot be reused by other arrays meanwhile
+        a = np.asarray(a)
+        return (a.__array_interface__['data'][0] == b.__array_interface__['data'][0] and a.shape == b.shape and
+                a.strides == b.strides and a.dtype == b.dtype)
+
+    def append(self, x, y):
+        """Append points to the curve"""
+        self.pyramid.append(x, y)
+        self.update()
+
+    def update(self, event=None):
+        """Decimate the curve for the current view"""
+        self.line.set_data(*self._decimate())
+
+    def remove(self):
+        for ax, cid in self._callbacks:
+            ax.callbacks.disconnect(cid)
+        self.axes.figure.canvas.mpl_disconnect(self._resizecallback)
+        self.line.remove()
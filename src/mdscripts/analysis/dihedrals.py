@@ -0,0 +1,179 @@
+"""Backbone dihedral angles (phi, psi) of proteins computed from coordinates.
+
+phi of residue i is the C(i-1)-N(i)-CA(i)-C(i) dihedral, psi is N(i)-CA(i)-C(i)-N(i+1). The atoms are looked up once
+from the residue and atom names of a structure, then the angles of all residues are computed for many frames at
+once with vectorized cross products and arctan2, like `gmx rama` does in a separate pass. The bond vectors are taken
+with the minimum image convention in the box of each frame, so molecules broken by the periodic boundaries are
+handled.
+"""
+import os
+
+import numpy as np
+
+from .neighboursearch import box_matrix
+from .timeseries import reserve
+from ..io.frameindex import FrameIndex
+from ..io.gro import GROFile
+from ..io.rama_xvg import RamachandranData, count_rama_xvg_frames, load_rama_xvg
+from ..io.xtc import XTCReader
+
+
+def minimum_image(vectors, box):
+    """The periodic images of difference vectors (an array of shape (..., 3)) closest to zero. `box` holds the box
+    vectors in the rows of a 3x3 matrix, or is a stack of such matrices (nframes, 3, 3) for vectors of shape (nframes,
+    ..., 3). In triclinic boxes the result is the shortest image only for vectors shorter than half of the box, e.g.
+    bonds. Boxes without volume (e.g. the zero box of a structure in vacuum) do not shift the vectors."""
+    vectors = np.asarray(vectors, np.float64)
+    box = np.asarray(box, np.float64)
+    flat = vectors.reshape(box.shape[:-2] + (-1, 3))
+    # the pseudo-inverse is zero in the directions without periodicity
+    shifts = np.round(flat @ np.linalg.pinv(box)) @ box
+    return (flat - shifts).reshape(vectors.shape)
+
+
+def dihedrals(p0, p1, p2, p3, box=None):
+    """The dihedral angles (in degrees, between -180 and 180) of quadruplets of points, given as arrays of shape
+    (..., 3). The sign follows the IUPAC convention, as in GROMACS. If `box` is given, the minimum images of the bond
+    vectors are taken (see minimum_image())."""
+    bonds = np.stack([p1 - p0, p2 - p1, p3 - p2], axis=-2)
+    if box is not None:
+        bonds = minimum_image(bonds, box)
+    return _dihedrals(bonds[..., 0, :], bonds[..., 1, :], bonds[..., 2, :])
+
+
+def _dihedrals(b1, b2, b3):
+    """The dihedral angles from the bond vectors"""
+    n1 = np.cross(b1, b2)
+    n2 = np.cross(b2, b3)
+    x = (n1 * n2).sum(axis=-1)
+    y = np.sqrt((b2 * b2).sum(axis=-1)) * (b1 * n2).sum(axis=-1)
+    return np.degrees(np.arctan2(y, x))
+
+
+class BackboneDihedrals(object):
+    """The atoms of the phi and psi dihedrals of the residues in a structure (a GROFile).
+
+    Residues with N, CA and C atoms are backbone residues. Two consecutive backbone residues are bonded if the C of the
+    first one and the N of the second one are closer than `peptidebond` (nm) in the structure (in the minimum image
+    convention), so chain breaks are recognized. As in `gmx rama`, only residues having both phi and psi are included, named like 'ALA-2'.
+    """
+    # the names of the backbone atoms
+    nitrogen = b'N'
+    alphacarbon = b'CA'
+    carbon = b'C'
+    # the maximum C-N distance of a peptide bond in the structure, in nm
+    peptidebond = 0.2
+    # the number of frames whose angles are computed at once
+    chunkframes = 256
+
+    def __init__(self, gro):
+        names = gro.grodata['name']
+        residue = gro.atom_residue_index()
+        backbone = np.full((3, gro.nresidues()), -1, np.intp)
+        for row, name in enumerate([self.nitrogen, self.alphacarbon, self.carbon]):
+            atoms = np.flatnonzero(names == name)
+            # the first atom of the name in each residue
+            backbone[row, residue[atoms[::-1]]] = atoms[::-1]
+        residues = np.flatnonzero((backbone >= 0).all(axis=0))
+        n, ca, c = backbone[:, residues]
+        coords = gro.coordinates()
+        bonded = np.linalg.norm(minimum_image(coords[n[1:]] - coords[c[:-1]], box_matrix(gro.boxsize)),
+                                axis=1) < self.peptidebond
+        # residues bonded to the previous and to the next backbone residue
+        inner = np.flatnonzero(bonded[:-1] & bonded[1:]) + 1
+        # the atoms of phi and psi: C(i-1) N(i) CA(i) C(i) N(i+1)
+        self.atoms = np.stack([c[inner - 1], n[inner], ca[inner], c[inner], n[inner + 1]], axis=1)
+        first = gro.residue_starts()[residues[inner]]
+        self.residues = ['{}-{:d}'.format(resn, resi) for resn, resi in zip(
+            np.char.decode(gro.grodata['resn'][first], 'ascii').tolist(), gro.grodata['resi'][first].tolist())]
+
+    def __len__(self):
+        return len(self.residues)
+
+    def compute(self, coordinates, box=None):
+        """The phi and psi angles (in degrees) from the coordinates of all atoms, an array of shape (natoms, 3) or
+        (nframes, natoms, 3), and the box (see minimum_image(), None for no periodicity). The results have the shape
+        (nresidues,) or (nframes, nresidues)."""
+        return self._angles(np.asarray(coordinates, np.float64)[..., self.atoms, :], box)
+
+    @staticmethod
+    def _angles(points, box=None):
+        """The phi and psi angles from the points of the dihedrals: an array of shape (..., nresidues, 5, 3)"""
+        # C(i-1)-N(i), N(i)-CA(i), CA(i)-C(i) and C(i)-N(i+1)
+        bonds = np.diff(points, axis=-2)
+        if box is not None:
+            bonds = minimum_image(bonds, box)
+        phi = _dihedrals(bonds[..., 0, :], bonds[..., 1, :], bonds[..., 2, :])
+        psi = _dihedrals(bonds[..., 1, :], bonds[..., 2, :], bonds[..., 3, :])
+        return phi.astype(np.float32), psi.astype(np.float32)
+
+    def trajectory(self, frames):
+        """Compute the angles for an iterable of (coordinates, box) pairs: coordinate arrays of shape (natoms, 3) and
+        3x3 box matrices (see box_matrix()), e.g. the frames of a trajectory read one by one. Only the coordinates of
+        the backbone atoms are kept, `chunkframes` frames at a time. Returns the phi and psi arrays of shape (nframes,
+        nresidues)."""
+        used, atoms = np.unique(self.atoms, return_inverse=True)
+        # the indices of the atoms of the dihedrals among the kept ones
+        atoms = atoms.reshape(self.atoms.shape)
+        batch = np.empty((self.chunkframes, len(used), 3))
+        boxes = np.empty((self.chunkframes, 3, 3))
+        phi = np.empty((0, len(self)), np.float32)
+        psi = np.empty((0, len(self)), np.float32)
+        nframes = 0
+        nbatch = 0
+        for coordinates, box in frames:
+            batch[nbatch] = coordinates[used]
+            boxes[nbatch] = box
+            nbatch += 1
+            if nbatch == self.chunkframes:
+                phi, psi = self._append(phi, psi, nframes, self._angles(batch[:, atoms], boxes))
+                nframes += nbatch
+                nbatch = 0
+        if nbatch:
+            phi, psi = self._append(phi, psi, nframes, self._angles(batch[:nbatch, atoms], boxes[:nbatch]))
+            nframes += nbatch
+        return phi[:nframes], psi[:nframes]
+
+    @staticmethod
+    def _append(phi, psi, nframes, angles):
+        phi = reserve(phi, nframes + len(angles[0]))
+        psi = reserve(psi, nframes + len(angles[1]))
+        phi[nframes:nframes + len(angles[0])] = angles[0]
+        psi[nframes:nframes + len(angles[1])] = angles[1]
+        return phi, psi
+
+
+def load_rama_trajectory(filename, structure=None, start=None, stop=None):
+    """Compute the backbone dihedrals of all frames of a multi-frame .gro file, or of an .xtc trajectory with the
+    structure (.gro file) given separately. Returns a RamachandranData instance, like load_rama_xvg().
+
+    If `start` or `stop` is given, only the frames from #`start` to #`stop` (exclusive) are read: the first one is
+    found through the byte offset index of the file, the frames before it are not read."""
+    if os.path.splitext(filename)[1].lower() == '.xtc':
+        if structure is None:
+            raise ValueError('The structure file is needed for the trajectory {}'.format(filename))
+        engine = BackboneDihedrals(GROFile.load(structure))
+        frames = ((frame.coords, frame.box) for frame in XTCReader(filename).iter_frames(start or 0, stop))
+    else:
+        gro = GROFile.load(filename if structure is None else structure)
+        engine = BackboneDihedrals(gro)
+        frames = ((frame.coordinates(), box_matrix(frame.boxsize))
+                  for frame in GROFile.iter_frames(filename, start, stop))
+    phi, psi = engine.trajectory(frames)
+    return RamachandranData(phi, psi, engine.residues)
+
+
+def load_ramachandran(filename, structure=None, start=None, stop=None):
+    """Load the output of `gmx rama` (.xvg) or compute the dihedrals from a trajectory, see load_rama_trajectory()"""
+    if os.path.splitext(filename)[1].lower() == '.xvg':
+        return load_rama_xvg(filename, start, stop)
+    return load_rama_trajectory(filename, structure, start, stop)
+
+
+def count_frames(filename):
+    """The number of frames in the output of `gmx rama` (.xvg) or in a trajectory (.gro or .xtc), from the byte
+    offset index of the file"""
+    kind = os.path.splitext(filename)[1][1:].lower()
+    if kind == 'xvg':
+        return count_rama_xvg_frames(filename)
+    return len(FrameIndex.for_file(filename, 'xtc' if kind == 'xtc' else 'gro'))
@@ -0,0 +1,159 @@
+"""Grid (cell list) neighbour search in periodic rectangular and triclinic boxes.
+
+Boxes are given either as the last line of a .gro file (3 values for rectangular, 9 values for triclinic boxes) or as
+a 3x3 matrix with the box vectors in its rows.
+"""
+import itertools
+
+import numpy as np
+
+
+def box_matrix(box) -> np.ndarray:
+    """Box vectors in the rows of a 3x3 matrix."""
+    box = np.asarray(box, np.float64)
+    if box.shape == (3, 3):
+        return box
+    elif box.shape == (3,):
+        return np.diag(box)
+    elif box.shape == (9,):
+        # the order of the box line in .gro files: v1(x) v2(y) v3(z) v1(y) v1(z) v2(x) v2(z) v3(x) v3(y)
+        v1x, v2y, v3z, v1y, v1z, v2x, v2z, v3x, v3y = box
+        return np.array([[v1x, v1y, v1z], [v2x, v2y, v2z], [v3x, v3y, v3z]])
+    raise ValueError('The box must be given by 3 or 9 values or a 3x3 matrix')
+
+
+class CellList(object):
+    """Atoms sorted into a grid of cells spanning the periodic box.
+
+    The box is divided into cells in fractional coordinates, such that the distance between opposite faces of a cell
+    is not less than the cutoff. Neighbours within the cutoff of a point are then found in the 27 cells around it.
+    """
+    # the maximum number of candidate pairs examined at once
+    chunksize = 1 << 20
+
+    def __init__(self, coords, box, cutoff):
+        self.box = box_matrix(box)
+        self.cutoff = float(cutoff)
+        volume = abs(np.linalg.det(self.box))
+        # distance of the opposite faces of the box
+        heights = np.array([volume / np.linalg.norm(np.cross(self.box[(d + 1) % 3], self.box[(d + 2) % 3]))
+                            for d in range(3)])
+        if 2 * self.cutoff >= heights.min():
+            raise ValueError('The cutoff must be shorter than half of the shortest box height ({:g})'.format(
+                heights.min()))
+        self.ncells = np.maximum(np.floor(heights / self.cutoff).astype(np.intp), 1)
+        coords, cells = self._wrap(coords)
+        self.order, self.cellstarts = self._sort(cells)
+        # the coordinates in the order of the cells, one array for each direction
+        self.sorted_coords = [np.ascontiguousarray(coords[self.order, d]) for d in range(3)]
+        self.sorted_cells = cells[self.order]
+
+    def _wrap(self, coords):
+        """Put the points in the box. Returns the wrapped coordinates and the cell indices."""
+        coords = np.asarray(coords, np.float64).reshape(-1, 3)
+        frac = coords @ np.linalg.inv(self.box)
+        frac -= np.floor(frac)
+        cells = np.minimum((frac * self.ncells).astype(np.intp), self.ncells - 1)
+        return frac @ self.box, cells
+
+    def _sort(self, cells):
+        """Order of the points sorted by cells and the index of the first point in each cell"""
+        cellid = np.ravel_multi_index(cells.T, self.ncells)
+        order = np.argsort(cellid, kind='stable')
+        return order, np.searchsorted(cellid[order], np.arange(self.ncells.prod() + 1))
+
+    def __len__(self):
+        return len(self.order)
+
+    def _candidates(self, points, cells, offsets):
+        """Yield the cell offset, the index of the point, the position of the atom in the sorted order and the squared
+        distance of the pairs closer than the cutoff, looking for the atoms in the cells at the given offsets from
+        the points."""
+        natomspercell = max(len(self) / self.ncells.prod(), 1)
+        pointchunk = max(int(self.chunksize / natomspercell), 1)
+        for start in range(0, len(points), pointchunk):
+            for offset in offsets:
+                neighbourcells = cells[start:start + pointchunk] + offset
+                # periodic images of the cells beyond the box edges
+                images = np.floor_divide(neighbourcells, self.ncells)
+                neighbourcells -= images * self.ncells
+                shifted = points[start:start + pointchunk] - images @ self.box
+                cellid = np.ravel_multi_index(neighbourcells.T, self.ncells)
+                starts = self.cellstarts[cellid]
+                counts = self.cellstarts[cellid + 1] - starts
+                total = counts.sum()
+                if not total:
+                    continue
+                ipoint = np.repeat(np.arange(len(counts)), counts)
+                # position of each candidate in the sorted atom list
+                firstcandidate = np.cumsum(counts) - counts
+                pos = np.arange(total) - np.repeat(firstcandidate - starts, counts)
+                dist2 = np.zeros(total)
+                for d in range(3):
+                    diff = shifted[:, d].take(ipoint) - self.sorted_coords[d].take(pos)
+                    dist2 += diff * diff
+                close = np.flatnonzero(dist2 < self.cutoff ** 2)
+                yield offset, ipoint[close] + start, pos[close], dist2[close]
+
+    @staticmethod
+    def _collect(result):
+        if not result:
+            return np.zeros(0, np.intp), np.zeros(0, np.intp), np.zeros(0)
+        return tuple(np.concatenate(x) for x in zip(*result))
+
+    def query(self, points):
+        """Find all pairs of a query point and an atom closer than the cutoff.
+
+        Returns the indices of the points, the indices of the atoms and the distances."""
+        points, cells = self._wrap(points)
+        # looking up the query points in the order of the cells is more cache friendly
+        order, cellstarts = self._sort(cells)
+        ipoint, pos, dist2 = self._collect([
+            candidates[1:] for candidates in
+            self._candidates(points[order], cells[order], itertools.product([-1, 0, 1], repeat=3))])
+        return order[ipoint], self.order[pos], np.sqrt(dist2)
+
+    def pairs(self):
+        """Find all pairs of atoms closer than the cutoff. Returns the indices (i < j) and the distances."""
+        offsets = list(itertools.product([-1, 0, 1], repeat=3))
+        halfshell = (self.ncells >= 3).all()
+        if halfshell:
+            # the cell pairs are distinct, each needs to be visited only once. The first half of the offsets are
+            # the opposites of the second half, starting with (0, 0, 0).
+            offsets = offsets[len(offsets) // 2:]
+        result = []
+        for offset, ipoint, pos, dist2 in self._candidates(
+                np.stack(self.sorted_coords, axis=1), self.sorted_cells, offsets):
+            if not halfshell or offset == (0, 0, 0):
+                # pairs are found from both atoms
+                keep = ipoint < pos
+                ipoint, pos, dist2 = ipoint[keep], pos[keep], dist2[keep]
+            result.append((ipoint, pos, dist2))
+        ipoint, pos, dist2 = self._collect(result)
+        i, j = self.order[ipoint], self.order[pos]
+        return np.minimum(i, j), np.maximum(i, j), np.sqrt(dist2)
+
+
+def neighbour_pairs(coords, box, cutoff):
+    """Find all pairs of atoms closer than `cutoff` in a periodic box.
+
+    Returns the indices of the atoms in each pair (i < j) and their distance."""
+    return CellList(coords, box, cutoff).pairs()
+
+
+def contact_matrix(coords, box, cutoff):
+    """Sparse symmetric (scipy.sparse.csr_matrix) matrix of the distances of atoms closer than `cutoff`."""
+    import scipy.sparse
+    i, j, dist = neighbour_pairs(coords, box, cutoff)
+    n = len(coords)
+    return scipy.sparse.coo_matrix(
+        (np.concatenate([dist, dist]), (np.concatenate([i, j]), np.concatenate([j, i]))), shape=(n, n)).tocsr()
+
+
+def within(coords, reference, box, cutoff) -> np.ndarray:
+    """Flag the atoms which are closer than `cutoff` to any of the reference points."""
+    flags = np.zeros(len(coords), bool)
+    if len(coords) and len(reference):
+        ipoint, iatom, dist = CellList(coords, box, cutoff).query(reference)
+        flags[iatom] = True
+    return flags
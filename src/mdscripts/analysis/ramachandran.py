@@ -0,0 +1,219 @@
+"""Densities, free energies and conformational states on the Ramachandran plane.
+
+The (phi, psi) plane is periodic in both directions, so the histograms are counted on a grid over [-180, 180) degrees
+with the angles wrapped around, and smoothing is a wrap-around convolution with a Gaussian, done by FFT.
+
+Conformational states (basins) are polygons on the plane. They are rasterized once on a fine grid, so classifying
+the angles of a trajectory is a table lookup. The kinetics of the states (occupancies, transitions and lifetimes)
+are computed from the state time series of the residues with bincounts and run-length encoding.
+"""
+import numpy as np
+
+# the Boltzmann constant in kJ/(mol K)
+kB = 0.0083144626
+
+
+def free_energy(density, temperature=300):
+    """-kT ln(p / max(p)) in kJ/mol: zero at the most populated point, NaN where the density is zero"""
+    density = np.asarray(density, np.float64)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.where(density > 0, -kB * temperature * np.log(density / density.max()), np.nan)
+
+
+class RamachandranHistograms(object):
+    """2-D histograms of the (phi, psi) angles of each residue on a `bins` x `bins` periodic grid.
+
+    `phi` and `psi` are arrays of shape (nframes, nresidues) in degrees. The histograms of all residues are counted
+    in one pass over the frames. The histogram of a set of residues is the sum of theirs, which does not depend on the
+    number of frames. The first index of the histograms is phi, the second one is psi. Non-finite angles (e.g. of
+    terminal residues) are not counted.
+    """
+    # the number of angle pairs binned at once
+    chunkelements = 1 << 22
+
+    def __init__(self, phi, psi, bins=72):
+        phi = np.asarray(phi)
+        psi = np.asarray(psi)
+        nframes, nresidues = phi.shape
+        self.bins = bins
+        counts = np.zeros(nresidues * bins * bins, np.int64)
+        offsets = np.arange(nresidues, dtype=np.int64) * bins * bins
+        step = max(1, self.chunkelements // max(nresidues, 1))
+        for first in range(0, nframes, step):
+            rows = slice(first, first + step)
+            valid = np.isfinite(phi[rows]) & np.isfinite(psi[rows])
+            flat = offsets + self.binindex(np.where(valid, phi[rows], 0)) * bins + self.binindex(
+                np.where(valid, psi[rows], 0))
+            counts += np.bincount(flat[valid], minlength=len(counts))
+        self.counts = counts.reshape(nresidues, bins, bins)
+        # the spectra of the smoothing kernels, keyed by their width
+        self._kernels = {}
+
+    def binindex(self, angles):
+        """The bin indices of angles in degrees, wrapped around into [-180, 180)"""
+        return np.floor((np.asarray(angles, np.float64) + 180) * (self.bins / 360)).astype(np.int64) % self.bins
+
+    @property
+    def binwidth(self):
+        return 360 / self.bins
+
+    @property
+    def edges(self):
+        return np.linspace(-180, 180, self.bins + 1)
+
+    @property
+    def centers(self):
+        return -180 + (np.arange(self.bins) + 0.5) * self.binwidth
+
+    def histogram(self, residues=None):
+        """The summed counts of residues (column indices or a boolean mask, None for all)"""
+        return self.counts.sum(axis=0) if residues is None else self.counts[residues].sum(axis=0)
+
+    def density(self, residues=None, smoothing=0):
+        """The probability density (per square degree) of the residues, smoothed by a periodic Gaussian of
+        `smoothing` degrees standard deviation if it is positive"""
+        histogram = self.histogram(residues).astype(np.float64)
+        total = histogram.sum()
+        if total:
+            histogram /= total * self.binwidth ** 2
+        return self.smooth(histogram, smoothing) if smoothing > 0 else histogram
+
+    def smooth(self, histogram, sigma):
+        """Convolve a histogram with a Gaussian of `sigma` degrees standard deviation, wrapped around the edges"""
+        try:
+            kernel = self._kernels[sigma]
+        except KeyError:
+            # the periodic distances of the grid points from the origin
+            distance = np.minimum(np.arange(self.bins), self.bins - np.arange(self.bins)) * self.binwidth
+            profile = np.exp(-0.5 * (distance / sigma) ** 2)
+            kernel = np.outer(profile, profile)
+            kernel = self._kernels[sigma] = np.fft.rfft2(kernel / kernel.sum())
+        return np.maximum(np.fft.irfft2(np.fft.rfft2(histogram) * kernel, s=histogram.shape), 0)
+
+
+def _inside(x, y, vertices):
+    """Flag the points inside a polygon (even-odd rule)"""
+    vertices = np.asarray(vertices, np.float64)
+    inside = np.zeros(np.shape(x), bool)
+    for (x1, y1), (x2, y2) in zip(vertices, np.roll(vertices, -1, axis=0)):
+        if y1 == y2:
+            continue
+        crossing = (y1 > y) != (y2 > y)
+        inside ^= crossing & (x < x1 + (x2 - x1) * (y - y1) / (y2 - y1))
+    return inside
+
+
+class ConformationalStates(object):
+    """Conformational states on the Ramachandran plane, each given by a name and a list of polygons of (phi, psi)
+    vertices in degrees.
+
+    The user-defined states (`polygons`, a list of (name, polygons) pairs) come before the default basins (if
+    `defaults` is True); where states overlap, the first one wins. Angles outside all states are in the last state,
+    'other'. States are numbered in the order of `names`.
+    """
+    # the default basins: the right-handed alpha helix, the beta strand, the polyproline II helix and the left-handed
+    # alpha helix. The beta and PPII regions wrap around psi = 180.
+    basins = [
+        ('alphaR', [[(-160, -120), (-20, -120), (-20, 50), (-160, 50)]]),
+        ('beta', [[(-180, 90), (-90, 90), (-90, 180), (-180, 180)],
+                  [(-180, -180), (-90, -180), (-90, -150), (-180, -150)]]),
+        ('PPII', [[(-90, 90), (-20, 90), (-20, 180), (-90, 180)],
+                  [(-90, -180), (-20, -180), (-20, -150), (-90, -150)]]),
+        ('alphaL', [[(20, -60), (120, -60), (120, 90), (20, 90)]]),
+    ]
+    # the bin width of the lookup table, in degrees
+    resolution = 0.5
+
+    def __init__(self, polygons=None, defaults=True):
+        states = list(polygons or []) + (self.basins if defaults else [])
+        self.names = [name for name, p in states] + ['other']
+        if len(self.names) > 127:
+            raise ValueError('Too many conformational states')
+        self.polygons = [p for name, p in states]
+        self.bins = int(round(360 / self.resolution))
+        centers = -180 + (np.arange(self.bins) + 0.5) * (360 / self.bins)
+        phi, psi = np.meshgrid(centers, centers, indexing='ij')
+        # the first index is phi, the second one is psi
+        self.table = np.full((self.bins, self.bins), len(states), np.int8)
+        for state in reversed(range(len(states))):
+            for vertices in self.polygons[state]:
+                self.table[_inside(phi, psi, vertices)] = state
+
+    def __len__(self):
+        return len(self.names)
+
+    def classify(self, phi, psi):
+        """The states (int8) of angle pairs, arrays of any shape in degrees. Non-finite angles are 'other'."""
+        phi = np.asarray(phi)
+        psi = np.asarray(psi)
+        # computed in the precision of the angles (float32 for RamachandranData)
+        real = np.result_type(phi, psi, np.float32).type
+        scale = real(self.bins / 360)
+        with np.errstate(invalid='ignore'):
+            index = ((phi + real(180)) * scale).astype(np.intp)
+            index %= self.bins
+            index *= self.bins
+            j = ((psi + real(180)) * scale).astype(np.intp)
+            j %= self.bins
+            index += j
+        states = self.table.ravel().take(index)
+        invalid = ~(np.isfinite(phi) & np.isfinite(psi))
+        if invalid.any():
+            states = np.where(invalid, np.int8(len(self) - 1), states)
+        return states
+
+
+def occupancies(states, nstates):
+    """The fraction of frames in each state for the columns (residues) of a state time series of shape (nframes,
+    ncolumns). Returns an array of shape (ncolumns, nstates)."""
+    states = np.asarray(states)
+    nframes, ncolumns = states.shape
+    keys = np.arange(ncolumns, dtype=np.intp) * nstates + states
+    counts = np.bincount(keys.ravel(), minlength=ncolumns * nstates).reshape(ncolumns, nstates)
+    return counts / max(nframes, 1)
+
+
+def transition_matrices(states, nstates, lag=1):
+    """The numbers of transitions from state a to state b between frames `lag` apart for each column of a state time
+    series of shape (nframes, ncolumns). Returns an array of shape (ncolumns, nstates, nstates), staying in the same
+    state being on the diagonal."""
+    states = np.asarray(states)
+    ncolumns = states.shape[1]
+    keys = (np.arange(ncolumns, dtype=np.intp) * nstates + states[:-lag]) * nstates + states[lag:]
+    return np.bincount(keys.ravel(), minlength=ncolumns * nstates * nstates).reshape(ncolumns, nstates, nstates)
+
+
+def run_lengths(states):
+    """Run-length encoding of each column of a state time series of shape (nframes, ncolumns). Returns the columns,
+    the states, the first frames and the lengths of the runs, ordered by column and by time."""
+    states = np.ascontiguousarray(np.asarray(states).T)
+    ncolumns, nframes = states.shape
+    change = np.empty(states.shape, bool)
+    change[:, :1] = True
+    np.not_equal(states[:, 1:], states[:, :-1], out=change[:, 1:])
+    first = np.flatnonzero(change)
+    columns, starts = np.divmod(first, max(nframes, 1))
+    lengths = np.diff(np.append(first, states.size))
+    return columns, states.ravel()[first], starts, lengths
+
+
+def mean_lifetimes(states, nstates):
+    """The mean length of the runs in each state (in frames) for the columns of a state time series of shape (nframes,
+    ncolumns), NaN for states never visited. Returns an array of shape (ncolumns, nstates). The runs at the ends are
+    counted too, although they may be truncated."""
+    ncolumns = np.shape(states)[1]
+    columns, runstates, starts, lengths = run_lengths(states)
+    keys = columns * nstates + runstates
+    total = np.bincount(keys, weights=lengths, minlength=ncolumns * nstates)
+    runs = np.bincount(keys, minlength=ncolumns * nstates)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return (total / runs).reshape(ncolumns, nstates)
+
+
+def state_statistics(phi, psi, states):
+    """Classify the angles (arrays of shape (nframes, nresidues)) into ConformationalStates and compute the
+    occupancies, the mean lifetimes (in frames) and the transition counts between consecutive frames of the
+    residues"""
+    series = states.classify(phi, psi)
+    return (occupancies(series, len(states)), mean_lifetimes(series, len(states)),
+            transition_matrices(series, len(states)))
@@ -0,0 +1,180 @@
+"""A small atom selection language, compiled to functions which compute boolean masks over GROFile instances.
+
+Grammar (in the order of increasing precedence)::
+
+    expression := term ('or' term)*
+    term       := factor ('and' factor)*
+    factor     := 'not' factor
+                | 'same residue as' factor
+                | 'within' <distance> 'of' factor
+                | '(' expression ')'
+                | 'all' | 'none'
+                | ('resname' | 'name') <pattern>+
+                | ('resid' | 'index') <number or range>+
+                | <coordinate> <comparison operator> <number>
+
+Name patterns can contain shell-style wildcards (e.g. `name H*`). Ranges are given as `first:last` or `first to last`,
+both ends inclusive. Coordinates are `x`, `y`, `z`, `vx`, `vy` and `vz`, in the units of the .gro file. Atom indices
+count from 0 in the order of the atoms in the structure.
+
+Examples::
+
+    resname POPC and name P8 and z > 3.0
+    same residue as (resname SOL and within 0.3 of resname POPC)
+"""
+import functools
+import operator
+import re
+
+import numpy as np
+
+_TOKEN = re.compile(r'\s*(?:(?P<paren>[()])|(?P<op><=|>=|==|!=|<|>)|(?P<word>[^\s()<>=!]+))')
+
+_KEYWORDS = {'and', 'or', 'not', 'same', 'residue', 'as', 'within', 'of', 'all', 'none', 'resname', 'name', 'resid',
+             'index', 'to', 'x', 'y', 'z', 'vx', 'vy', 'vz'}
+
+_OPERATORS = {'<': operator.lt, '<=': operator.le, '>': operator.gt, '>=': operator.ge, '==': operator.eq,
+              '!=': operator.ne}
+
+
+def _tokenize(expression):
+    tokens = []
+    pos = 0
+    expression = expression.strip()
+    while pos < len(expression):
+        m = _TOKEN.match(expression, pos)
+        if m is None or not m.group(0).strip():
+            raise ValueError('Invalid selection at position {:d}: {}'.format(pos, expression))
+        tokens.append(m.group(m.lastgroup))
+        pos = m.end()
+    return tokens
+
+
+class _Parser(object):
+    def __init__(self, expression):
+        self.expression = expression
+        self.tokens = _tokenize(expression)
+        self.pos = 0
+
+    def peek(self):
+        return self.tokens[self.pos] if self.pos < len(self.tokens) else None
+
+    def next(self):
+        token = self.peek()
+        if token is None:
+            raise ValueError('Unexpected end of selection: {}'.format(self.expression))
+        self.pos += 1
+        return token
+
+    def expect(self, token):
+        found = self.next()
+        if found != token:
+            raise ValueError('Expected "{}" instead of "{}" in selection: {}'.format(token, found, self.expression))
+
+    def number(self):
+        token = self.next()
+        try:
+            return float(token)
+        except ValueError:
+            raise ValueError('Expected a number instead of "{}" in selection: {}'.format(token, self.expression))
+
+    def values(self):
+        """Consume the values following a keyword"""
+        values = []
+        while self.peek() is not None and self.peek() not in _KEYWORDS | {'(', ')'}:
+            values.append(self.next())
+            if self.peek() == 'to':
+                self.next()
+                values[-1] = values[-1] + ':' + self.next()
+        if not values:
+            raise ValueError('Missing values in selection: {}'.format(self.expression))
+        return values
+
+    def parse(self):
+        node = self.expression_()
+        if self.peek() is not None:
+            raise ValueError('Unexpected "{}" in selection: {}'.format(self.peek(), self.expression))
+        return node
+
+    def expression_(self):
+        node = self.term()
+        while self.peek() == 'or':
+            self.next()
+            node = _binary(np.logical_or, node, self.term())
+        return node
+
+    def term(self):
+        node = self.factor()
+        while self.peek() == 'and':
+            self.next()
+            node = _binary(np.logical_and, node, self.factor())
+        return node
+
+    def factor(self):
+        token = self.next()
+        if token == 'not':
+            operand = self.factor()
+            return lambda gro: ~operand(gro)
+        elif token == 'same':
+            self.expect('residue')
+            self.expect('as')
+            operand = self.factor()
+            return lambda gro: gro.extend_boolflags_to_residues(operand(gro))
+        elif token == 'within':
+            distance = self.number()
+            self.expect('of')
+            operand = self.factor()
+            return lambda gro: gro.within(distance, operand(gro))
+        elif token == '(':
+            node = self.expression_()
+            self.expect(')')
+            return node
+        elif token == 'all':
+            return lambda gro: np.ones(len(gro), bool)
+        elif token == 'none':
+            return lambda gro: np.zeros(len(gro), bool)
+        elif token in ['resname', 'name']:
+            field = {'resname': 'resn', 'name': 'name'}[token]
+            patterns = tuple(self.values())
+            return lambda gro: gro.match_names(field, patterns)
+        elif token in ['resid', 'index']:
+            ranges = [self._range(v) for v in self.values()]
+            if token == 'resid':
+                return lambda gro: _in_ranges(gro.grodata['resi'], ranges)
+            else:
+                return lambda gro: _in_ranges(np.arange(len(gro)), ranges)
+        elif token in ['x', 'y', 'z', 'vx', 'vy', 'vz']:
+            op = self.next()
+            if op not in _OPERATORS:
+                raise ValueError('Expected a comparison operator instead of "{}" in selection: {}'.format(
+                    op, self.expression))
+            value = self.number()
+            return lambda gro: _OPERATORS[op](gro.grodata[token], value)
+        raise ValueError('Unexpected "{}" in selection: {}'.format(token, self.expression))
+
+    def _range(self, value):
+        try:
+            if ':' in value:
+                first, last = value.split(':')
+                return int(first), int(last)
+            return int(value), int(value)
+        except ValueError:
+            raise ValueError('Invalid number or range "{}" in selection: {}'.format(value, self.expression))
+
+
+def _binary(op, left, right):
+    return lambda gro: op(left(gro), right(gro))
+
+
+def _in_ranges(values, ranges):
+    mask = np.zeros(len(values), bool)
+    for first, last in ranges:
+        mask |= (values >= first) & (values <= last)
+    return mask
+
+
+@functools.lru_cache(maxsize=256)
+def compile_selection(expression):
+    """Compile a selection expression to a function, which takes a GROFile instance and returns a boolean mask
+    over its atoms. Compiled expressions are cached."""
+    return _Parser(expression).parse()
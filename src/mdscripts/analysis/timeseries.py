@@ -0,0 +1,231 @@
+"""Statistics of time series (e.g. energy terms) over time windows."""
+import collections
+
+import numpy as np
+
+from .correlation import blocking_sem, detect_equilibration, statistical_inefficiency
+
+
+def reserve(array, length):
+    """`array` itself if it has at least `length` rows, otherwise a copy with room for at least `length` rows. The
+    capacity grows geometrically, so appending rows one by one takes amortized constant time per row."""
+    if len(array) >= length:
+        return array
+    grown = np.empty((max(length, len(array) * 3 // 2),) + array.shape[1:], array.dtype)
+    grown[:len(array)] = array
+    return grown
+
+
+class WindowStatistics(object):
+    """Mean, standard deviation, linear trend, extrema and median of the columns of a time series in any time window.
+
+    The data are divided into blocks of `blocksize` rows. Cumulative sums of y, y^2 and t*y (and of t and t^2) are
+    kept at the block boundaries, and the block minima and maxima in a sparse table. A window query combines these
+    for the whole blocks covered by the window with the rows of the at most two partial blocks at its ends, so its
+    cost does not depend on the length of the window. Keeping the sums only at the block boundaries needs much less
+    memory than full prefix sums. The values are shifted by their mean before summing, which keeps the variance
+    accurate.
+
+    Windows are given as row index ranges [start, stop), see `window()` for converting times.
+
+    The standard error of the mean needs all values in the window (see the correlation module); the statistical
+    inefficiency of the last window is kept.
+    """
+    blocksize = 512
+    # the number of blocks processed at once when building the tables
+    chunkblocks = 1024
+    # the number of medians kept in the cache
+    mediancachesize = 1024
+
+    def __init__(self, times, values):
+        times = np.asarray(times, np.float64)
+        values = np.asarray(values, np.float64)
+        if values.ndim == 1:
+            values = values[:, np.newaxis]
+        if len(times) > 1 and (np.diff(times) < 0).any():
+            order = np.argsort(times, kind='stable')
+            times, values = times[order], values[order]
+        ncolumns = values.shape[1]
+        self.times = self._timebuffer = times
+        self.values = self._valuebuffer = values
+        # the tables can have more rows than the number of blocks + 1: room for appending
+        self._nblocks = 0
+        self._st = np.zeros(1)
+        self._stt = np.zeros(1)
+        self._sy = np.zeros((1, ncolumns))
+        self._syy = np.zeros((1, ncolumns))
+        self._sty = np.zeros((1, ncolumns))
+        self._minima = [np.empty((0, ncolumns))]
+        self._maxima = [np.empty((0, ncolumns))]
+        self.t0 = times.mean() if len(times) else 0.0
+        self.y0 = values.mean(axis=0) if len(values) else np.zeros(ncolumns)
+        self._update_tables()
+        self._medians = collections.OrderedDict()
+        self._inefficiency = None, None
+
+    def append(self, times, values):
+        """Append new rows (e.g. the frames written by a running simulation since the last read), which must not
+        precede the existing ones. Only the tables of the new blocks are computed, and the arrays grow geometrically,
+        so the cost depends only on the number of new rows. Results for windows before the new rows are unchanged."""
+        times = np.asarray(times, np.float64)
+        values = np.asarray(values, np.float64).reshape(len(times), self.values.shape[1])
+        if not len(times):
+            return
+        if (np.diff(times) < 0).any() or (len(self.times) and times[0] < self.times[-1]):
+            raise ValueError('Appended times must be sorted and not precede the existing ones')
+        n = len(self.times)
+        self._timebuffer = reserve(self._timebuffer, n + len(times))
+        self._valuebuffer = reserve(self._valuebuffer, n + len(times))
+        self._timebuffer[n:n + len(times)] = times
+        self._valuebuffer[n:n + len(times)] = values
+        self.times = self._timebuffer[:n + len(times)]
+        self.values = self._valuebuffer[:n + len(times)]
+        if not n:
+            # shift by the mean of the first data
+            self.t0, self.y0 = times.mean(), values.mean(axis=0)
+        self._update_tables()
+
+    def _update_tables(self):
+        """Compute the sums and the extrema of the blocks completed since the last call"""
+        times, values = self.times, self.values
+        oldblocks = self._nblocks
+        nblocks = len(times) // self.blocksize
+        if nblocks == oldblocks:
+            return
+        ncolumns = values.shape[1]
+        for name in ['_st', '_stt', '_sy', '_syy', '_sty']:
+            setattr(self, name, reserve(getattr(self, name), nblocks + 1))
+        self._minima[0] = reserve(self._minima[0], nblocks)
+        self._maxima[0] = reserve(self._maxima[0], nblocks)
+        minima, maxima = self._minima[0], self._maxima[0]
+        tables = [self._st, self._stt, self._sy, self._syy, self._sty]
+        for first in range(oldblocks, nblocks, self.chunkblocks):
+            last = min(first + self.chunkblocks, nblocks)
+            rows = slice(first * self.blocksize, last * self.blocksize)
+            t = (times[rows] - self.t0).reshape(last - first, self.blocksize)
+            y = values[rows].reshape(last - first, self.blocksize, ncolumns)
+            minima[first:last] = y.min(axis=1)
+            maxima[first:last] = y.max(axis=1)
+            y = y - self.y0
+            self._st[first + 1:last + 1] = t.sum(axis=1)
+            self._stt[first + 1:last + 1] = (t * t).sum(axis=1)
+            self._sy[first + 1:last + 1] = y.sum(axis=1)
+            self._syy[first + 1:last + 1] = np.einsum('ijk,ijk->ik', y, y)
+            self._sty[first + 1:last + 1] = np.einsum('ij,ijk->ik', t, y)
+        for table in tables:
+            np.cumsum(table[oldblocks:nblocks + 1], axis=0, out=table[oldblocks:nblocks + 1])
+        # level k of the sparse tables: extrema of 2**k consecutive blocks, valid for the first
+        # nblocks - 2**k + 1 entries
+        for k in range(1, nblocks.bit_length()):
+            half = 2 ** (k - 1)
+            first, last = max(oldblocks - 2 ** k + 1, 0), nblocks - 2 ** k + 1
+            if k == len(self._minima):
+                self._minima.append(np.empty((0, ncolumns)))
+                self._maxima.append(np.empty((0, ncolumns)))
+            self._minima[k] = reserve(self._minima[k], last)
+            self._maxima[k] = reserve(self._maxima[k], last)
+            np.minimum(self._minima[k - 1][first:last], self._minima[k - 1][first + half:last + half],
+                       out=self._minima[k][first:last])
+            np.maximum(self._maxima[k - 1][first:last], self._maxima[k - 1][first + half:last + half],
+                       out=self._maxima[k][first:last])
+        self._nblocks = nblocks
+
+    def __len__(self):
+        return len(self.times)
+
+    def window(self, tmin=None, tmax=None):
+        """The row index range [start, stop) of the times between tmin and tmax (inclusive)"""
+        start = 0 if tmin is None else int(np.searchsorted(self.times, tmin, side='left'))
+        stop = len(self.times) if tmax is None else int(np.searchsorted(self.times, tmax, side='right'))
+        return start, max(start, stop)
+
+    def _blocks(self, start, stop):
+        """The whole blocks in [start, stop) and the row ranges of the partial blocks at the ends"""
+        start, stop = int(start), int(stop)
+        firstblock = -(-start // self.blocksize)
+        lastblock = stop // self.blocksize
+        if firstblock >= lastblock:
+            return 0, 0, [(start, stop)]
+        return firstblock, lastblock, [(start, firstblock * self.blocksize), (lastblock * self.blocksize, stop)]
+
+    def sums(self, start, stop):
+        """The number of rows and the sums of t, t^2, y, y^2 and t*y in [start, stop), with t and y shifted by
+        `t0` and `y0`"""
+        firstblock, lastblock, edges = self._blocks(start, stop)
+        sums = [table[lastblock] - table[firstblock] for table in [self._st, self._stt, self._sy, self._syy,
+                                                                    self._sty]]
+        for first, last in edges:
+            if last > first:
+                t = self.times[first:last] - self.t0
+                y = self.values[first:last] - self.y0
+                for i, s in enumerate([t.sum(), (t * t).sum(), y.sum(axis=0), (y * y).sum(axis=0), t @ y]):
+                    sums[i] = sums[i] + s
+        return (int(stop) - int(start),) + tuple(sums)
+
+    def mean(self, start, stop):
+        n, st, stt, sy, syy, sty = self.sums(start, stop)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return self.y0 + sy / n
+
+    def std(self, start, stop):
+        n, st, stt, sy, syy, sty = self.sums(start, stop)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return np.sqrt(np.maximum(syy / n - (sy / n) ** 2, 0))
+
+    def trend(self, start, stop):
+        """The slope of the least squares line fit"""
+        n, st, stt, sy, syy, sty = self.sums(start, stop)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return (n * sty - st * sy) / (n * stt - st * st) if n > 1 else np.full(len(sy), np.nan)
+
+    def _extremum(self, start, stop, tables, reduce):
+        firstblock, lastblock, edges = self._blocks(start, stop)
+        parts = [reduce(self.values[first:last], axis=0) for first, last in edges if last > first]
+        if lastblock > firstblock:
+            level = (lastblock - firstblock).bit_length() - 1
+            parts.append(reduce([tables[level][firstblock], tables[level][lastblock - 2 ** level]], axis=0))
+        if not parts:
+            return np.full(self.values.shape[1], np.nan)
+        return reduce(parts, axis=0)
+
+    def min(self, start, stop):
+        return self._extremum(start, stop, self._minima, np.min)
+
+    def max(self, start, stop):
+        return self._extremum(start, stop, self._maxima, np.max)
+
+    def ptp(self, start, stop):
+        return self.max(start, stop) - self.min(start, stop)
+
+    def median(self, start, stop, column):
+        """The median of a column. This needs all values in the window, but the results are cached."""
+        key = (start, stop, column)
+        try:
+            self._medians.move_to_end(key)
+            return self._medians[key]
+        except KeyError:
+            pass
+        median = np.median(self.values[start:stop, column]) if stop > start else np.nan
+        self._medians[key] = median
+        if len(self._medians) > self.mediancachesize:
+            self._medians.popitem(last=False)
+        return median
+
+    def inefficiency(self, start, stop):
+        """The statistical inefficiency: the number of rows per independent sample"""
+        if self._inefficiency[0] != (start, stop):
+            self._inefficiency = (start, stop), statistical_inefficiency(self.values[start:stop])
+        return self._inefficiency[1]
+
+    def sem(self, start, stop):
+        """The standard error of the mean from the statistical inefficiency"""
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return self.std(start, stop) * np.sqrt(self.inefficiency(start, stop) / (stop - start))
+
+    def blocksem(self, start, stop):
+        """The standard error of the mean by block averaging"""
+        return blocking_sem(self.values[start:stop])
+
+    def equilibration(self, start, stop):
+        """The first rows of the equilibrated parts of the columns in [start, stop), see detect_equilibration()"""
+        return start + detect_equilibration(self.values[start:stop])[0]
@@ -1,400 +1,437 @@
 #!/usr/bin/env python
-
+"""Extract the energy terms from GROMACS .edr files, compute their statistics and write them to files.
+
+This module does not depend on the GUI (PyQt5, matplotlib) or on scipy, so that it can be used in batch jobs. The
+graphical interface (the -w option) is in the extract_energy_gui module, which is imported only when needed.
+"""
+import collections
+import concurrent.futures
+import csv
+import glob
+import json
 import os
 import re
-import subprocess
 import sys
-import tempfile
+import time
 
 import numpy as np
-import scipy.signal
-from PyQt5 import QtCore, QtWidgets
-from matplotlib.backends.backend_qt5agg import FigureCanvasQTAgg, NavigationToolbar2QT
-from matplotlib.figure import Figure
-
-from .extract_energy_ui import Ui_gmx_extract_energy
-
-
-class CurvesModel(QtCore.QAbstractItemModel):
-    # columns: name, show in left axis, show in right axis,
-    def __init__(self, labels):
-        super().__init__()
-        self._rows = [{'name': l, 'showonleft': True, 'showonright': False, 'factor': 1.0} for l in labels]
 
-    def columnCount(self, parent=None):
-        return 4
-
-    def data(self, index: QtCore.QModelIndex, role=None):
-        row = self._rows[index.row()]
-        if index.column() == 0:
-            if role == QtCore.Qt.DisplayRole:
-                return row['name']
-            else:
-                return None
-        elif index.column() == 1:
-            if role == QtCore.Qt.CheckStateRole:
-                return [QtCore.Qt.Unchecked, QtCore.Qt.Checked][row['showonleft']]
-        elif index.column() == 2:
-            if role == QtCore.Qt.CheckStateRole:
-                return [QtCore.Qt.Unchecked, QtCore.Qt.Checked][row['showonright']]
-        elif index.column() == 3:
-            if role == QtCore.Qt.DisplayRole:
-                return '{:g}'.format(row['factor'])
-        else:
-            return None
+from .analysis.correlation import detect_equilibration
+from .analysis.timeseries import WindowStatistics, reserve
+from .io.edr import EDRFile, read_parts
+from .io.sidecar import load_sidecar, save_sidecar, sidecar_filename
+from .io.table import print_table
+from .io.xvg import XVGFile
+
+
+def __getattr__(name):
+    # the GUI classes used to be defined here
+    if name in ['CurvesModel', 'StatisticsModel', 'MainWindow']:
+        from . import extract_energy_gui
+        return getattr(extract_energy_gui, name)
+    raise AttributeError('module {!r} has no attribute {!r}'.format(__name__, name))
+
+
+def extract_energy(edrfile, structurefile=None, outputfile=None, terms=None, tmin=None, tmax=None):
+    """Read the energy terms from an .edr file, optionally only the selected ones in a time window. If `outputfile`
+    is given, the data are also written to it (see write_energies()).
+
+    `edrfile` can also be a list of the parts of a continued simulation, which are then stitched together. The first
+    column of the returned data is the time. `structurefile` is not needed any more, it is accepted for
+    compatibility."""
+    if isinstance(edrfile, str):
+        edrfile = [edrfile]
+    times, values, names = read_parts(edrfile, terms, tmin, tmax)
+    data = np.column_stack([times, values])
+    labels = ['Time (ps)'] + names
+    if outputfile is not None:
+        write_energies(outputfile, data, labels, energy_units(edrfile[0], names))
+    return data, labels
 
-    def flags(self, index: QtCore.QModelIndex):
-        row = self._rows[index.row()]
-        if index.column() == 0:
-            return QtCore.Qt.ItemIsEnabled | QtCore.Qt.ItemNeverHasChildren | QtCore.Qt.ItemIsSelectable
-        if index.column() == 1 or index.column() == 2:
-            return QtCore.Qt.ItemIsEnabled | QtCore.Qt.ItemNeverHasChildren | QtCore.Qt.ItemIsUserCheckable | QtCore.Qt.ItemIsSelectable
-        if index.column() == 3:
-            return QtCore.Qt.ItemIsEditable | QtCore.Qt.ItemIsEnabled | QtCore.Qt.ItemNeverHasChildren | QtCore.Qt.ItemIsSelectable
-        else:
-            return QtCore.Qt.NoItemFlags
 
+def energy_units(edrfile, terms):
+    """The units of energy terms in an .edr file"""
+    edr = EDRFile(edrfile)
+    return [edr.units[i] for i in edr.term_indices(terms)]
 
-    def index(self, row, col, parent=None):
-        return self.createIndex(row, col, None)
 
-    def rowCount(self, parent=None):
-        return len(self._rows)
+class EnergyFollower(object):
+    """The energy terms in an .edr or .xvg file which is still being written (e.g. by a running simulation).
 
-    def parent(self, index: QtCore.QModelIndex = None):
-        return QtCore.QModelIndex()
+    `data` has the time in the first column and the terms in the others, like the data returned by extract_energy().
+    update() reads only the frames appended to the file since the last call: the cost of an update depends on the
+    number of new frames, not on the size of the file.
 
-    def setData(self, index: QtCore.QModelIndex, newvalue, role=None):
-        row = self._rows[index.row()]
-        if index.column() == 1:
-            row['showonleft'] = newvalue == QtCore.Qt.Checked
-            self.dataChanged.emit(self.index(index.row(), 1), self.index(index.row(), 1))
-            return True
-        elif index.column() == 2:
-            row['showonright'] = newvalue == QtCore.Qt.Checked
-            self.dataChanged.emit(self.index(index.row(), 2), self.index(index.row(), 2))
-            return True
-        return False
+    If `tmin` is given, the frames before it are skipped when the file is first read. In .xvg files they are skipped
+    without parsing, through the row index of the file (see FrameIndex).
+    """
 
-    def headerData(self, column, orientation, role=None):
-        if orientation != QtCore.Qt.Horizontal:
-            return None
-        if role == QtCore.Qt.DisplayRole:
-            return ['Name', 'Left', 'Right', 'Scaling factor'][column]
-
-    def showOnLeft(self, row):
-        return self._rows[row]['showonleft']
-
-    def showOnRight(self, row):
-        return self._rows[row]['showonright']
-
-    def factor(self, row):
-        return self._rows[row]['factor']
-
-    def hideAll(self):
-        for r in self._rows:
-            r['showonleft'] = r['showonright'] = False
-        self.dataChanged.emit(self.index(0, 1), self.index(self.rowCount(), 2))
-
-
-class StatisticsModel(QtCore.QAbstractItemModel):
-    # columns: name, mean, median, trend, std, std (pcnt), ptp, ptp (pcnt),
-    def __init__(self, data, labels, tmin=None, tmax=None):
-        super().__init__()
-        self.data = data
-        self.labels = labels
-        if tmin is None:
-            tmin = data[:, 0].min()
-        if tmax is None:
-            tmax = data[:, 0].max()
-        self.tmin = tmin
-        self.tmax = tmax
-
-    def columnCount(self, parent=None):
-        return 8
-
-    def data(self, index: QtCore.QModelIndex, role=None):
-        datacolumn = index.row() + 1
-        dataidx = np.logical_and(self.data[:, 0] >= self.tmin, self.data[:, 0] <= self.tmax)
-        data = self.data[dataidx, datacolumn]
-        if role != QtCore.Qt.DisplayRole:
-            return None
-        if index.column() == 0:
-            return self.labels[datacolumn]
-        elif index.column() == 1:
-            return str(np.mean(data))
-        elif index.column() == 2:
-            return str(np.median(data))
-        elif index.column() == 3:
-            coeffs = np.polyfit(self.data[dataidx, 0], data, 1)
-            return str(coeffs[0])
-        elif index.column() == 4:
-            return str(np.std(data))
-        elif index.column() == 5:
-            return str(np.std(data) / np.mean(data) * 100)
-        elif index.column() == 6:
-            return str(np.ptp(data))
-        elif index.column() == 7:
-            return str(np.ptp(data) / np.mean(data) * 100)
+    def __init__(self, filename, terms=None, tmin=None):
+        self.filename = filename
+        self.terms = terms
+        if filename.lower().endswith('.xvg'):
+            self._edr = None
+            self._xvg = XVGFile.load(filename, lastline=False, tmin=tmin)
+            self.labels = self._xvg.labels
+            self.data = self._xvg.data
         else:
-            return None
-
-    def flags(self, index: QtCore.QModelIndex):
-        return QtCore.Qt.ItemIsEnabled | QtCore.Qt.ItemNeverHasChildren | QtCore.Qt.ItemIsSelectable
-
-    def index(self, row, col, parent=None):
-        return self.createIndex(row, col, None)
-
-    def rowCount(self, parent=None):
-        return self.data.shape[1] - 1
-
-    def parent(self, index: QtCore.QModelIndex = None):
-        return QtCore.QModelIndex()
-
-    def headerData(self, column, orientation, role=None):
-        if orientation != QtCore.Qt.Horizontal:
-            return None
-        if role == QtCore.Qt.DisplayRole:
-            return ['Name', 'Mean', 'Median', 'Trend', 'STD', 'STD %', 'P2P', 'P2P %'][column]
-
-    def setTmin(self, value):
-        self.tmin = value
-        self.dataChanged.emit(self.index(0, 1), self.index(self.rowCount(), self.columnCount()),
-                              [QtCore.Qt.DisplayRole])
-
-    def setTmax(self, value):
-        self.tmax = value
-        self.dataChanged.emit(self.index(0, 1), self.index(self.rowCount(), self.columnCount()),
-                              [QtCore.Qt.DisplayRole])
-
-
-class MainWindow(QtWidgets.QWidget, Ui_gmx_extract_energy):
-    windowfunctions = {'barthann': 'Bartlett-Hann',
-                       'bartlett': 'Bartlett',
-                       'blackman': 'Blackman',
-                       'blackmanharris': 'Blackman-Harris',
-                       'bohman': 'Bohman',
-                       'boxcar': 'Rectangular',
-                       'cosine': 'Cosine',
-                       'flattop': 'Flat top',
-                       'hamming': 'Hamming',
-                       'hann': 'Hann',
-                       'nuttall': 'Nuttall',
-                       'parzen': 'Parzen',
-                       'triang': 'Triangular',
-                       'tukey': 'Tukey (tapered cosine)',
-                       }
-
-    def __init__(self):
-        QtWidgets.QWidget.__init__(self)
-        self.cursor = None
-        self.setupUi(self)
-
-    def setupUi(self, Form):
-        Ui_gmx_extract_energy.setupUi(self, Form)
-        Form.fsmodel = QtWidgets.QFileSystemModel()
-        Form.treeViewOpenFile.setModel(Form.fsmodel)
-        Form.fsmodel.setNameFilters(['*.edr'])
-        Form.fsmodel.setRootPath('/')
-        Form.treeViewOpenFile.hideColumn(1)
-        Form.treeViewOpenFile.hideColumn(2)
-        Form.treeViewOpenFile.hideColumn(3)
-        Form.fsmodel.sort(0, QtCore.Qt.AscendingOrder)
-        Form.treeViewOpenFile.expand(Form.fsmodel.index(os.getcwd()))
-        Form.treeViewOpenFile.setCurrentIndex(Form.fsmodel.index(os.getcwd()))
-        Form.treeViewOpenFile.scrollTo(Form.fsmodel.index(os.getcwd()), QtWidgets.QAbstractItemView.PositionAtTop)
-        Form.treeViewOpenFile.activated.connect(Form.onFileSelected)
-        Form.figure = Figure()
-        Form.figureCanvas = FigureCanvasQTAgg(Form.figure)
-        Form.verticalLayoutFigure.addWidget(Form.figureCanvas)
-        Form.navigationToolBar = NavigationToolbar2QT(Form.figureCanvas, Form)
-        Form.verticalLayoutFigure.addWidget(Form.navigationToolBar)
-        Form.hideAllPushButton.clicked.connect(Form.hideAll)
-        Form.toolButtonGoFirst.clicked.connect(
-            lambda: Form.horizontalSliderCursor.triggerAction(Form.horizontalSliderCursor.SliderToMinimum))
-        Form.toolButtonGoLast.clicked.connect(
-            lambda: Form.horizontalSliderCursor.triggerAction(Form.horizontalSliderCursor.SliderToMaximum))
-        Form.toolButtonGoNext.clicked.connect(
-            lambda: Form.horizontalSliderCursor.triggerAction(Form.horizontalSliderCursor.SliderSingleStepAdd))
-        Form.toolButtonGoPrevious.clicked.connect(
-            lambda: Form.horizontalSliderCursor.triggerAction(Form.horizontalSliderCursor.SliderSingleStepSub))
-        Form.tminSlider.valueChanged.connect(Form.onTminSliderValueChanged)
-        Form.tmaxSlider.valueChanged.connect(Form.onTmaxSliderValueChanged)
-        Form.smoothingSlider.valueChanged.connect(Form.onSmoothingChanged)
-        index = 0
-        for i, w in enumerate(sorted(self.windowfunctions)):
-            Form.smoothingFunctionComboBox.addItem(self.windowfunctions[w])
-            if w == 'boxcar':
-                index = i
-        Form.smoothingFunctionComboBox.setCurrentIndex(index)
-        Form.smoothingFunctionComboBox.currentIndexChanged.connect(lambda *args: self.replot())
-
-    def onSmoothingChanged(self, smoothing):
-        self.replot()
-
-    def onFileSelected(self, index):
-        assert isinstance(self.fsmodel, QtWidgets.QFileSystemModel)
-        filename = self.fsmodel.filePath(index)
-        self.openFile(filename)
-
-    def openFile(self, filename):
-        self.setCurveData(*extract_energy(filename))
-
-    def hideAll(self):
+            self._xvg = None
+            self._edr = EDRFile(filename)
+            times, values, names = self._edr.read_appended(terms)
+            if tmin is not None:
+                times, values = times[times >= tmin], values[times >= tmin]
+            self.labels = ['Time (ps)'] + names
+            self.data = self._buffer = np.column_stack([times, values])
+
+    def update(self):
+        """Read the new frames. They are appended to `data` (which is then a new array, sharing the memory with the
+        previous one where possible) and also returned."""
+        if self._xvg is not None:
+            nrows = self._xvg.read_appended()
+            self.labels = self._xvg.labels
+            self.data = self._xvg.data
+            return self.data[len(self.data) - nrows:]
+        times, values, names = self._edr.read_appended(self.terms)
+        n = len(self.data)
+        self._buffer = reserve(self._buffer, n + len(times))
+        self._buffer[n:n + len(times), 0] = times
+        self._buffer[n:n + len(times), 1:] = values
+        self.data = self._buffer[:n + len(times)]
+        return self.data[n:]
+
+
+class DatasetCache(object):
+    """Energy datasets (the data and the labels, as returned by extract_energy() or read_xvg()) loaded from .edr or
+    .xvg files. At most `maxbytes` bytes of data are kept in memory, the least recently used datasets are dropped
+    first.
+
+    A dataset is identified by the absolute path, the size and the modification time of the file, so a changed file
+    is loaded again. If `persistent` is True, the datasets are also saved column-wise in sidecar files next to the
+    energy files, which are used when a dataset is not in memory. The returned arrays are shared: they must not be
+    modified.
+
+    Results derived from a dataset (e.g. its statistics) can be kept with it in the dict returned by state().
+
+    The frames before `tmin` can be skipped when loading a dataset, see load(). Such partial datasets are not saved
+    in the sidecar files.
+    """
+    version = 1
+
+    def __init__(self, maxbytes=512 << 20, persistent=False):
+        self.maxbytes = maxbytes
+        self.persistent = persistent
+        self.nbytes = 0
+        self._datasets = collections.OrderedDict()
+
+    @staticmethod
+    def sidecar_filename(filename):
+        return sidecar_filename(filename, '.energies.npz')
+
+    def load(self, filename, tmin=None):
+        """Load a dataset: the data and the labels. If `tmin` is given, the frames before it are skipped (in .xvg
+        files without parsing them, see read_xvg())."""
+        stat = os.stat(filename)
+        key = (os.path.abspath(filename), stat.st_size, stat.st_mtime_ns, tmin)
         try:
-            self.curveModel.hideAll()
-        except AttributeError:
+            self._datasets.move_to_end(key)
+            return self._datasets[key][:2]
+        except KeyError:
             pass
-
-    def setCurveData(self, data, labels):
-        self.data = data
-        self.labels = labels
-        this_is_the_first_model = not hasattr(self, 'curveModel')
-        self.curveModel = CurvesModel(self.labels[1:])
-        self.treeViewCurves.setModel(self.curveModel)
-        self.curveModel.dataChanged.connect(self.curveModelDataChanged)
-        self.statModel = StatisticsModel(self.data, self.labels)
-        self.statisticsTreeView.setModel(self.statModel)
-        if this_is_the_first_model:
-            for col in range(1, self.curveModel.columnCount()):
-                self.treeViewCurves.resizeColumnToContents(col)
-            for col in range(1, self.statModel.columnCount()):
-                self.statisticsTreeView.resizeColumnToContents(col)
-        self.setScalerLimits()
-        self.replot()
-
-    def setScalerLimits(self):
-        self.horizontalSliderCursor.setMinimum(0)
-        self.horizontalSliderCursor.setMaximum(self.data.shape[0] - 1)
-        self.tminSlider.setMinimum(0)
-        self.tminSlider.setMaximum(self.data.shape[0] - 1)
-        self.tmaxSlider.setMinimum(0)
-        self.tmaxSlider.setMaximum(self.data.shape[0] - 1)
-        self.tmaxSlider.setValue(self.data.shape[0] - 1)
-        self.tminSlider.setValue(0)
-        self.tminSpinBox.setMinimum(self.data[0, 0])
-        self.tminSpinBox.setMaximum(self.data[-1, 0])
-        self.tmaxSpinBox.setMinimum(self.data[0, 0])
-        self.tmaxSpinBox.setMaximum(self.data[-1, 0])
-        self.smoothingSlider.setMinimum(0)
-        self.smoothingSlider.setMaximum(int(np.floor(0.5 * (self.data.shape[0] - 1))))
-
-    def onTminSliderValueChanged(self, value):
-        if value > self.tmaxSlider.value():
-            self.tminSlider.setValue(self.tmaxSlider.value())
-        self.tminSpinBox.setValue(self.cursorposToTime(self.tminSlider.value()))
-        self.statModel.setTmin(self.cursorposToTime(self.tminSlider.value()))
-
-    def cursorposToTime(self, cursorpos):
-        return self.data[:, 0][cursorpos]
-
-    def timeToCursorpos(self, time):
-        return np.searchsorted(self.data[:, 0], time, side='right')
-
-    def onTmaxSliderValueChanged(self, value):
-        if value < self.tminSlider.value():
-            self.tmaxSlider.setValue(self.tminSlider.value())
-        self.tmaxSpinBox.setValue(self.cursorposToTime(self.tmaxSlider.value()))
-        self.statModel.setTmax(self.cursorposToTime(self.tmaxSlider.value()))
-
-    def curveModelDataChanged(self, idx1, idx2, roles):
-        self.replot()
-
-    def smoothingWindowName(self):
-        return [k for k in self.windowfunctions
-                if self.windowfunctions[k] == self.smoothingFunctionComboBox.currentText()][0]
-
-
-    def replot(self):
-        smoothing = 2 * self.smoothingSlider.value() + 1
-        if smoothing < 3:
-            smoothing = None
-        assert isinstance(self.figure, Figure)
-        self.figure.clear()
-        axesleft = self.figure.add_subplot(1, 1, 1)
-        axesleft.set_xlabel(self.labels[0])
-        axesright = axesleft.twinx()
-        lines = []
-        labels = []
-        for i in range(1, len(self.labels)):
-            if smoothing is not None:
-                window = scipy.signal.get_window(self.smoothingWindowName(), smoothing)
-                curve = scipy.signal.fftconvolve(self.data[:, i], window, 'valid') / window.sum()
-                # smoothing = 2*n+1. Cut n points from both the left and the right side of x.
-                n = (smoothing - 1) // 2
-                x = self.data[n:-n, 0]
+        persistent = self.persistent and tmin is None
+        dataset = self._load_sidecar(filename, stat) if persistent else None
+        if dataset is None:
+            if filename.lower().endswith('.xvg'):
+                dataset = read_xvg(filename, tmin)
             else:
-                curve = self.data[:, i]
-                x = self.data[:, 0]
-            if self.curveModel.showOnLeft(i - 1):
-                lines.append(axesleft.plot(x, curve, label=self.labels[i])[0])
-                labels.append(self.labels[i])
-            if self.curveModel.showOnRight(i - 1):
-                lines.append(axesright.plot(x, curve, label=self.labels[i])[0])
-                labels.append(self.labels[i])
-        self.figure.legend(lines, labels)
-        self.figureCanvas.draw()
-
-
-def extract_energy(edrfile, structurefile=None, outputfile=None):
-    handle = None
-    if outputfile is None:
-        handle, outputfile = tempfile.mkstemp('.xvg')
-        os.close(handle)
-    popenargs = ['gmx', 'energy', '-o', outputfile, '-f', edrfile]
-    if structurefile is not None:
-        popenargs.extend(['-s', structurefile])
-    gmx_energy = subprocess.Popen(popenargs, stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
-                                  universal_newlines=True)
-    try:
-        outs, errs = gmx_energy.communicate('\n'.join([str(x) for x in range(1, 100)]), timeout=200)
-    except subprocess.TimeoutExpired:
-        gmx_energy.kill()
-        outs, errs = gmx_energy.communicate()
-        raise RuntimeError('Timeout in "gmx energy"')
-    assert gmx_energy.returncode is not None
-    if gmx_energy.returncode:
-        print(errs)
-        raise RuntimeError('Nonzero exit code from "gmx energy": {}'.format(gmx_energy.returncode))
-    data, labels = read_xvg(outputfile)
-    if handle is not None:
-        os.unlink(outputfile)
-    return data, labels
-
+                dataset = extract_energy(filename, tmin=tmin)
+            if persistent:
+                self._save_sidecar(filename, stat, *dataset)
+        # older versions of the file are not needed any more
+        for oldkey in [k for k in self._datasets if k[0] == key[0]]:
+            self.nbytes -= self._datasets.pop(oldkey)[0].nbytes
+        self._datasets[key] = dataset + ({},)
+        self.nbytes += dataset[0].nbytes
+        while self.nbytes > self.maxbytes and len(self._datasets) > 1:
+            self.nbytes -= self._datasets.popitem(last=False)[1][0].nbytes
+        return dataset
+
+    def state(self, data):
+        """The dict of the results derived from a dataset (the data array returned by load()), which are dropped
+        together with the dataset. An empty dict, which is not kept, if the dataset is not in the cache."""
+        for dataset in self._datasets.values():
+            if dataset[0] is data:
+                return dataset[2]
+        return {}
+
+    def clear(self):
+        self._datasets.clear()
+        self.nbytes = 0
+
+    def __len__(self):
+        return len(self._datasets)
+
+    def _load_sidecar(self, filename, stat):
+        saved = load_sidecar(self.sidecar_filename(filename), version=self.version, size=stat.st_size,
+                             mtime_ns=stat.st_mtime_ns)
+        if saved is None:
+            return None
+        try:
+            values = saved['values']
+            data = np.empty((values.shape[1], values.shape[0] + 1))
+            data[:, 0] = saved['time']
+            data[:, 1:] = values.T
+            return data, [str(l) for l in saved['labels']]
+        except (KeyError, ValueError, IndexError):
+            return None
 
-def read_xvg(filename):
-    data = []
-    labels = ['Time (ps)']
-    with open(filename, 'rt', encoding='utf-8') as f:
-        while f:
-            l = f.readline()
-            if not l:
-                break
-            if l.startswith('#'):
-                continue
-            m = re.match('^@ s(\d+) legend "(?P<legend>.*)"$', l)
-            if m:
-                labels.append(m.group('legend'))
-                continue
-            if l.startswith('@'):
-                continue
-            data.append([float(x) for x in l.split()])
-    return np.array(data), labels
+    def _save_sidecar(self, filename, stat, data, labels):
+        # if it cannot be written (e.g. the directory is not writable), the dataset is still kept in memory
+        save_sidecar(self.sidecar_filename(filename), time=data[:, 0], values=np.ascontiguousarray(data[:, 1:].T),
+                     labels=labels, size=stat.st_size, mtime_ns=stat.st_mtime_ns, version=self.version)
+
+
+def write_energies(filename, data, labels, units):
+    """Write energies to an .xvg file, or, if the extension is .npz, column-wise to a NumPy archive: the time, the
+    values (one row for each term) and the names and units of the terms."""
+    if filename.lower().endswith('.npz'):
+        np.savez(filename, time=data[:, 0], values=np.ascontiguousarray(data[:, 1:].T), names=labels[1:],
+                 units=units)
+    else:
+        XVGFile(data, title='GROMACS Energies', xlabel=labels[0], ylabel=', '.join(['({})'.format(u) for u in units]),
+                legends=labels[1:]).write(filename)
+
+
+def group_replicas(filenames):
+    """Group .edr files by replica: the parts of a continued simulation (e.g. md.edr, md.part0002.edr) belong
+    together. Returns a dictionary of the replica names (the file names without the part number and the extension)
+    and the lists of the file names."""
+    replicas = {}
+    for filename in filenames:
+        replica = re.sub(r'(\.part\d+)?\.edr$', '', filename, flags=re.IGNORECASE)
+        replicas.setdefault(replica, []).append(filename)
+    return replicas
+
+
+# energy terms averaged in the summary table of the batch mode, if present
+summaryterms = ['Potential', 'Temperature', 'Pressure']
+
+
+def equilibration(data):
+    """Detect the equilibration of the energy terms (columns 1, 2, ... of `data`), see detect_equilibration().
+    Returns the equilibration times, the statistical inefficiencies and the numbers of uncorrelated samples after
+    them."""
+    starts, g, neff = detect_equilibration(data[:, 1:])
+    return data[starts, 0], g, neff
+
+
+def print_equilibration(labels, times, g, neff):
+    header = ['Term', 'Equilibrated (ps)', 'Stat. ineff.', 'Uncorr. samples']
+    rows = [[labels[i + 1], '{:g}'.format(times[i]), '{:g}'.format(g[i]), '{:.0f}'.format(neff[i])]
+            for i in range(len(labels) - 1)]
+    print_table(header, rows)
+
+
+def _extract_replica(replica, filenames, terms, tmin, tmax, outputfile, equilibrate=False, reportfile=None):
+    data, labels = extract_energy(filenames, terms=terms, tmin=tmin, tmax=tmax)
+    if equilibrate and len(data):
+        data = data[data[:, 0] >= equilibration(data)[0].max()]
+    if outputfile is not None:
+        write_energies(outputfile, data, labels, energy_units(filenames[0], labels[1:]))
+    if reportfile is not None:
+        write_report(reportfile, data, labels, energy_units(filenames[0], labels[1:]))
+    means = {}
+    for term in summaryterms:
+        if term in labels:
+            means[term] = data[:, labels.index(term)].mean() if len(data) else np.nan
+    return {'replica': replica, 'parts': len(filenames), 'frames': len(data),
+            'start': data[0, 0] if len(data) else np.nan, 'end': data[-1, 0] if len(data) else np.nan,
+            'means': means, 'output': outputfile}
+
+
+def batch_extract(replicas, outputtemplate, terms=None, tmin=None, tmax=None, jobs=None, equilibrate=False,
+                  reporttemplate=None):
+    """Extract the energies of several replicas in parallel processes.
+
+    :param replicas: dictionary of replica names and .edr file names, see group_replicas()
+    :param outputtemplate: output file name, where "{replica}" is replaced by the name of the replica (None: no output)
+    :param equilibrate: discard the frames before the equilibration of all terms, see equilibration()
+    :param reporttemplate: report file name like `outputtemplate` (None: no report), see write_report()
+    :return: the summary of each replica in a list of dicts
+    """
+    with concurrent.futures.ProcessPoolExecutor(max_workers=jobs) as executor:
+        futures = [executor.submit(_extract_replica, replica, replicas[replica], terms, tmin, tmax,
+                                   None if outputtemplate is None else outputtemplate.format(replica=replica),
+                                   equilibrate,
+                                   None if reporttemplate is None else reporttemplate.format(replica=replica))
+                   for replica in sorted(replicas)]
+        return [f.result() for f in futures]
+
+
+def print_summary(summaries):
+    terms = [t for t in summaryterms if any(t in s['means'] for s in summaries)]
+    header = ['Replica', 'Parts', 'Frames', 'Start (ps)', 'End (ps)'] + ['<{}>'.format(t) for t in terms]
+    rows = [[s['replica'], str(s['parts']), str(s['frames']), '{:g}'.format(s['start']), '{:g}'.format(s['end'])] +
+            ['{:g}'.format(s['means'][t]) if t in s['means'] else '-' for t in terms] for s in summaries]
+    print_table(header, rows)
+
+
+def print_statistics(data, labels):
+    """Print the mean, the standard deviation and the standard error of the mean of the energy terms"""
+    statistics = WindowStatistics(data[:, 0], data[:, 1:])
+    window = 0, len(statistics)
+    columns = [('Mean', statistics.mean(*window)), ('STD', statistics.std(*window)),
+               ('Stat. ineff.', statistics.inefficiency(*window)), ('SEM', statistics.sem(*window)),
+               ('Block SEM', statistics.blocksem(*window))]
+    header = ['Term'] + [name for name, values in columns]
+    rows = [[labels[i + 1]] + ['{:g}'.format(values[i]) for name, values in columns] for i in range(len(labels) - 1)]
+    print_table(header, rows)
+
+
+# the statistics in the reports
+reportstatistics = ['mean', 'median', 'trend', 'std', 'sem']
+
+
+def energy_report(data, labels, units=None):
+    """The statistics of the energy terms (see `reportstatistics`) in a list of dicts, one for each term"""
+    statistics = WindowStatistics(data[:, 0], data[:, 1:])
+    window = 0, len(statistics)
+    values = {name: getattr(statistics, name)(*window) for name in reportstatistics if name != 'median'}
+    if 'median' in reportstatistics:
+        values['median'] = [statistics.median(window[0], window[1], i) for i in range(len(labels) - 1)]
+    report = []
+    for i, term in enumerate(labels[1:]):
+        row = {'term': term, 'unit': units[i] if units is not None else None}
+        for name in reportstatistics:
+            value = float(values[name][i])
+            # NaN is not valid JSON
+            row[name] = value if np.isfinite(value) else None
+        report.append(row)
+    return report
+
+
+def write_report(filename, data, labels, units=None):
+    """Write the statistics of the energy terms to a JSON file or, if the extension is .csv, to a CSV file"""
+    report = energy_report(data, labels, units)
+    if filename.lower().endswith('.csv'):
+        with open(filename, 'wt', newline='', encoding='utf-8') as f:
+            writer = csv.DictWriter(f, ['term', 'unit'] + reportstatistics)
+            writer.writeheader()
+            writer.writerows(report)
+    else:
+        with open(filename, 'wt', encoding='utf-8') as f:
+            json.dump({'tmin': float(data[0, 0]) if len(data) else None,
+                       'tmax': float(data[-1, 0]) if len(data) else None,
+                       'frames': len(data), 'terms': report}, f, indent=2)
+
+
+def follow(filename, terms=None, interval=10.0):
+    """Print the mean, the standard deviation and the trend of the energy terms in a growing .edr or .xvg file every
+    `interval` seconds, until interrupted. Only the new frames are read and added to the statistics."""
+    follower = EnergyFollower(filename, terms)
+    statistics = WindowStatistics(follower.data[:, 0], follower.data[:, 1:])
+    try:
+        while True:
+            new = follower.update()
+            statistics.append(new[:, 0], new[:, 1:])
+            # all selected terms, or the ones in the summary of the batch mode if present
+            shown = [i for i, label in enumerate(follower.labels[1:]) if terms is not None or label in summaryterms]
+            if not shown:
+                shown = list(range(len(follower.labels) - 1))
+            if len(statistics):
+                window = 0, len(statistics)
+                mean, std, trend = statistics.mean(*window), statistics.std(*window), statistics.trend(*window)
+                print('{:g} ps, {:d} frames (+{:d}): '.format(statistics.times[-1], len(statistics), len(new)) +
+                      ', '.join(['{} {:g} +/- {:g} (trend {:g}/ps)'.format(
+                          follower.labels[i + 1], mean[i], std[i], trend[i]) for i in shown]), flush=True)
+            time.sleep(interval)
+    except KeyboardInterrupt:
+        pass
+
+
+def read_xvg(filename, tmin=None, tmax=None):
+    """Read an .xvg file. Returns the data and the labels, like extract_energy().
+
+    If `tmin` or `tmax` is given, only the rows in this time window are read: they are located through the row index
+    of the file (see FrameIndex), the rows before them are not parsed."""
+    xvg = XVGFile.load(filename, tmin=tmin, tmax=tmax)
+    return xvg.data, xvg.labels
 
 
 def run():
     import argparse
     parser = argparse.ArgumentParser(description="Extract all curves from a gromacs .edr file")
-    parser.add_argument('-f', action='store', type=str, help='.edr file', default='energy.edr')
-    parser.add_argument('-o', action='store', type=str, help='output file', default='energy.xvg')
+    parser.add_argument('-f', action='store', type=str, nargs='+',
+                        help='.edr file(s), wildcards are accepted. If there are several simulations (the parts of '
+                             'a continued simulation are stitched together), they are processed in parallel',
+                        default=['energy.edr'])
+    parser.add_argument('-o', action='store', type=str,
+                        help='output file (.xvg or .npz). For several simulations "{replica}" in the name is '
+                             'replaced by the name of the simulation (default: energy.xvg or {replica}_energy.xvg)',
+                        default=None)
     parser.add_argument('-w', action='store_const', const=True, help='View results', default=False)
     parser.add_argument('-s', action='store', nargs="?", required=False, type=str,
-                        help='.tpr file', const='topol.tpr', default=None)
+                        help='.tpr file (not needed, accepted for compatibility)', const='topol.tpr', default=None)
+    parser.add_argument('-t', action='store', type=str, nargs='+', dest='terms', help='energy terms to extract',
+                        default=None)
+    parser.add_argument('-b', action='store', type=float, dest='tmin', help='first time to read (ps)', default=None)
+    parser.add_argument('-e', action='store', type=float, dest='tmax', help='last time to read (ps)', default=None)
+    parser.add_argument('-j', action='store', type=int, dest='jobs',
+                        help='number of parallel processes (default: the number of CPUs)', default=None)
+    parser.add_argument('-a', action='store_const', const=True, dest='equilibrate', default=False,
+                        help='detect the equilibration of the terms automatically and discard the frames before it')
+    parser.add_argument('-r', action='store', type=str, dest='report', default=None,
+                        help='write the statistics of the terms ({}) to this file (.json or .csv). For several '
+                             'simulations "{{replica}}" is replaced by the name of the simulation. The energies are '
+                             'written only if -o is given'.format(', '.join(reportstatistics)))
+    parser.add_argument('-F', action='store', type=float, dest='follow', default=None, metavar='SECONDS',
+                        help='follow a growing .edr or .xvg file (e.g. of a running simulation): print the mean, '
+                             'the standard deviation and the trend of the terms at this interval until interrupted')
+    parser.add_argument('-x', action='store_const', const=True, dest='statistics', default=False,
+                        help='print the mean, the standard deviation and the standard error of the mean (from the '
+                             'statistical inefficiency and by block averaging) of the terms (single simulation only)')
     args = vars(parser.parse_args())
 
-    data, labels = extract_energy(args['f'], args['s'], args['o'])
+    filenames = []
+    for pattern in args['f']:
+        matches = sorted(glob.glob(pattern))
+        if not matches:
+            parser.error('No such file: {}'.format(pattern))
+        filenames.extend([m for m in matches if m not in filenames])
+    if args['follow'] is not None:
+        if len(filenames) > 1:
+            parser.error('Only a single file can be followed')
+        follow(filenames[0], args['terms'], args['follow'])
+        return
+    replicas = group_replicas(filenames)
+    if len(replicas) > 1:
+        outputtemplate = args['o']
+        if outputtemplate is None and args['report'] is None:
+            outputtemplate = '{replica}_energy.xvg'
+        for template in [outputtemplate, args['report']]:
+            if template is not None and '{replica}' not in template:
+                parser.error('The output file names must contain "{replica}" for several simulations')
+        summaries = batch_extract(replicas, outputtemplate, args['terms'], args['tmin'], args['tmax'], args['jobs'],
+                                  args['equilibrate'], args['report'])
+        print_summary(summaries)
+        return
+    data, labels = extract_energy(filenames, terms=args['terms'], tmin=args['tmin'], tmax=args['tmax'])
+    if args['equilibrate'] and len(data):
+        times, g, neff = equilibration(data)
+        print_equilibration(labels, times, g, neff)
+        # the frames from the equilibration of all terms
+        data = data[data[:, 0] >= times.max()]
+    outputfile = args['o']
+    if outputfile is None and args['report'] is None:
+        outputfile = 'energy.xvg'
+    if outputfile is not None:
+        write_energies(outputfile, data, labels, energy_units(filenames[0], labels[1:]))
+    if args['report'] is not None:
+        write_report(args['report'], data, labels, energy_units(filenames[0], labels[1:]))
+    if args['statistics']:
+        print_statistics(data, labels)
     if args["w"]:
         from PyQt5.QtWidgets import QApplication
+        from .extract_energy_gui import MainWindow
         app = QApplication([sys.argv[0]])
         mw = MainWindow()
         mw.setCurveData(data, labels)
@@ -0,0 +1,649 @@
+"""The graphical user interface of gmx_extract_energy: plotting the energy terms and their statistics."""
+import collections
+import os
+import threading
+import traceback
+
+import numpy as np
+import scipy.signal
+from PyQt5 import QtCore, QtWidgets
+from matplotlib.backends.backend_qt5agg import FigureCanvasQTAgg, NavigationToolbar2QT
+from matplotlib.figure import Figure
+
+from .analysis.decimation import DecimatedLine
+from .analysis.timeseries import WindowStatistics
+from .extract_energy import DatasetCache, EnergyFollower
+from .extract_energy_ui import Ui_gmx_extract_energy
+
+
+class CurvesModel(QtCore.QAbstractItemModel):
+    # columns: name, show in left axis, show in right axis,
+    def __init__(self, labels):
+        super().__init__()
+        self._rows = [{'name': l, 'showonleft': True, 'showonright': False, 'factor': 1.0} for l in labels]
+
+    def columnCount(self, parent=None):
+        return 4
+
+    def data(self, index: QtCore.QModelIndex, role=None):
+        row = self._rows[index.row()]
+        if index.column() == 0:
+            if role == QtCore.Qt.DisplayRole:
+                return row['name']
+            else:
+                return None
+        elif index.column() == 1:
+            if role == QtCore.Qt.CheckStateRole:
+                return [QtCore.Qt.Unchecked, QtCore.Qt.Checked][row['showonleft']]
+        elif index.column() == 2:
+            if role == QtCore.Qt.CheckStateRole:
+                return [QtCore.Qt.Unchecked, QtCore.Qt.Checked][row['showonright']]
+        elif index.column() == 3:
+            if role == QtCore.Qt.DisplayRole:
+                return '{:g}'.format(row['factor'])
+        else:
+            return None
+
+    def flags(self, index: QtCore.QModelIndex):
+        row = self._rows[index.row()]
+        if index.column() == 0:
+            return QtCore.Qt.ItemIsEnabled | QtCore.Qt.ItemNeverHasChildren | QtCore.Qt.ItemIsSelectable
+        if index.column() == 1 or index.column() == 2:
+            return QtCore.Qt.ItemIsEnabled | QtCore.Qt.ItemNeverHasChildren | QtCore.Qt.ItemIsUserCheckable | QtCore.Qt.ItemIsSelectable
+        if index.column() == 3:
+            return QtCore.Qt.ItemIsEditable | QtCore.Qt.ItemIsEnabled | QtCore.Qt.ItemNeverHasChildren | QtCore.Qt.ItemIsSelectable
+        else:
+            return QtCore.Qt.NoItemFlags
+
+
+    def index(self, row, col, parent=None):
+        return self.createIndex(row, col, None)
+
+    def rowCount(self, parent=None):
+        return len(self._rows)
+
+    def parent(self, index: QtCore.QModelIndex = None):
+        return QtCore.QModelIndex()
+
+    def setData(self, index: QtCore.QModelIndex, newvalue, role=None):
+        row = self._rows[index.row()]
+        if index.column() == 1:
+            row['showonleft'] = newvalue == QtCore.Qt.Checked
+            self.dataChanged.emit(self.index(index.row(), 1), self.index(index.row(), 1))
+            return True
+        elif index.column() == 2:
+            row['showonright'] = newvalue == QtCore.Qt.Checked
+            self.dataChanged.emit(self.index(index.row(), 2), self.index(index.row(), 2))
+            return True
+        return False
+
+    def headerData(self, column, orientation, role=None):
+        if orientation != QtCore.Qt.Horizontal:
+            return None
+        if role == QtCore.Qt.DisplayRole:
+            return ['Name', 'Left', 'Right', 'Scaling factor'][column]
+
+    def showOnLeft(self, row):
+        return self._rows[row]['showonleft']
+
+    def showOnRight(self, row):
+        return self._rows[row]['showonright']
+
+    def factor(self, row):
+        return self._rows[row]['factor']
+
+    def hideAll(self):
+        for r in self._rows:
+            r['showonleft'] = r['showonright'] = False
+        self.dataChanged.emit(self.index(0, 1), self.index(self.rowCount(), 2))
+
+
+class StatisticsModel(QtCore.QAbstractItemModel):
+    # columns: name, mean, median, trend, std, std (pcnt), ptp, ptp (pcnt), statistical inefficiency, SEM, block SEM
+    # the statistics which need all values in the window, as opposed to the ones computed from prefix sums. They are
+    # computed in a worker thread, and shown when ready. The SEM is computed from the statistical inefficiency.
+    slowstatistics = ['median', 'inefficiency', 'blocksem']
+    # the number of windows whose slow statistics are kept
+    windowcachesize = 32
+    # shown while the statistic is being computed
+    placeholder = '...'
+    # emitted by the worker thread with the window and its slow statistics
+    slowStatisticsComputed = QtCore.pyqtSignal(object, object)
+    # emitted by the worker thread with the first row where all terms are equilibrated
+    equilibrationDetected = QtCore.pyqtSignal(int)
+
+    def __init__(self, data, labels, tmin=None, tmax=None, state=None):
+        super().__init__()
+        self._data = data
+        self.labels = labels
+        # the statistics, the slow statistics of the windows and the end of the equilibration are kept in `state`,
+        # e.g. with the dataset in a DatasetCache, for the next model of the same data
+        self._state = {} if state is None else state
+        if 'statistics' not in self._state:
+            self._state['statistics'] = WindowStatistics(data[:, 0], data[:, 1:])
+        self.statistics = self._state['statistics']
+        # the workers of the models sharing the statistics take turns
+        self._lock = self._state.setdefault('lock', threading.Lock())
+        if tmin is None and len(data):
+            tmin = data[:, 0].min()
+        if tmax is None and len(data):
+            tmax = data[:, 0].max()
+        self.tmin = tmin
+        self.tmax = tmax
+        # while following a growing file, the statistics needing all values of the window are not recomputed at
+        # each update
+        self.following = False
+        self._cachedwindow = None
+        self._cache = {}
+        # the slow statistics of the windows, the window being computed and the last one needed
+        self._slowstatistics = self._state.setdefault('slowstatistics', collections.OrderedDict())
+        self._computing = None
+        self._requested = None
+        # the slow statistics shown while following
+        self._stale = None
+        self._detecting = False
+        self.slowStatisticsComputed.connect(self._onSlowStatisticsComputed)
+        self.equilibrationDetected.connect(self._onEquilibrationDetected)
+
+    def columnCount(self, parent=None):
+        return 11
+
+    def statistic(self, name, datacolumn):
+        """A statistic ('mean', 'median', 'trend', 'std', 'ptp', 'inefficiency', 'sem' or 'blocksem', see
+        WindowStatistics) of a data column in the current time window. The statistics are computed for all columns at
+        once and cached: the fast ones until the window changes, the slow ones (see `slowstatistics`) for the last
+        `windowcachesize` windows. None is returned while the slow ones are computed."""
+        window = self.statistics.window(self.tmin, self.tmax)
+        if window != self._cachedwindow:
+            self._cachedwindow = window
+            self._cache = {}
+        if name == 'sem':
+            inefficiency = self.statistic('inefficiency', datacolumn)
+            if inefficiency is None:
+                return None
+            with np.errstate(invalid='ignore', divide='ignore'):
+                return self.statistic('std', datacolumn) * np.sqrt(inefficiency / (window[1] - window[0]))
+        if name in self.slowstatistics:
+            slowstatistics = self.slowStatistics(window)
+            return None if slowstatistics is None else slowstatistics[name][datacolumn]
+        if name not in self._cache:
+            self._cache[name] = getattr(self.statistics, name)(*window)
+        return self._cache[name][datacolumn]
+
+    def slowStatistics(self, window):
+        """The slow statistics of all columns in a window (start and stop rows) in a dict, or None if they are not
+        ready yet. Only one window is computed at a time: when it is ready, the last one needed is started, so the
+        windows passed while dragging a slider are skipped."""
+        try:
+            self._slowstatistics.move_to_end(window)
+            return self._slowstatistics[window]
+        except KeyError:
+            pass
+        if self._stale is not None:
+            return self._stale
+        self._requested = window
+        if self._computing is None and not self._detecting:
+            self._computing = window
+            threading.Thread(target=self._computeSlowStatistics, args=(window,), daemon=True).start()
+        return None
+
+    def _computeSlowStatistics(self, window):
+        # in the worker thread. The prefix sum tables of the statistics are not used here, as they are updated by
+        # appendData().
+        start, stop = window
+        try:
+            with self._lock:
+                slowstatistics = {'median': np.array([self.statistics.median(start, stop, column)
+                                                      for column in range(self.rowCount())]),
+                                  'inefficiency': self.statistics.inefficiency(start, stop),
+                                  'blocksem': self.statistics.blocksem(start, stop)}
+        except Exception:
+            traceback.print_exc()
+            slowstatistics = {name: np.full(self.rowCount(), np.nan) for name in self.slowstatistics}
+        self.slowStatisticsComputed.emit(window, slowstatistics)
+
+    def _onSlowStatisticsComputed(self, window, slowstatistics):
+        self._computing = None
+        self._slowstatistics[window] = slowstatistics
+        while len(self._slowstatistics) > self.windowcachesize:
+            self._slowstatistics.popitem(last=False)
+        if self._requested is not None and self._requested not in self._slowstatistics:
+            self.slowStatistics(self._requested)
+        # the views ask for the statistics of the current window again
+        self.dataChanged.emit(self.index(0, 1), self.index(self.rowCount(), self.columnCount()),
+                              [QtCore.Qt.DisplayRole])
+
+    def detectEquilibration(self):
+        """Detect the equilibration of the terms in the whole dataset in a worker thread, see
+        WindowStatistics.equilibration(). `equilibrationDetected` is emitted when done. Meanwhile no slow statistics are
+        computed, as the window is likely to change then."""
+        self._detecting = True
+        if 'equilibration' in self._state:
+            self.equilibrationDetected.emit(self._state['equilibration'])
+            return
+        threading.Thread(target=self._detectEquilibration, args=(len(self._data),), daemon=True).start()
+
+    def _detectEquilibration(self, stop):
+        # in the worker thread
+        try:
+            starts = self.statistics.equilibration(0, stop)
+            first = int(starts.max()) if stop and len(starts) else 0
+        except Exception:
+            traceback.print_exc()
+            first = 0
+        self.equilibrationDetected.emit(first)
+
+    def _onEquilibrationDetected(self, first):
+        self._detecting = False
+        self._state['equilibration'] = first
+        self.dataChanged.emit(self.index(0, 1), self.index(self.rowCount(), self.columnCount()),
+                              [QtCore.Qt.DisplayRole])
+
+    def _format(self, value):
+        return self.placeholder if value is None else str(value)
+
+    def data(self, index: QtCore.QModelIndex, role=None):
+        if role != QtCore.Qt.DisplayRole:
+            return None
+        datacolumn = index.row()
+        if index.column() == 0:
+            return self.labels[datacolumn + 1]
+        elif index.column() == 1:
+            return str(self.statistic('mean', datacolumn))
+        elif index.column() == 2:
+            return self._format(self.statistic('median', datacolumn))
+        elif index.column() == 3:
+            return str(self.statistic('trend', datacolumn))
+        elif index.column() == 4:
+            return str(self.statistic('std', datacolumn))
+        elif index.column() == 5:
+            return str(self.statistic('std', datacolumn) / self.statistic('mean', datacolumn) * 100)
+        elif index.column() == 6:
+            return str(self.statistic('ptp', datacolumn))
+        elif index.column() == 7:
+            return str(self.statistic('ptp', datacolumn) / self.statistic('mean', datacolumn) * 100)
+        elif index.column() == 8:
+            return self._format(self.statistic('inefficiency', datacolumn))
+        elif index.column() == 9:
+            return self._format(self.statistic('sem', datacolumn))
+        elif index.column() == 10:
+            return self._format(self.statistic('blocksem', datacolumn))
+        else:
+            return None
+
+    def flags(self, index: QtCore.QModelIndex):
+        return QtCore.Qt.ItemIsEnabled | QtCore.Qt.ItemNeverHasChildren | QtCore.Qt.ItemIsSelectable
+
+    def index(self, row, col, parent=None):
+        return self.createIndex(row, col, None)
+
+    def rowCount(self, parent=None):
+        return self._data.shape[1] - 1
+
+    def parent(self, index: QtCore.QModelIndex = None):
+        return QtCore.QModelIndex()
+
+    def headerData(self, column, orientation, role=None):
+        if orientation != QtCore.Qt.Horizontal:
+            return None
+        if role == QtCore.Qt.DisplayRole:
+            return ['Name', 'Mean', 'Median', 'Trend', 'STD', 'STD %', 'P2P', 'P2P %', 'Stat. ineff.', 'SEM',
+                    'Block SEM'][column]
+
+    def appendData(self, data, tmax=None):
+        """Set the data after new rows were appended to it. The end of the window is moved to `tmax` if given. While
+        following, the slow statistics are not recomputed for the moved window: the ones of the previous window are
+        shown until the window is changed by setTmin() or setTmax()."""
+        if self.following:
+            self._stale = self._slowstatistics.get(self.statistics.window(self.tmin, self.tmax), self._stale)
+        new = data[len(self._data):]
+        self._data = data
+        # the file has changed, its dataset in a DatasetCache is not used any more, so the state can be updated
+        self.statistics.append(new[:, 0], new[:, 1:])
+        self._state.pop('equilibration', None)
+        if tmax is not None:
+            self.tmax = tmax
+        self.dataChanged.emit(self.index(0, 1), self.index(self.rowCount(), self.columnCount()),
+                              [QtCore.Qt.DisplayRole])
+
+    def setFollowing(self, following):
+        self.following = following
+        if not following:
+            # compute the statistics of the current window
+            self._stale = None
+        self.dataChanged.emit(self.index(0, 1), self.index(self.rowCount(), self.columnCount()),
+                              [QtCore.Qt.DisplayRole])
+
+    def setTmin(self, value):
+        self.tmin = value
+        self._stale = None
+        self.dataChanged.emit(self.index(0, 1), self.index(self.rowCount(), self.columnCount()),
+                              [QtCore.Qt.DisplayRole])
+
+    def setTmax(self, value):
+        self.tmax = value
+        self._stale = None
+        self.dataChanged.emit(self.index(0, 1), self.index(self.rowCount(), self.columnCount()),
+                              [QtCore.Qt.DisplayRole])
+
+
+class MainWindow(QtWidgets.QWidget, Ui_gmx_extract_energy):
+    windowfunctions = {'barthann': 'Bartlett-Hann',
+                       'bartlett': 'Bartlett',
+                       'blackman': 'Blackman',
+                       'blackmanharris': 'Blackman-Harris',
+                       'bohman': 'Bohman',
+                       'boxcar': 'Rectangular',
+                       'cosine': 'Cosine',
+                       'flattop': 'Flat top',
+                       'hamming': 'Hamming',
+                       'hann': 'Hann',
+                       'nuttall': 'Nuttall',
+                       'parzen': 'Parzen',
+                       'triang': 'Triangular',
+                       'tukey': 'Tukey (tapered cosine)',
+                       }
+    # the number of smoothed curves kept in the cache
+    smoothingcachesize = 64
+    # move the tmin slider to the end of the equilibration when a file is opened (when the equilibration is detected in
+    # the background)
+    autotmin = True
+    # the interval of checking the file for new frames in follow mode, in milliseconds
+    followinterval = 2000
+    # the size of the datasets kept in memory for switching between files, in bytes
+    datasetcachesize = 512 << 20
+    # keep the datasets also in sidecar files next to the energy files
+    persistentdatasetcache = False
+
+    def __init__(self):
+        QtWidgets.QWidget.__init__(self)
+        self.cursor = None
+        self.axesleft = None
+        self.axesright = None
+        self.legend = None
+        # the plotted curves (DecimatedLine instances), keyed by (data column, 'left' or 'right')
+        self.lines = {}
+        self.smoothedcurves = collections.OrderedDict()
+        # the file opened in the file browser and the reader of the frames appended to it in follow mode
+        self.filename = None
+        self.follower = None
+        # the frames before this time are not loaded (None: all frames are loaded)
+        self.loadtmin = None
+        self.datasets = DatasetCache(self.datasetcachesize, self.persistentdatasetcache)
+        self.setupUi(self)
+
+    def setupUi(self, Form):
+        Ui_gmx_extract_energy.setupUi(self, Form)
+        Form.fsmodel = QtWidgets.QFileSystemModel()
+        Form.treeViewOpenFile.setModel(Form.fsmodel)
+        Form.fsmodel.setNameFilters(['*.edr', '*.xvg'])
+        Form.fsmodel.setRootPath('/')
+        Form.treeViewOpenFile.hideColumn(1)
+        Form.treeViewOpenFile.hideColumn(2)
+        Form.treeViewOpenFile.hideColumn(3)
+        Form.fsmodel.sort(0, QtCore.Qt.AscendingOrder)
+        Form.treeViewOpenFile.expand(Form.fsmodel.index(os.getcwd()))
+        Form.treeViewOpenFile.setCurrentIndex(Form.fsmodel.index(os.getcwd()))
+        Form.treeViewOpenFile.scrollTo(Form.fsmodel.index(os.getcwd()), QtWidgets.QAbstractItemView.PositionAtTop)
+        Form.treeViewOpenFile.activated.connect(Form.onFileSelected)
+        Form.figure = Figure()
+        Form.figureCanvas = FigureCanvasQTAgg(Form.figure)
+        Form.verticalLayoutFigure.addWidget(Form.figureCanvas)
+        Form.navigationToolBar = NavigationToolbar2QT(Form.figureCanvas, Form)
+        Form.verticalLayoutFigure.addWidget(Form.navigationToolBar)
+        Form.loadTminHorizontalLayout = QtWidgets.QHBoxLayout()
+        Form.loadTminHorizontalLayout.addWidget(QtWidgets.QLabel('Skip the frames before (ps):', Form))
+        Form.loadTminSpinBox = QtWidgets.QDoubleSpinBox(Form)
+        Form.loadTminSpinBox.setRange(0, 1e12)
+        Form.loadTminSpinBox.setToolTip('Load the files from this time on. The earlier rows of .xvg files are skipped '
+                                        'without reading them.')
+        Form.loadTminHorizontalLayout.addWidget(Form.loadTminSpinBox)
+        Form.loadTminHorizontalLayout.addStretch(1)
+        Form.verticalLayoutFigure.addLayout(Form.loadTminHorizontalLayout)
+        Form.loadTminSpinBox.editingFinished.connect(Form.onLoadTminChanged)
+        Form.followCheckBox = QtWidgets.QCheckBox('Follow the file (update when new frames are written)', Form)
+        Form.verticalLayoutFigure.addWidget(Form.followCheckBox)
+        # enabled when a file is opened in the file browser
+        Form.followCheckBox.setEnabled(False)
+        Form.followCheckBox.toggled.connect(Form.onFollowToggled)
+        Form.followTimer = QtCore.QTimer(Form)
+        Form.followTimer.setInterval(self.followinterval)
+        Form.followTimer.timeout.connect(Form.onFollowTimeout)
+        Form.hideAllPushButton.clicked.connect(Form.hideAll)
+        Form.toolButtonGoFirst.clicked.connect(
+            lambda: Form.horizontalSliderCursor.triggerAction(Form.horizontalSliderCursor.SliderToMinimum))
+        Form.toolButtonGoLast.clicked.connect(
+            lambda: Form.horizontalSliderCursor.triggerAction(Form.horizontalSliderCursor.SliderToMaximum))
+        Form.toolButtonGoNext.clicked.connect(
+            lambda: Form.horizontalSliderCursor.triggerAction(Form.horizontalSliderCursor.SliderSingleStepAdd))
+        Form.toolButtonGoPrevious.clicked.connect(
+            lambda: Form.horizontalSliderCursor.triggerAction(Form.horizontalSliderCursor.SliderSingleStepSub))
+        Form.tminSlider.valueChanged.connect(Form.onTminSliderValueChanged)
+        Form.tmaxSlider.valueChanged.connect(Form.onTmaxSliderValueChanged)
+        Form.smoothingSlider.valueChanged.connect(Form.onSmoothingChanged)
+        index = 0
+        for i, w in enumerate(sorted(self.windowfunctions)):
+            Form.smoothingFunctionComboBox.addItem(self.windowfunctions[w])
+            if w == 'boxcar':
+                index = i
+        Form.smoothingFunctionComboBox.setCurrentIndex(index)
+        Form.smoothingFunctionComboBox.currentIndexChanged.connect(lambda *args: self.replot())
+
+    def onSmoothingChanged(self, smoothing):
+        self.replot()
+
+    def onFileSelected(self, index):
+        assert isinstance(self.fsmodel, QtWidgets.QFileSystemModel)
+        filename = self.fsmodel.filePath(index)
+        self.openFile(filename)
+
+    def openFile(self, filename):
+        self.loadtmin = self.loadTminSpinBox.value() or None
+        data, labels = self.datasets.load(filename, self.loadtmin)
+        self.filename = filename
+        # created when following is started
+        self.follower = None
+        self.setCurveData(data, labels, self.datasets.state(data))
+        self.followCheckBox.setEnabled(True)
+
+    def onLoadTminChanged(self):
+        if self.filename is not None and (self.loadTminSpinBox.value() or None) != self.loadtmin:
+            self.openFile(self.filename)
+
+    def onFollowToggled(self, checked):
+        if checked:
+            self.followTimer.start()
+        else:
+            self.followTimer.stop()
+        if hasattr(self, 'statModel'):
+            self.statModel.setFollowing(checked)
+
+    def onFollowTimeout(self):
+        try:
+            if self.follower is None:
+                # the file is read once more, then only the new frames
+                self.follower = EnergyFollower(self.filename, tmin=self.loadtmin)
+            else:
+                self.follower.update()
+        except (OSError, ValueError) as exc:
+            self.followCheckBox.setChecked(False)
+            QtWidgets.QMessageBox.critical(self, 'Error while reading file', str(exc))
+            return
+        if len(self.follower.data) > len(self.data):
+            self.appendCurveData(self.follower.data)
+
+    def hideAll(self):
+        try:
+            self.curveModel.hideAll()
+        except AttributeError:
+            pass
+
+    def setCurveData(self, data, labels, state=None):
+        """Show a dataset. The statistics computed from it are kept in `state` (a dict, see DatasetCache.state()) if
+        given, and reused from there when the dataset is shown again."""
+        self.data = data
+        self.labels = labels
+        self.smoothedcurves.clear()
+        for line in self.lines.values():
+            line.remove()
+        self.lines = {}
+        this_is_the_first_model = not hasattr(self, 'curveModel')
+        self.curveModel = CurvesModel(self.labels[1:])
+        self.treeViewCurves.setModel(self.curveModel)
+        self.curveModel.dataChanged.connect(self.curveModelDataChanged)
+        self.statModel = StatisticsModel(self.data, self.labels, state=state)
+        self.statModel.following = self.followCheckBox.isChecked()
+        self.statisticsTreeView.setModel(self.statModel)
+        if this_is_the_first_model:
+            for col in range(1, self.curveModel.columnCount()):
+                self.treeViewCurves.resizeColumnToContents(col)
+            for col in range(1, self.statModel.columnCount()):
+                self.statisticsTreeView.resizeColumnToContents(col)
+        self.setScalerLimits()
+        self.replot()
+
+    def appendCurveData(self, data):
+        """Update the plot and the statistics after new rows were appended to the data. Only the new parts of the
+        curves are smoothed."""
+        oldlength = len(self.data)
+        if not oldlength:
+            self.setCurveData(data, self.follower.labels)
+            return
+        self.data = data
+        self.smoothedcurves.clear()
+        smoothing = self.smoothing()
+        for (column, side), line in self.lines.items():
+            if smoothing is None:
+                line.append(data[oldlength:, 0], data[oldlength:, column])
+            else:
+                # the smoothed values needing the new rows
+                first = max(oldlength - smoothing + 1, 0)
+                window = scipy.signal.get_window(self.smoothingWindowName(), smoothing)
+                curve = scipy.signal.fftconvolve(data[first:, column], window, 'valid') / window.sum()
+                n = (smoothing - 1) // 2
+                line.append(data[first + n:len(data) - n, 0], curve)
+        atend = self.tmaxSlider.value() == oldlength - 1
+        self.statModel.appendData(data, data[-1, 0] if atend else None)
+        for slider in [self.horizontalSliderCursor, self.tminSlider, self.tmaxSlider]:
+            slider.setMaximum(len(data) - 1)
+        self.tminSpinBox.setMaximum(data[-1, 0])
+        self.tmaxSpinBox.setMaximum(data[-1, 0])
+        self.smoothingSlider.setMaximum(int(np.floor(0.5 * (len(data) - 1))))
+        if atend:
+            # the window was moved by appendData(), setTmax() would drop the statistics kept while following
+            self.tmaxSlider.blockSignals(True)
+            self.tmaxSlider.setValue(len(data) - 1)
+            self.tmaxSlider.blockSignals(False)
+            self.tmaxSpinBox.setValue(data[-1, 0])
+        for axes in [self.axesleft, self.axesright]:
+            axes.relim()
+            axes.autoscale_view()
+        self.figureCanvas.draw_idle()
+
+    def setScalerLimits(self):
+        self.horizontalSliderCursor.setMinimum(0)
+        self.horizontalSliderCursor.setMaximum(self.data.shape[0] - 1)
+        self.tminSlider.setMinimum(0)
+        self.tminSlider.setMaximum(self.data.shape[0] - 1)
+        self.tmaxSlider.setMinimum(0)
+        self.tmaxSlider.setMaximum(self.data.shape[0] - 1)
+        self.tmaxSlider.setValue(self.data.shape[0] - 1)
+        self.tminSlider.setValue(0)
+        if len(self.data):
+            self.tminSpinBox.setMinimum(self.data[0, 0])
+            self.tminSpinBox.setMaximum(self.data[-1, 0])
+            self.tmaxSpinBox.setMinimum(self.data[0, 0])
+            self.tmaxSpinBox.setMaximum(self.data[-1, 0])
+        self.smoothingSlider.setMinimum(0)
+        self.smoothingSlider.setMaximum(int(np.floor(0.5 * (self.data.shape[0] - 1))))
+        if self.autotmin and len(self.data):
+            self.statModel.equilibrationDetected.connect(self.onEquilibrationDetected)
+            self.statModel.detectEquilibration()
+
+    def onEquilibrationDetected(self, first):
+        """Move the tmin slider to the first row where all terms are equilibrated, unless it was moved meanwhile or
+        another file was opened"""
+        if self.sender() is self.statModel and self.tminSlider.value() == 0:
+            self.tminSlider.setValue(first)
+
+    def onTminSliderValueChanged(self, value):
+        if value > self.tmaxSlider.value():
+            self.tminSlider.setValue(self.tmaxSlider.value())
+        self.tminSpinBox.setValue(self.cursorposToTime(self.tminSlider.value()))
+        self.statModel.setTmin(self.cursorposToTime(self.tminSlider.value()))
+
+    def cursorposToTime(self, cursorpos):
+        return self.data[:, 0][cursorpos]
+
+    def timeToCursorpos(self, time):
+        return np.searchsorted(self.data[:, 0], time, side='right')
+
+    def onTmaxSliderValueChanged(self, value):
+        if value < self.tminSlider.value():
+            self.tmaxSlider.setValue(self.tminSlider.value())
+        self.tmaxSpinBox.setValue(self.cursorposToTime(self.tmaxSlider.value()))
+        self.statModel.setTmax(self.cursorposToTime(self.tmaxSlider.value()))
+
+    def curveModelDataChanged(self, idx1, idx2, roles):
+        self.replot()
+
+    def smoothingWindowName(self):
+        return [k for k in self.windowfunctions
+                if self.windowfunctions[k] == self.smoothingFunctionComboBox.currentText()][0]
+
+
+    def smoothedCurve(self, column, smoothing):
+        """The abscissa and the curve in a data column, smoothed with the current window function of width
+        `smoothing` (None for no smoothing). Smoothed curves are cached."""
+        if smoothing is None:
+            return self.data[:, 0], self.data[:, column]
+        key = (column, self.smoothingWindowName(), smoothing)
+        try:
+            self.smoothedcurves.move_to_end(key)
+            return self.smoothedcurves[key]
+        except KeyError:
+            pass
+        window = scipy.signal.get_window(key[1], smoothing)
+        curve = scipy.signal.fftconvolve(self.data[:, column], window, 'valid') / window.sum()
+        # smoothing = 2*n+1. Cut n points from both the left and the right side of x.
+        n = (smoothing - 1) // 2
+        self.smoothedcurves[key] = self.data[n:-n, 0], curve
+        if len(self.smoothedcurves) > self.smoothingcachesize:
+            self.smoothedcurves.popitem(last=False)
+        return self.smoothedcurves[key]
+
+    def smoothing(self):
+        """The width of the smoothing window, None if there is no smoothing"""
+        smoothing = 2 * self.smoothingSlider.value() + 1
+        return smoothing if smoothing >= 3 else None
+
+    def replot(self):
+        smoothing = self.smoothing()
+        assert isinstance(self.figure, Figure)
+        if self.axesleft is None:
+            self.axesleft = self.figure.add_subplot(1, 1, 1)
+            self.axesright = self.axesleft.twinx()
+        self.axesleft.set_xlabel(self.labels[0])
+        lines = []
+        labels = []
+        for i in range(1, len(self.labels)):
+            for side, axes, shown in [('left', self.axesleft, self.curveModel.showOnLeft(i - 1)),
+                                      ('right', self.axesright, self.curveModel.showOnRight(i - 1))]:
+                if not shown:
+                    continue
+                x, curve = self.smoothedCurve(i, smoothing)
+                if (i, side) in self.lines:
+                    self.lines[i, side].set_data(x, curve)
+                else:
+                    self.lines[i, side] = DecimatedLine(axes, x, curve, label=self.labels[i])
+                lines.append(self.lines[i, side].line)
+                labels.append(self.labels[i])
+        for key in [k for k in self.lines if self.lines[k].line not in lines]:
+            self.lines.pop(key).remove()
+        for axes in [self.axesleft, self.axesright]:
+            axes.relim()
+            axes.autoscale_view()
+        if self.legend is not None:
+            self.legend.remove()
+        self.legend = self.figure.legend(lines, labels)
+        self.figureCanvas.draw_idle()
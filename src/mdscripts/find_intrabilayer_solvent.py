@@ -22,6 +22,16 @@ def interlayersolvents(grofile: GROFile, lipidname, solventname, headgroup_atomt
     return solvents.filter_boolflags(solvents.extend_boolflags_to_residues(badatomidx)), lower, upper
 
 
+def interlayersolvents_trajectory(grofilename, lipidname, solventname, headgroup_atomtype=b'P8'):
+    """Find misplaced solvent molecules in every frame of a multi-frame .gro file.
+
+    Yields the comment line, the lower and upper head group layer positions and the number of misplaced solvent
+    molecules for each frame."""
+    for gro in GROFile.iter_frames(grofilename):
+        badsolvents, lower, upper = interlayersolvents(gro, lipidname, solventname, headgroup_atomtype)
+        yield gro.comment.strip(), lower, upper, badsolvents.nresidues()
+
+
 def run():
     parser = argparse.ArgumentParser(
         description="Find misplaced solvent molecules in the phospholipid carbon chain region")
@@ -33,25 +43,34 @@ def run():
                         default=None)
     parser.add_argument('-o', action='store', dest='finalgro', type=str, help='The output .gro file',
                         default='confout.gro')
+    parser.add_argument('--all-frames', action='store_true', dest='allframes',
+                        help='Analyze all frames of a multi-frame .gro file. Only a report is printed, no files are '
+                             'written.', default=False)
     # parser.add_help()
     args = vars(parser.parse_args())
     if args['inputfile'] is None or args['lipidname'] is None:
         parser.print_help()
         sys.exit(1)
+    if args['allframes']:
+        print('Frame\tLower\tUpper\t#{}\tComment'.format(args['solventname']))
+        for i, (comment, lower, upper, nbad) in enumerate(interlayersolvents_trajectory(
+                args['inputfile'], args['lipidname'], args['solventname'], args['atomname'])):
+            print('{:d}\t{:.3f}\t{:.3f}\t{:d}\t{}'.format(i, lower, upper, nbad, comment))
+        return
     gro = GROFile.load(args['inputfile'])
     print('Loaded {:d} atoms from file {}.'.format(len(gro), args['inputfile']))
     badsolvents, lower, upper = interlayersolvents(gro, args['lipidname'], args['solventname'], args['atomname'])
     print('Lower and upper mean z coordinates of the head group layer: {} and {}'.format(lower, upper))
     badsolventresidues = badsolvents.resids()
     print('Found {} misplaced solvent molecules:'.format(len(badsolventresidues)))
-    print('  ', ', '.join('{:d}{}'.format(b, args['solventname']) for b in sorted(badsolventresidues)))
+    print('  ', ', '.join(badsolventresidues))
 
     print('Original number of atoms:', len(gro))
     print('Number of bad atoms:', len(badsolvents))
     goodgro = gro - badsolvents
     print('Number of atoms kept:', len(goodgro))
     print('Number of removed {} molecules: {}'.format(args['solventname'], len(badsolventresidues)))
-    ngoodsolventresidues = len((goodgro.filter_resn(args['solventname']) - badsolvents).resids())
+    ngoodsolventresidues = goodgro.filter_resn(args['solventname']).nresidues()
     print('Remaining {} molecules: {}'.format(
         args['solventname'], ngoodsolventresidues))
     backoff(args['finalgro'])
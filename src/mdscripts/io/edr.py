@@ -0,0 +1,367 @@
+"""Reader for GROMACS .edr energy files.
+
+An .edr file is written in XDR (big endian) format: a header with the names and units of the energy terms is followed
+by the frames. Each frame has a header (time, step, number of terms and the layout of the additional data blocks),
+the energy terms and the data blocks.
+
+Frames of a simulation usually have the very same layout, i.e. the terms and the blocks are at the same byte offsets
+in each frame. The frame headers are therefore only parsed where the layout changes: runs of frames with identical
+layout are found by comparing their headers in bulk, and the energies of a run are read through a strided view of
+the memory-mapped file.
+"""
+import mmap
+import struct
+
+import numpy as np
+
+NAMESMAGIC = -55555
+FRAMEMAGIC = -7777777
+# the newest file version supported
+VERSION = 5
+
+# data types of the sub-blocks: int, float, double, int64, char, string
+_INT, _FLOAT, _DOUBLE, _INT64, _CHAR, _STRING = range(6)
+_TYPESIZES = [4, 4, 8, 8, 4, None]
+
+
+class _FrameLayout(object):
+    """The structure of an energy frame, parsed from its header.
+
+    Offsets are relative to the start of the frame. `signature` is a list of byte ranges, which must be identical in
+    two frames of the same layout."""
+
+    def __init__(self, length, nterms, timeoffset, timedtype, energyoffset, stride, signature, nsumoffset,
+                 nsumpositive, variable):
+        self.length = length
+        self.nterms = nterms
+        self.timeoffset = timeoffset
+        self.timedtype = timedtype
+        self.energyoffset = energyoffset
+        self.stride = stride
+        self.signature = signature
+        self.nsumoffset = nsumoffset
+        self.nsumpositive = nsumpositive
+        self.variable = variable
+
+
+class EDRFile(object):
+    """Energy terms in a GROMACS .edr file.
+
+    The names and the units of the terms are read when the instance is created, the frames only by `read()`.
+    """
+    # the number of frames compared at once when looking for runs of the same layout
+    chunksize = 1 << 16
+
+    def __init__(self, filename):
+        self.filename = filename
+        with open(filename, 'rb') as f:
+            header = f.read(1 << 16)
+            while True:
+                try:
+                    self._read_names(header)
+                    break
+                except struct.error:
+                    more = f.read(len(header))
+                    if not more:
+                        raise ValueError('Truncated header in .edr file {}'.format(filename))
+                    header += more
+        self.runs = None
+        # the byte offset after the last complete frame found by scan()
+        self.end = None
+
+    def _read_names(self, header):
+        magic, = struct.unpack_from('>i', header, 0)
+        if magic > 0:
+            # the oldest format has neither a magic number nor units
+            self.version = 1
+            nterms = magic
+            pos = 4
+        elif magic == NAMESMAGIC:
+            self.version, nterms = struct.unpack_from('>ii', header, 4)
+            if self.version > VERSION:
+                raise ValueError('Unsupported .edr file version {:d} in file {}'.format(self.version, self.filename))
+            pos = 12
+        else:
+            raise ValueError('Not a GROMACS .edr file: {}'.format(self.filename))
+        self.names = []
+        self.units = []
+        for i in range(nterms):
+            name, pos = _xdr_string(header, pos)
+            if self.version >= 2:
+                unit, pos = _xdr_string(header, pos)
+            else:
+                unit = 'kJ/mol'
+            self.names.append(name)
+            self.units.append(unit)
+        self.dataoffset = pos
+        self.realsize = self._detect_realsize(header)
+
+    def _detect_realsize(self, data):
+        """Single (4) or double (8) precision: find the magic number of the first frame (or the number of terms in
+        the oldest format) where it should be. None if the file has no complete frame header yet."""
+        pos = self.dataoffset
+        if len(data) < pos + 16:
+            return None
+        if self.version == 1:
+            return 8 if struct.unpack_from('>i', data, pos + 12)[0] == len(self.names) else 4
+        elif struct.unpack_from('>i', data, pos + 4)[0] == FRAMEMAGIC:
+            return 4
+        elif struct.unpack_from('>i', data, pos + 8)[0] == FRAMEMAGIC:
+            return 8
+        raise ValueError('Invalid energy frame header in file {}'.format(self.filename))
+
+    def _frame_layout(self, mm, offset) -> _FrameLayout:
+        r = self.realsize
+        realtype = _DOUBLE if r == 8 else _FLOAT
+        if self.version == 1:
+            version = 1
+            timeoffset, timedtype = 0, '>f{:d}'.format(r)
+            nsumoffset = nsum = None
+            signature = []
+            pos = offset + r + 4
+        else:
+            magic, version = struct.unpack_from('>ii', mm, offset + r)
+            if magic != FRAMEMAGIC:
+                raise ValueError('Invalid energy frame header at byte offset {:d} in file {}'.format(
+                    offset, self.filename))
+            if version > VERSION:
+                raise ValueError('Unsupported .edr frame version {:d} in file {}'.format(version, self.filename))
+            signature = [(r, r + 8)]
+            timeoffset, timedtype = r + 8, '>f8'
+            nsumoffset = r + 24
+            nsum, = struct.unpack_from('>i', mm, offset + nsumoffset)
+            # after the time, the step and nsum: nsteps (since version 3) and dt (since version 5)
+            pos = offset + r + 28 + 8 * (version >= 3) + 8 * (version >= 5)
+        headerstart = pos - offset
+        nterms, ndisre, nblock = struct.unpack_from('>3i', mm, pos)
+        pos += 12
+        subblocks = []
+        if version < 4:
+            # all blocks have a single sub-block of reals, distance restraints are stored in an extra block
+            if ndisre:
+                subblocks.extend([(realtype, ndisre)] * 2)
+            subblocks.extend((realtype, nr) for nr in struct.unpack_from('>{:d}i'.format(nblock), mm, pos))
+            pos += 4 * nblock
+        else:
+            for i in range(nblock):
+                blockid, nsub = struct.unpack_from('>ii', mm, pos)
+                pos += 8
+                for j in range(nsub):
+                    subblocks.append(struct.unpack_from('>ii', mm, pos))
+                    pos += 8
+        # the size of the energies and two reserved integers
+        pos += 12
+        signature.append((headerstart, pos - offset))
+        energyoffset = pos - offset
+        # instantaneous values, averages and sums (and an unused value in the oldest format) of the terms
+        nvalues = 4 if version == 1 else (3 if nsum > 0 else 1)
+        pos += nterms * nvalues * r
+        variable = False
+        for datatype, nr in subblocks:
+            if datatype == _STRING:
+                variable = True
+                for i in range(nr):
+                    pos = _xdr_string(mm, pos)[1]
+            elif 0 <= datatype < len(_TYPESIZES):
+                pos += _TYPESIZES[datatype] * nr
+            else:
+                raise ValueError('Unknown data type in energy frame at byte offset {:d} in file {}'.format(
+                    offset, self.filename))
+        return _FrameLayout(pos - offset, nterms, timeoffset, timedtype, energyoffset, nvalues * r, signature,
+                            nsumoffset, nsum is not None and nsum > 0, variable)
+
+    def _run_length(self, buf, offset, layout, maxcount) -> int:
+        """The number of consecutive frames starting at `offset` with the same layout"""
+        if layout.variable:
+            return 1
+        count = 1
+        while count < maxcount:
+            n = min(maxcount - count, self.chunksize)
+            start = offset + count * layout.length
+            same = np.ones(n, bool)
+            for first, last in layout.signature:
+                rows = np.lib.stride_tricks.as_strided(buf[start + first:], (n, last - first), (layout.length, 1))
+                same &= (rows == buf[offset + first:offset + last]).all(axis=1)
+            if layout.nsumoffset is not None:
+                nsum = np.ndarray(n, '>i4', buf, start + layout.nsumoffset, (layout.length,))
+                same &= (nsum > 0) == layout.nsumpositive
+            matching = n if same.all() else int(np.argmin(same))
+            count += matching
+            if matching < n:
+                break
+        return count
+
+    def scan(self):
+        """Find the runs of frames with the same layout. Returns a list of (byte offset, layout, number of frames).
+
+        An incomplete frame at the end of the file (e.g. when the simulation is still running) is ignored."""
+        with open(self.filename, 'rb') as f:
+            with _mapped(f) as mm:
+                self.runs, self.end = self._scan(mm, self.dataoffset)
+        return self.runs
+
+    def _scan(self, mm, pos):
+        """The runs of frames from byte offset `pos` and the byte offset after the last complete frame"""
+        runs = []
+        if mm is None:
+            return runs, pos
+        if self.realsize is None:
+            # the file had no frames when it was opened
+            self.realsize = self._detect_realsize(mm)
+            if self.realsize is None:
+                return runs, pos
+        buf = np.frombuffer(mm, np.uint8)
+        try:
+            while pos < len(mm):
+                try:
+                    layout = self._frame_layout(mm, pos)
+                except struct.error:
+                    break
+                if pos + layout.length > len(mm):
+                    break
+                if layout.nterms not in [0, len(self.names)]:
+                    raise ValueError('Inconsistent number of energy terms at byte offset {:d} in file {}'.format(
+                        pos, self.filename))
+                count = self._run_length(buf, pos, layout, (len(mm) - pos) // layout.length)
+                runs.append((pos, layout, count))
+                pos += count * layout.length
+        finally:
+            del buf
+        return runs, pos
+
+    def term_indices(self, terms) -> list:
+        """Indices of the terms given by name or index"""
+        indices = []
+        for term in terms:
+            if isinstance(term, str):
+                try:
+                    term = self.names.index(term)
+                except ValueError:
+                    raise ValueError('Unknown energy term: {}'.format(term))
+            elif not (-len(self.names) <= term < len(self.names)):
+                raise ValueError('Invalid energy term index: {:d}'.format(term))
+            indices.append(term % len(self.names))
+        return indices
+
+    def read(self, terms=None, tmin=None, tmax=None):
+        """Read the energy terms.
+
+        :param terms: names or indices of the terms to read, all terms if None
+        :param tmin: the first time to read (inclusive), None for the beginning of the file
+        :param tmax: the last time to read (inclusive), None for the end of the file
+        :return: times (nframes), values (nframes, nterms) and the names of the terms
+
+        Frames without energy terms (e.g. which only contain free energy data) are skipped.
+        """
+        columns = list(range(len(self.names))) if terms is None else self.term_indices(terms)
+        if self.runs is None:
+            self.scan()
+        with open(self.filename, 'rb') as f:
+            with _mapped(f) as mm:
+                times, values = self._decode(mm, columns, tmin, tmax)
+        return times, values, [self.names[c] for c in columns]
+
+    def read_appended(self, terms=None):
+        """Read the frames appended to the file since the previous scan() (or read() or read_appended() call). Only
+        the new part of the file is scanned and decoded. Returns the same as read().
+
+        If the file became shorter (e.g. it was overwritten), ValueError is raised."""
+        columns = list(range(len(self.names))) if terms is None else self.term_indices(terms)
+        if self.runs is None:
+            self.runs, self.end = [], self.dataoffset
+        with open(self.filename, 'rb') as f:
+            with _mapped(f) as mm:
+                if (0 if mm is None else len(mm)) < self.end:
+                    raise ValueError('File {} became shorter'.format(self.filename))
+                runs, self.end = self._scan(mm, self.end)
+                self.runs.extend(runs)
+                times, values = self._decode(mm, columns, None, None, runs)
+        return times, values, [self.names[c] for c in columns]
+
+    def _decode(self, mm, columns, tmin, tmax, runs=None):
+        selections = []
+        for offset, layout, count in (self.runs if runs is None else runs):
+            if not layout.nterms:
+                continue
+            times = np.ndarray(count, layout.timedtype, mm, offset + layout.timeoffset, (layout.length,))
+            selected = np.ones(count, bool)
+            if tmin is not None:
+                selected &= times >= tmin
+            if tmax is not None:
+                selected &= times <= tmax
+            selections.append((offset, layout, count, np.flatnonzero(selected)))
+        nframes = sum(len(s[3]) for s in selections)
+        outtimes = np.empty(nframes, np.float64)
+        outvalues = np.empty((nframes, len(columns)), np.float64)
+        n = 0
+        for offset, layout, count, selected in selections:
+            realdtype = '>f{:d}'.format(self.realsize)
+            times = np.ndarray(count, layout.timedtype, mm, offset + layout.timeoffset, (layout.length,))
+            energies = np.ndarray((count, layout.nterms), realdtype, mm, offset + layout.energyoffset,
+                                  (layout.length, layout.stride))
+            outtimes[n:n + len(selected)] = times[selected]
+            outvalues[n:n + len(selected)] = energies[np.ix_(selected, columns)]
+            n += len(selected)
+        return outtimes, outvalues
+
+
+class _mapped(object):
+    """Read-only memory map of a file (None for empty files), which tolerates numpy arrays still referring to it on
+    closing: then it is released when they are garbage collected."""
+
+    def __init__(self, f):
+        self.f = f
+        self.mm = None
+
+    def __enter__(self):
+        f = self.f
+        f.seek(0, 2)
+        if f.tell():
+            self.mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        return self.mm
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if self.mm is not None:
+            try:
+                self.mm.close()
+            except BufferError:
+                pass
+
+
+def _xdr_string(data, pos):
+    """Read an XDR string: its length and the characters, padded to 4 bytes. Returns the string and the new
+    position."""
+    length, = struct.unpack_from('>I', data, pos)
+    pos += 4
+    if pos + length > len(data):
+        raise struct.error('string beyond the end of the buffer')
+    return bytes(data[pos:pos + length]).decode('utf-8', errors='replace'), pos + (length + 3) // 4 * 4
+
+
+def read_parts(filenames, terms=None, tmin=None, tmax=None):
+    """Read the energies from the parts of a continued simulation (e.g. md.edr, md.part0002.edr, ...) and stitch
+    them together in time order.
+
+    The first frame of a continuation part repeats the last frame of the previous part: frames which are not later
+    than the end of the previous part are dropped. Returns the same as EDRFile.read()."""
+    parts = []
+    for filename in filenames:
+        parts.append(EDRFile(filename).read(terms, tmin, tmax))
+    if not parts:
+        raise ValueError('No .edr files given')
+    names = parts[0][2]
+    for filename, (times, values, partnames) in zip(filenames, parts):
+        if partnames != names:
+            raise ValueError('The energy terms in file {} differ from those in file {}'.format(filename, filenames[0]))
+    parts = [p for p in parts if len(p[0])]
+    parts.sort(key=lambda p: p[0][0])
+    kept = []
+    end = -np.inf
+    for times, values, partnames in parts:
+        later = times > end
+        kept.append((times[later], values[later]))
+        if later.any():
+            end = times[later][-1]
+    if not kept:
+        return np.zeros(0), np.zeros((0, len(names))), names
+    return np.concatenate([k[0] for k in kept]), np.concatenate([k[1] for k in kept]), names
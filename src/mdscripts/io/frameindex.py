@@ -0,0 +1,212 @@
+"""Persistent byte offset indices for random access into large trajectory and data files.
+
+The supported kinds of files are:
+
+- 'gro': multi-frame .gro files, one record per frame
+- 'xvg': .xvg files, one record per data row (comment and legend lines are not records)
+- 'xtc': .xtc trajectories, one record per frame
+
+The index is saved in a sidecar file next to the indexed file, and is rebuilt automatically if the size or the
+modification time of the indexed file changes.
+"""
+import mmap
+import os
+import re
+import struct
+
+import numpy as np
+
+from .sidecar import load_sidecar, save_sidecar, sidecar_filename
+
+
+class FrameIndex(object):
+    """Byte offsets of the records (frames or data rows) in a file, with random access through a memory map.
+
+    Record #i spans the bytes `offsets[i]:offsets[i + 1]`. In .xvg files the span of a record can include comment
+    lines following the data row.
+    """
+    version = 1
+    chunksize = 1 << 20
+
+    def __init__(self, filename, offsets, kind):
+        self.filename = filename
+        self.offsets = offsets
+        self.kind = kind
+        self._file = None
+        self._mmap = None
+
+    @staticmethod
+    def sidecar_filename(filename):
+        return sidecar_filename(filename, '.offsets.npz')
+
+    @classmethod
+    def for_file(cls, filename, kind=None, rebuild=False):
+        """Get the index of a file, either from its sidecar file or by building (and saving) it anew.
+
+        If `kind` is None, it is guessed from the file name extension."""
+        if kind is None:
+            kind = os.path.splitext(filename)[1][1:].lower()
+        if kind not in ['gro', 'xvg', 'xtc']:
+            raise ValueError('Unsupported file kind: {}'.format(kind))
+        stat = os.stat(filename)
+        sidecar = cls.sidecar_filename(filename)
+        if not rebuild:
+            saved = load_sidecar(sidecar, version=cls.version, kind=kind, size=stat.st_size,
+                                 mtime_ns=stat.st_mtime_ns)
+            if saved is not None and 'offsets' in saved:
+                return cls(filename, saved['offsets'], kind)
+        index = cls.build(filename, kind)
+        # if the sidecar file cannot be written, the index is still usable, only not persistent
+        save_sidecar(sidecar, offsets=index.offsets, kind=kind, size=stat.st_size, mtime_ns=stat.st_mtime_ns,
+                     version=cls.version)
+        return index
+
+    @classmethod
+    def build(cls, filename, kind):
+        """Build the index by scanning the file."""
+        with open(filename, 'rb') as f:
+            if os.fstat(f.fileno()).st_size == 0:
+                return cls(filename, np.zeros(1, np.int64), kind)
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                buf = np.frombuffer(mm, np.uint8)
+                try:
+                    if kind == 'gro':
+                        offsets = cls._gro_offsets(mm, buf)
+                    elif kind == 'xvg':
+                        offsets = cls._xvg_offsets(buf)
+                    elif kind == 'xtc':
+                        offsets = cls._xtc_offsets(mm)
+                    else:
+                        raise ValueError('Unsupported file kind: {}'.format(kind))
+                finally:
+                    # the memory map cannot be closed while it is exported to a numpy array
+                    del buf
+        return cls(filename, offsets, kind)
+
+    @classmethod
+    def _skip_lines(cls, mm, buf, start, nlines):
+        """Return the offset after `nlines` lines starting at `start`."""
+        pos = start
+        while nlines > 0:
+            if pos >= len(buf):
+                raise ValueError('Unexpected end of file')
+            if nlines == 1:
+                eol = mm.find(b'\n', pos)
+                return eol + 1 if eol >= 0 else len(buf)
+            newlines = np.flatnonzero(buf[pos:pos + cls.chunksize] == ord('\n'))
+            if len(newlines) >= nlines:
+                return pos + int(newlines[nlines - 1]) + 1
+            nlines -= len(newlines)
+            pos += cls.chunksize
+        return pos
+
+    @classmethod
+    def _gro_offsets(cls, mm, buf):
+        offsets = []
+        pos = 0
+        while pos < len(buf):
+            countlinestart = cls._skip_lines(mm, buf, pos, 1)
+            if countlinestart >= len(buf) and not mm[pos:].strip():
+                # trailing blank line
+                break
+            atomsstart = cls._skip_lines(mm, buf, countlinestart, 1)
+            try:
+                natoms = int(mm[countlinestart:atomsstart])
+            except ValueError:
+                raise ValueError('Invalid number of atoms at byte offset {:d}'.format(countlinestart))
+            offsets.append(pos)
+            # the atom lines and the box line
+            pos = cls._skip_lines(mm, buf, atomsstart, natoms + 1)
+        offsets.append(pos)
+        return np.array(offsets, np.int64)
+
+    @classmethod
+    def _xvg_offsets(cls, buf):
+        rowstarts = []
+        pos = 0
+        notrows = np.frombuffer(b'#@&\r\n', np.uint8)
+        while pos < len(buf):
+            chunk = buf[pos:pos + cls.chunksize]
+            newlines = np.flatnonzero(chunk == ord('\n'))
+            if pos + len(chunk) < len(buf):
+                if not len(newlines):
+                    raise ValueError('Line too long at byte offset {:d}'.format(pos))
+                # only take complete lines, the last one continues in the next chunk
+                chunk = chunk[:newlines[-1] + 1]
+            linestarts = np.concatenate([[0], newlines + 1])
+            linestarts = linestarts[linestarts < len(chunk)]
+            isrow = ~np.isin(chunk[linestarts], notrows)
+            rowstarts.append(linestarts[isrow] + pos)
+            pos += len(chunk)
+        rowstarts.append(np.array([len(buf)]))
+        return np.concatenate(rowstarts).astype(np.int64)
+
+    @classmethod
+    def _xtc_offsets(cls, mm):
+        # hop from header to header, the frames need not be decoded
+        from .xtc import frame_length
+        offsets = [0]
+        while offsets[-1] < len(mm):
+            offsets.append(offsets[-1] + frame_length(mm, offsets[-1]))
+        if offsets[-1] > len(mm):
+            raise ValueError('The last frame is truncated')
+        return np.array(offsets, np.int64)
+
+    def open(self):
+        if self._mmap is None:
+            self._file = open(self.filename, 'rb')
+            self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        return self
+
+    def close(self):
+        if self._mmap is not None:
+            self._mmap.close()
+            self._file.close()
+        self._mmap = None
+        self._file = None
+
+    def __enter__(self):
+        return self.open()
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def read(self, start, stop=None) -> bytes:
+        """Read the records from #`start` to #`stop` (exclusive). If `stop` is None, only record #`start` is read."""
+        if start < 0:
+            start += len(self)
+        if stop is None:
+            stop = start + 1
+        if not (0 <= start < stop <= len(self)):
+            raise IndexError('Record index out of range')
+        self.open()
+        return self._mmap[self.offsets[start]:self.offsets[stop]]
+
+    def time(self, i) -> float:
+        """The time of a record: the first column of an .xvg row, the "t=" field in the title of a .gro frame or the
+        time in the header of an .xtc frame"""
+        if self.kind == 'xtc':
+            return struct.unpack_from('>f', self.read(i), 12)[0]
+        firstline = self.read(i).split(b'\n', 1)[0]
+        if self.kind == 'xvg':
+            return float(firstline.split()[0])
+        m = re.search(rb't=\s*(\S+)', firstline)
+        if m is None:
+            raise ValueError('No time in the title of frame #{:d}'.format(i))
+        return float(m.group(1))
+
+    def search_time(self, t, side='left') -> int:
+        """Find the first record not earlier than `t` (or, if `side` is 'right', the first one later than `t`) by
+        bisection, like numpy.searchsorted(). Times must be nondecreasing."""
+        lo, hi = 0, len(self)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            tmid = self.time(mid)
+            if tmid < t or (side == 'right' and tmid == t):
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
@@ -1,9 +1,23 @@
+import fnmatch
+import io
+import itertools
+import os
+
 import numpy as np
 
+from .frameindex import FrameIndex
+from .sidecar import load_sidecar, save_sidecar, sidecar_filename
+from ..analysis import neighboursearch
+from ..analysis.selection import compile_selection
+
+_SPACE, _MINUS, _POINT, _ZERO = b' -.0'
+
 
 class GROFile(object):
     dtype = np.dtype([('resi', 'i4'), ('resn', 'S6'), ('name', 'S6'), ('idx', 'i4'), ('x', 'f4'),
                       ('y', 'f4'), ('z', 'f4'), ('vx', 'f4'), ('vy', 'f4'), ('vz', 'f4')])
+    # the last name lookup table computed for each name field, tried first on other instances (e.g. the next frame)
+    _shared_name_tables = {}
 
     def __init__(self, comment, boxsize, grodata=None):
         if grodata is not None:
@@ -12,56 +26,175 @@ class GROFile(object):
             self.grodata = np.zeros(0, dtype=self.dtype)
         self.comment = comment
         self.boxsize = boxsize
+        self._residue_starts = None
+        self._name_tables = {}
+
+    @classmethod
+    def load(cls, grofile, cache=True):
+        """Loads the first frame of a .gro file.
+
+        The fixed-width atom records are decoded in bulk. Lines which do not conform to the fixed-width layout are
+        parsed one-by-one with the whitespace-separated fallback parser.
+
+        If `cache` is True, the parsed structure is saved in a binary sidecar file (see cache_filename()), which is
+        loaded instead of parsing the text next time, provided that the .gro file has not changed since.
+        """
+        if cache:
+            gro = cls._load_cache(grofile)
+            if gro is not None:
+                return gro
+        with open(grofile, 'rb') as f:
+            gro = cls._read_frame(f, grofile)
+        if gro is None:
+            raise ValueError('No frame found in file {}'.format(grofile))
+        if cache:
+            gro._save_cache(grofile)
+        return gro
+
+    def save_npz(self, filename, **kwargs):
+        """Save the structure in NumPy's .npz format. Extra keyword arguments are saved as additional arrays."""
+        np.savez(filename, **self._npz_arrays(), **kwargs)
+
+    def _npz_arrays(self):
+        return {'grodata': self.grodata, 'comment': self.comment, 'boxsize': np.array(self.boxsize, np.float64)}
+
+    @classmethod
+    def load_npz(cls, filename):
+        """Load a structure saved by save_npz()"""
+        with np.load(filename) as data:
+            return cls._from_npz(data, filename)
+
+    @classmethod
+    def _from_npz(cls, data, filename):
+        if data['grodata'].dtype != cls.dtype:
+            raise ValueError('Incompatible structured array in file {}'.format(filename))
+        return cls(str(data['comment']), data['boxsize'].tolist(), data['grodata'])
+
+    @staticmethod
+    def cache_filename(grofile):
+        """The name of the binary cache file belonging to a .gro file"""
+        return sidecar_filename(grofile, '.cache.npz')
+
+    @classmethod
+    def _load_cache(cls, grofile):
+        """Load the binary cache of a .gro file if it is up to date and readable, otherwise return None."""
+        stat = os.stat(grofile)
+        cachefile = cls.cache_filename(grofile)
+        data = load_sidecar(cachefile, sourcesize=stat.st_size, sourcemtime_ns=stat.st_mtime_ns)
+        if data is None:
+            return None
+        try:
+            return cls._from_npz(data, cachefile)
+        except (KeyError, ValueError):
+            return None
+
+    def _save_cache(self, grofile):
+        stat = os.stat(grofile)
+        # if it cannot be written (e.g. the directory is not writable), the text is parsed next time
+        save_sidecar(self.cache_filename(grofile), sourcesize=stat.st_size, sourcemtime_ns=stat.st_mtime_ns,
+                     **self._npz_arrays())
+
+    @classmethod
+    def iter_frames(cls, grofile, start=None, stop=None):
+        """Iterate over the frames of a multi-frame .gro file, e.g. a trajectory written by `gmx trjconv`.
+
+        The frames are read one at a time. The structured array of the yielded GROFile instances is reused as long as
+        the number of atoms does not change, i.e. it is overwritten when the next frame is read: make a copy if you
+        need it later.
+
+        If `start` or `stop` is given, only the frames from #`start` to #`stop` (exclusive) are read. The first one is
+        located through the persistent byte offset index of the file (see FrameIndex), and line numbers in error
+        messages are counted from it.
+        """
+        with open(grofile, 'rb') as f:
+            if start is not None or stop is not None:
+                index = FrameIndex.for_file(grofile, 'gro')
+                start = 0 if start is None else min(max(start, 0), len(index))
+                stop = len(index) if stop is None else min(max(stop, start), len(index))
+                f.seek(index.offsets[start])
+            grodata = None
+            lineno = 1
+            iframe = start or 0
+            while stop is None or iframe < stop:
+                gro = cls._read_frame(f, grofile, lineno, grodata)
+                if gro is None:
+                    return
+                grodata = gro.grodata
+                lineno += len(grodata) + 3
+                iframe += 1
+                yield gro
 
     @classmethod
-    def load(cls, grofile):
-        """Loads a .gro file. Currently velocities are not supported."""
-        with open(grofile, 'rt', encoding='utf-8') as f:
-            comment = f.readline()
-            nentries = int(f.readline())
-            grodata = np.zeros(nentries,
-                               dtype=cls.dtype)
-            for i in range(nentries):
-                l = f.readline()
-                try:
-                    resi = int(l[:5])
-                    resn = l[5:10].strip()
-                    atomtype = l[10:15].strip()
-                    atomidx = int(l[15:20])
-                    coords = l[20:].split()
-                    try:
-                        x, y, z, vx, vy, vz = coords
-                    except ValueError:
-                        x, y, z = coords
-                        vx, vy, vz = 0, 0, 0
-                except ValueError:
-                    raise ValueError('Cannot parse line #{:d} in file {}: {}'.format(i + 2, grofile, l))
-                grodata[i] = (
-                    resi, resn, atomtype, atomidx,
-                    float(x), float(y), float(z),
-                    float(vx), float(vy), float(vz))
-            boxsize = [float(x) for x in f.readline().split()]
-            return cls(comment, boxsize, grodata)
-
-    def write(self, filename):
-        """Write a .gro file."""
-        with open(filename, 'wt', encoding='utf-8') as f:
-            f.write(self.comment.strip() + '\n')
-            f.write('{:d}\n'.format(len(self.grodata)))
-            iatom = 0
-            iresidue = 0
-            residue = None
-            for atom in self.grodata:
-                iatom += 1
-                if str(atom['resi']) + atom['resn'].decode('ascii') != residue:
-                    iresidue += 1
-                    residue = str(atom['resi']) + atom['resn'].decode('ascii')
-                f.write(
-                    '{:>8}{:>7}{:>5}{:>8.3f}{:>8.3f}{:8.3f}{:8.3f}{:8.3f}{:8.3f}\n'.format(
-                        residue, atom['atomtype'].decode('ascii'), iatom,
-                        atom['x'], atom['y'], atom['z'],
-                        atom['vx'], atom['vy'], atom['vz']))
-            f.write(''.join(['{:>10.5f}'.format(b) for b in self.boxsize]) + '\n')
+    def load_frame(cls, grofile, frame):
+        """Loads a single frame (counted from 0) of a multi-frame .gro file.
+
+        The frame is located through the persistent byte offset index of the file (see FrameIndex), so only the
+        requested frame is parsed. Line numbers in error messages are counted from the start of the frame.
+        """
+        with FrameIndex.for_file(grofile, 'gro') as index:
+            data = index.read(frame)
+        return cls._read_frame(io.BytesIO(data), '{} (frame #{:d})'.format(grofile, frame))
+
+    @classmethod
+    def _read_frame(cls, f, filename, firstlineno=1, out=None):
+        """Read the next frame from a .gro file opened in binary mode. Returns None at the end of the file.
+
+        `firstlineno` is the line number of the comment line in the file, used in error messages. If `out` is a
+        structured array of the right length, the atom data are read into it instead of a newly allocated array."""
+        comment = f.readline()
+        countline = f.readline()
+        if not countline and not comment.strip():
+            return None
+        comment = comment.decode('utf-8').rstrip('\r\n') + '\n'
+        try:
+            nentries = int(countline)
+        except ValueError:
+            raise ValueError('Cannot parse the number of atoms in line #{:d} of file {}'.format(
+                firstlineno + 1, filename))
+        lines = b''.join(itertools.islice(f, nentries))
+        if out is not None and len(out) == nentries:
+            grodata = out
+        else:
+            grodata = np.zeros(nentries, dtype=cls.dtype)
+        _decode_atoms(lines, grodata, filename, firstlineno + 2)
+        boxsize = [float(x) for x in f.readline().split()]
+        return cls(comment, boxsize, grodata)
+
+    def write(self, filename, velocities=None):
+        """Write a .gro file.
+
+        Atoms are renumbered from 1. Residue and atom numbers wrap around at 100000, as in GROMACS. Velocities are
+        written if `velocities` is True, or if it is None and any of the velocities is nonzero.
+
+        The fixed-width atom records are formatted column-by-column into a single buffer.
+        """
+        if velocities is None:
+            velocities = any(self.grodata[v].any() for v in ['vx', 'vy', 'vz'])
+        natoms = len(self.grodata)
+        fields = [('x', 8, 3), ('y', 8, 3), ('z', 8, 3)]
+        if velocities:
+            fields += [('vx', 8, 4), ('vy', 8, 4), ('vz', 8, 4)]
+        linewidth = 20 + sum([width for field, width, decimals in fields]) + 1
+        block = np.empty((natoms, linewidth), np.uint8)
+        block[:, 0:5], overflow = _fixed_width_text(self.grodata['resi'] % 100000, 5)
+        block[:, 5:10] = _name_text(self.grodata['resn'], 5, leftalign=True)
+        block[:, 10:15] = _name_text(self.grodata['name'], 5, leftalign=False)
+        block[:, 15:20], overflow_ = _fixed_width_text(np.arange(1, natoms + 1) % 100000, 5)
+        overflow |= overflow_
+        col = 20
+        for field, width, decimals in fields:
+            block[:, col:col + width], overflow_ = _fixed_width_text(self.grodata[field], width, decimals)
+            overflow |= overflow_
+            col += width
+        block[:, -1] = ord('\n')
+        if overflow.any():
+            raise ValueError('Atom #{:d} cannot be written in the fixed-width .gro format'.format(
+                np.flatnonzero(overflow)[0] + 1))
+        with open(filename, 'wb') as f:
+            f.write((self.comment.strip() + '\n').encode('utf-8'))
+            f.write('{:d}\n'.format(natoms).encode('ascii'))
+            f.write(block.tobytes())
+            f.write((''.join(['{:>10.5f}'.format(b) for b in self.boxsize]) + '\n').encode('ascii'))
 
     def getresidues(self):
         return set(self.grodata['resn'].tolist())
@@ -69,7 +202,7 @@ class GROFile(object):
     def getatomtypes(self, resn):
         if not isinstance(resn, bytes):
             resn = resn.encode('ascii')
-        return set(self.grodata[self.grodata['resn'] == resn]['atomtype'].tolist())
+        return set(self.grodata[self.grodata['resn'] == resn]['name'].tolist())
 
     def filter_resn(self, resn):
         if not isinstance(resn, bytes):
@@ -83,16 +216,14 @@ class GROFile(object):
         return type(self)(self.comment, self.boxsize, np.concatenate(self.grodata, other.grodata))
 
     def __sub__(self, other):
-        flags = np.empty(len(self.grodata))
-        resid = set(zip([other.resi(), other.resn()]))
-        for i in range(len(self.grodata)):
-            flags[i] = not (self.grodata[i]['resi'], self.grodata[i]['resn']) in resid
-        return type(self)(self.comment, self.boxsize, self.grodata[flags])
+        """Remove the residues which are also present in `other`, identified by residue number and name."""
+        keys, otherkeys = _residue_keys(self.grodata[self.residue_starts()], other.grodata[other.residue_starts()])
+        return self.remove_residues(np.isin(keys, otherkeys))
 
     def filter_atomname(self, atomname):
         if not isinstance(atomname, bytes):
             atomname = atomname.encode('ascii')
-        return type(self)(self.comment, self.boxsize, self.grodata[self.grodata['atomtype'] == atomname])
+        return type(self)(self.comment, self.boxsize, self.grodata[self.grodata['name'] == atomname])
 
     def x(self):
         return self.grodata['x']
@@ -115,16 +246,112 @@ class GROFile(object):
     def resi(self):
         return self.grodata['resi']
 
+    def coordinates(self) -> np.ndarray:
+        """Coordinates as an (natoms, 3) array"""
+        return np.stack([self.grodata['x'], self.grodata['y'], self.grodata['z']], axis=1)
+
+    def neighbour_pairs(self, cutoff):
+        """Find the pairs of atoms closer than `cutoff`, taking the periodic box into account.
+
+        Returns the indices of the atoms in each pair (i < j) and their distance."""
+        return neighboursearch.neighbour_pairs(self.coordinates(), self.boxsize, cutoff)
+
+    def within(self, cutoff, boolflags) -> np.ndarray:
+        """Flag the atoms closer than `cutoff` to any of the flagged atoms, taking the periodic box into account."""
+        coords = self.coordinates()
+        return neighboursearch.within(coords, coords[boolflags], self.boxsize, cutoff)
+
     def resn(self):
         return self.grodata['resn']
 
+    def residue_starts(self) -> np.ndarray:
+        """Indices of the first atoms of the residues.
+
+        A residue is a contiguous run of atoms with the same residue number and name. The boundaries are computed
+        once and cached."""
+        if self._residue_starts is None:
+            resi = self.grodata['resi']
+            resn = self.grodata['resn']
+            changes = np.flatnonzero((resi[1:] != resi[:-1]) | (resn[1:] != resn[:-1])) + 1
+            # the last element is the number of atoms, to simplify computing the residue lengths
+            self._residue_starts = np.concatenate(
+                [[0] if len(self.grodata) else [], changes, [len(self.grodata)]]).astype(np.intp)
+        return self._residue_starts[:-1]
+
+    def residue_lengths(self) -> np.ndarray:
+        """Number of atoms in each residue"""
+        self.residue_starts()
+        return np.diff(self._residue_starts)
+
+    def nresidues(self) -> int:
+        return len(self.residue_starts())
+
+    def atom_residue_index(self) -> np.ndarray:
+        """The index of the residue (counted from 0 in the order of appearance) for each atom"""
+        return np.repeat(np.arange(self.nresidues()), self.residue_lengths())
+
+    def residue_any(self, boolflags: np.ndarray) -> np.ndarray:
+        """For each residue, tell if any of its atoms is flagged."""
+        if not len(self.grodata):
+            return np.zeros(0, bool)
+        return np.logical_or.reduceat(np.asarray(boolflags, bool), self.residue_starts())
+
+    def residue_flags_to_atoms(self, residueflags: np.ndarray) -> np.ndarray:
+        """Expand per-residue values to the atoms of the residues."""
+        return np.repeat(residueflags, self.residue_lengths())
+
     def extend_boolflags_to_residues(self, boolflags: np.array):
-        marked_residues = set(self.grodata['resi'][boolflags])
-        for i in range(len(self.grodata)):
-            if self.grodata[i]['resi'] in marked_residues:
-                boolflags[i] = True
+        """Flag all atoms of the residues which have at least one atom flagged. `boolflags` is updated in place."""
+        boolflags[:] = self.residue_flags_to_atoms(self.residue_any(boolflags))
         return boolflags
 
+    def remove_residues(self, residueflags: np.ndarray):
+        """Remove the flagged residues"""
+        return self.filter_boolflags(~self.residue_flags_to_atoms(np.asarray(residueflags, bool)))
+
+    def residue_centers_of_mass(self, masses=None) -> np.ndarray:
+        """Centers of mass of the residues as an (nresidues, 3) array.
+
+        If `masses` (one for each atom) is not given, all atoms have the same weight, i.e. the geometric centers are
+        returned. Periodic boundary conditions are not taken into account."""
+        if not len(self.grodata):
+            return np.zeros((0, 3))
+        starts = self.residue_starts()
+        if masses is None:
+            masses = np.ones(len(self.grodata))
+        masses = np.asarray(masses, np.float64)
+        coords = self.coordinates() * masses[:, np.newaxis]
+        return np.add.reduceat(coords, starts, axis=0) / np.add.reduceat(masses, starts)[:, np.newaxis]
+
+    def name_table(self, field):
+        """Unique values of a name field ('resn' or 'name') and the index of the value of each atom among them.
+
+        The table is cached. The table most recently computed for any instance is reused if it matches this
+        structure, which costs one vectorized comparison instead of sorting the names."""
+        if field not in self._name_tables:
+            column = self.grodata[field]
+            table = self._shared_name_tables.get(field)
+            if table is None or len(table[1]) != len(column) or not np.array_equal(table[0][table[1]], column):
+                uniques, codes = np.unique(column, return_inverse=True)
+                table = uniques, codes.ravel()
+                GROFile._shared_name_tables[field] = table
+            self._name_tables[field] = table
+        return self._name_tables[field]
+
+    def match_names(self, field, patterns) -> np.ndarray:
+        """Flag the atoms whose name field ('resn' or 'name') matches any of the shell-style patterns"""
+        uniques, codes = self.name_table(field)
+        matching = np.array([any(fnmatch.fnmatchcase(name, p) for p in patterns)
+                             for name in np.char.decode(uniques, 'ascii').tolist()], bool)
+        return matching[codes]
+
+    def select(self, expression) -> np.ndarray:
+        """Boolean mask of the atoms matching a selection expression, see mdscripts.analysis.selection"""
+        return compile_selection(expression)(self)
+
+    def filter_selection(self, expression):
+        return self.filter_boolflags(self.select(expression))
+
     def filter_boolflags(self, boolflags):
         return type(self)(self.comment, self.boxsize, self.grodata[boolflags])
 
@@ -132,4 +359,215 @@ class GROFile(object):
         return len(self.grodata)
 
     def resids(self):
-        return sorted(set(['{:d}{}'.format(g['resi'], g['resn'].decode('ascii')) for g in self.grodata]))
+        residues = self.grodata[self.residue_starts()]
+        return sorted(set(['{:d}{}'.format(r, n) for r, n in zip(
+            residues['resi'].tolist(), np.char.decode(residues['resn'], 'ascii').tolist())]))
+
+
+def _residue_keys(residues: np.ndarray, otherresidues: np.ndarray):
+    """Integer keys of (resi, resn) pairs, comparable between the two arrays"""
+    names, codes = np.unique(np.concatenate([residues['resn'], otherresidues['resn']]), return_inverse=True)
+    keys = residues['resi'].astype(np.int64) * len(names) + codes.ravel()[:len(residues)]
+    otherkeys = otherresidues['resi'].astype(np.int64) * len(names) + codes.ravel()[len(residues):]
+    return keys, otherkeys
+
+
+def _fixed_width_numbers(columns: np.ndarray, allow_blank=False, integer=False):
+    """Decode right-aligned decimal numbers from a 2D array of ASCII codes, one number per row.
+
+    Returns the values (float64) and a boolean array marking the rows which could be decoded. Entirely blank rows
+    decode to zero if `allow_blank` is True and are invalid otherwise. If `integer` is True, decimal points are not
+    accepted."""
+    nrows, width = columns.shape
+    mantissa = np.zeros(nrows, np.int64)
+    nfrac = np.zeros(nrows, np.intp)
+    valid = np.ones(nrows, bool)
+    started = np.zeros(nrows, bool)
+    seenpoint = np.zeros(nrows, bool)
+    negative = np.zeros(nrows, bool)
+    hasdigits = np.zeros(nrows, bool)
+    # scan the columns from left to right, like a simple state machine running on all rows at once.
+    for icol in range(width):
+        c = np.ascontiguousarray(columns[:, icol])
+        digit = c - np.uint8(_ZERO)  # wraps around for characters before '0'
+        isdigit = digit < 10
+        isspace = c == _SPACE
+        ispoint = c == _POINT
+        isminus = c == _MINUS
+        # blanks and the sign are only allowed before the number, at most one decimal point is allowed
+        valid &= isdigit | (ispoint & ~seenpoint & (not integer)) | ((isminus | isspace) & ~started)
+        np.multiply(mantissa, 10, out=mantissa, where=isdigit)
+        np.add(mantissa, digit, out=mantissa, where=isdigit)
+        nfrac += isdigit & seenpoint
+        seenpoint |= ispoint
+        negative |= isminus
+        hasdigits |= isdigit
+        started |= ~isspace
+    if allow_blank:
+        valid &= hasdigits | ~started
+    else:
+        valid &= hasdigits
+    values = mantissa / (10.0 ** np.arange(width + 1))[nfrac]
+    values[negative] *= -1
+    return values, valid
+
+
+def _stripped_names(columns: np.ndarray, dtype):
+    """Strip leading and trailing blanks from fixed-width text fields given as a 2D array of ASCII codes."""
+    width = columns.shape[1]
+    nonblank = columns != _SPACE
+    first = np.argmax(nonblank, axis=1)
+    length = width - first - np.argmax(nonblank[:, ::-1], axis=1)
+    length[~nonblank.any(axis=1)] = 0
+    pos = np.arange(width)
+    shifted = np.take_along_axis(columns, np.minimum(first[:, np.newaxis] + pos, width - 1), axis=1)
+    shifted[pos >= length[:, np.newaxis]] = 0
+    return np.ascontiguousarray(shifted).view('S{:d}'.format(width)).ravel().astype(dtype)
+
+
+def _atom_record_block(buf: np.ndarray, starts: np.ndarray, lengths: np.ndarray, width: int):
+    """Arrange atom lines into a 2D array of ASCII codes, one row per line, at most `width` columns wide.
+
+    Lines shorter than the result are padded with blanks."""
+    width = min(width, int(lengths.max()))
+    stride = int(starts[1] - starts[0]) if len(starts) > 1 else 0
+    if (lengths >= width).all() and (np.diff(starts) == stride).all():
+        # all lines have the same length: the record block is a view of the buffer
+        return np.lib.stride_tricks.as_strided(
+            buf[starts[0]:], shape=(len(starts), width), strides=(stride, 1), writeable=False)
+    pos = np.arange(width)
+    block = buf[np.minimum(starts[:, np.newaxis] + pos, len(buf) - 1)]
+    block[pos >= lengths[:, np.newaxis]] = _SPACE
+    return block
+
+
+def _block_columns(block: np.ndarray, start: int, end: int):
+    """Columns `start`:`end` of a record block, padded with blanks if the block is narrower."""
+    if end <= block.shape[1]:
+        return block[:, start:end]
+    columns = np.full((block.shape[0], end - start), _SPACE, np.uint8)
+    if start < block.shape[1]:
+        columns[:, :block.shape[1] - start] = block[:, start:]
+    return columns
+
+
+def _fixed_width_text(values: np.ndarray, width: int, decimals=0):
+    """Format numbers right-aligned into a 2D array of ASCII codes, like the format string '%{width}.{decimals}f'.
+
+    Returns the formatted array and a boolean array marking the numbers which do not fit in the field."""
+    negative = np.signbit(values) if decimals else (values < 0)
+    intpart = np.rint(np.abs(values.astype(np.float64)) * 10 ** decimals).astype(np.int64)
+    text = np.full((len(values), width), _SPACE, np.uint8)
+    if decimals:
+        # fractional digits and the decimal point are at fixed positions
+        for col in range(width - 1, width - 1 - decimals, -1):
+            text[:, col] = _ZERO + intpart % 10
+            intpart //= 10
+        text[:, width - 1 - decimals] = _POINT
+        lastintcol = width - 2 - decimals
+    else:
+        lastintcol = width - 1
+    # the sign goes to the left of the most significant digit
+    signcol = np.empty(len(values), np.intp)
+    for col in range(lastintcol, -1, -1):
+        write = (intpart > 0) if col < lastintcol else np.ones(len(values), bool)
+        text[write, col] = _ZERO + intpart[write] % 10
+        signcol[write] = col - 1
+        intpart //= 10
+    overflow = (intpart > 0) | (negative & (signcol < 0))
+    negative &= ~overflow
+    text[np.flatnonzero(negative), signcol[negative]] = _MINUS
+    return text, overflow
+
+
+def _name_text(names: np.ndarray, width: int, leftalign: bool):
+    """Format a bytes array into a 2D array of ASCII codes, padded with blanks and truncated to `width`."""
+    raw = np.ascontiguousarray(names).view(np.uint8).reshape(len(names), names.dtype.itemsize)[:, :width]
+    if raw.shape[1] < width:
+        raw = np.concatenate([raw, np.zeros((len(names), width - raw.shape[1]), np.uint8)], axis=1)
+    # bytes arrays are padded with NULs
+    length = (raw != 0).sum(axis=1)
+    pos = np.arange(width)
+    if leftalign:
+        return np.where(pos < length[:, np.newaxis], raw, _SPACE).astype(np.uint8)
+    shift = (width - length)[:, np.newaxis]
+    shifted = np.take_along_axis(raw, np.maximum(pos - shift, 0), axis=1)
+    return np.where(pos >= shift, shifted, _SPACE).astype(np.uint8)
+
+
+def _parse_atom_line(line: str):
+    """Parse a single atom line of a .gro file with the whitespace-separated fallback parser."""
+    resi = int(line[:5])
+    resn = line[5:10].strip()
+    atomtype = line[10:15].strip()
+    atomidx = int(line[15:20])
+    coords = line[20:].split()
+    try:
+        x, y, z, vx, vy, vz = coords
+    except ValueError:
+        x, y, z = coords
+        vx, vy, vz = 0, 0, 0
+    return (resi, resn, atomtype, atomidx,
+            float(x), float(y), float(z),
+            float(vx), float(vy), float(vz))
+
+
+def _decode_atoms(lines: bytes, grodata: np.ndarray, filename, firstlineno):
+    """Decode the atom lines of a .gro frame into the structured array `grodata`.
+
+    `firstlineno` is the line number of the first atom line in the file, used in error messages."""
+    natoms = len(grodata)
+    if not natoms:
+        return grodata
+    buf = np.frombuffer(lines, np.uint8)
+    ends = np.flatnonzero(buf == ord('\n'))
+    if len(ends) < natoms and (len(buf) == 0 or buf[-1] != ord('\n')):
+        # the last line is not terminated
+        ends = np.append(ends, len(buf))
+    if len(ends) < natoms:
+        raise ValueError('Unexpected end of file {} after line #{:d}'.format(filename, firstlineno + len(ends) - 1))
+    ends = ends[:natoms]
+    starts = np.empty_like(ends)
+    starts[:1] = 0
+    starts[1:] = ends[:-1] + 1
+    lengths = ends - starts
+    lengths -= (lengths > 0) & (buf[np.maximum(ends - 1, 0)] == ord('\r'))
+    # the width of the coordinate fields is the distance between the decimal points, as in GROMACS.
+    firstline = lines[starts[0]:ends[0]]
+    point1 = firstline.find(b'.', 20)
+    point2 = firstline.find(b'.', point1 + 1)
+    fieldwidth = point2 - point1 if (point1 >= 0 and point2 >= 0) else 8
+    valid = np.empty(natoms, bool)
+    # decode in chunks which fit in the CPU cache
+    chunksize = 65536
+    for i in range(0, natoms, chunksize):
+        block = _atom_record_block(buf, starts[i:i + chunksize], lengths[i:i + chunksize], 20 + 6 * fieldwidth)
+        valid[i:i + chunksize] = _decode_atom_records(block, fieldwidth, grodata[i:i + chunksize])
+    badlines = []
+    for i in np.flatnonzero(~valid):
+        line = lines[starts[i]:ends[i]].decode('utf-8')
+        try:
+            grodata[i] = _parse_atom_line(line)
+        except ValueError:
+            badlines.append(i + firstlineno)
+    if badlines:
+        raise ValueError('Cannot parse line(s) {} in file {}'.format(
+            ', '.join('#{:d}'.format(l) for l in badlines), filename))
+    return grodata
+
+
+def _decode_atom_records(block: np.ndarray, fieldwidth: int, grodata: np.ndarray):
+    """Decode a block of fixed-width atom records into `grodata`. Returns a boolean array of the valid records."""
+    resi, valid = _fixed_width_numbers(_block_columns(block, 0, 5), integer=True)
+    grodata['resi'] = resi
+    grodata['resn'] = _stripped_names(_block_columns(block, 5, 10), grodata.dtype['resn'])
+    grodata['name'] = _stripped_names(_block_columns(block, 10, 15), grodata.dtype['name'])
+    idx, valid_ = _fixed_width_numbers(_block_columns(block, 15, 20), integer=True)
+    grodata['idx'] = idx
+    valid &= valid_
+    for i, field in enumerate(['x', 'y', 'z', 'vx', 'vy', 'vz']):
+        values, valid_ = _fixed_width_numbers(
+            _block_columns(block, 20 + i * fieldwidth, 20 + (i + 1) * fieldwidth), allow_blank=(i >= 3))
+        grodata[field] = values
+        valid &= valid_
+    return valid
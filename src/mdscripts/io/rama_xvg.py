@@ -1,12 +1,89 @@
 import numpy as np
 
+from .frameindex import FrameIndex
+from .xvg import XVGFile
 
-def load_rama_xvg(filename):
-    data = []
-    with open(filename, 'rt', encoding='utf-8') as f:
-        for l in f:
-            if l.startswith('#') or l.startswith('@'):
-                continue
-            phi, psi, resn = l.split()
-            data.append((float(phi), float(psi), resn))
-    return np.array(data, dtype=[('phi', 'f'), ('psi', 'f'), ('resn', 'S6')])
+
+class RamachandranData(object):
+    """Backbone dihedrals of a trajectory: `phi` and `psi` are float32 arrays of shape (nframes, nresidues), in
+    degrees. `residues` holds the names of the residues (e.g. 'ALA-2') in the order of the columns.
+
+    The angles of a frame (`frame()`) and of a residue (`residue()`) are views, no data are copied.
+    """
+
+    def __init__(self, phi, psi, residues):
+        self.phi = np.asarray(phi, np.float32)
+        self.psi = np.asarray(psi, np.float32)
+        self.residues = list(residues)
+        if self.phi.shape != self.psi.shape or self.phi.ndim != 2 or self.phi.shape[1] != len(self.residues):
+            raise ValueError('The phi and psi arrays must have the shape (nframes, nresidues)')
+        # the column of each residue
+        self.index = {r: i for i, r in enumerate(self.residues)}
+
+    def __len__(self):
+        return self.phi.shape[0]
+
+    @property
+    def nresidues(self):
+        return self.phi.shape[1]
+
+    def frame(self, position):
+        """The phi and psi angles of all residues in a frame"""
+        return self.phi[position], self.psi[position]
+
+    def residue(self, name):
+        """The phi and psi angles of a residue in all frames"""
+        column = self.index[name]
+        return self.phi[:, column], self.psi[:, column]
+
+
+def load_rama_xvg(filename, start=None, stop=None):
+    """Load an .xvg file written by `gmx rama`: the rows of each frame are the residues, always in the same order.
+
+    If `start` or `stop` is given, only the frames from #`start` to #`stop` (exclusive) are read, which are located
+    through the row index of the file (see FrameIndex)."""
+    if start is None and stop is None:
+        xvg = XVGFile.load(filename)
+    else:
+        nresidues = rama_xvg_residues(filename)
+        start = 0 if start is None else start
+        xvg = XVGFile.load(filename, start=start * nresidues, stop=None if stop is None else stop * nresidues)
+    names = _rama_names(xvg, filename)
+    if not len(names):
+        return RamachandranData(np.zeros((0, 0)), np.zeros((0, 0)), [])
+    nresidues = _residues_per_frame(names)
+    if len(names) % nresidues or (names.reshape(-1, nresidues) != names[:nresidues]).any():
+        raise ValueError('The residues are not the same in every frame of file {}'.format(filename))
+    return RamachandranData(xvg.data[:, 0].reshape(-1, nresidues), xvg.data[:, 1].reshape(-1, nresidues),
+                            [r.decode('utf-8') for r in names[:nresidues]])
+
+
+def rama_xvg_residues(filename):
+    """The number of residues (rows in a frame) in an .xvg file written by `gmx rama`, found from the first rows"""
+    nrows = 256
+    while True:
+        xvg = XVGFile.load(filename, stop=nrows)
+        names = _rama_names(xvg, filename)
+        if len(names) < nrows or (names[1:] == names[0]).any():
+            return _residues_per_frame(names)
+        nrows *= 4
+
+
+def count_rama_xvg_frames(filename):
+    """The number of frames in an .xvg file written by `gmx rama`, from the row index of the file"""
+    nresidues = rama_xvg_residues(filename)
+    return len(FrameIndex.for_file(filename, 'xvg')) // nresidues if nresidues else 0
+
+
+def _rama_names(xvg, filename):
+    if xvg.data.shape[1] != 2 or xvg.text is None or xvg.text.shape[1] != 1:
+        raise ValueError('Invalid Ramachandran data file: {}'.format(filename))
+    return xvg.text[:, 0]
+
+
+def _residues_per_frame(names):
+    # the first frame ends where the first residue comes again
+    if not len(names):
+        return 0
+    repeated = np.flatnonzero(names == names[0])
+    return int(repeated[1]) if len(repeated) > 1 else len(names)
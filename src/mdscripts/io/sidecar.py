@@ -0,0 +1,51 @@
+"""Sidecar files: caches of data derived from a file (e.g. its parsed contents or a byte offset index), saved in NumPy's
+.npz format next to it, in a hidden file.
+
+Sidecar files are only an optimization: if one cannot be read (it is missing, out of date or broken) or written (e.g.
+the directory is not writable), the data are computed from the original file as if there was no sidecar.
+"""
+import os
+import threading
+
+import numpy as np
+
+
+def sidecar_filename(filename, suffix):
+    """The name of a sidecar file: `filename` prefixed with a dot and with `suffix` appended"""
+    path, fname = os.path.split(filename)
+    return os.path.join(path, '.' + fname + suffix)
+
+
+def load_sidecar(filename, **expected):
+    """Load the arrays from a sidecar file into a dict, provided that the scalar entries named in `expected` have the
+    given values (e.g. the size and the modification time of the original file).
+
+    Returns None if the file does not exist, is out of date or cannot be read, e.g. because it was truncated."""
+    try:
+        with np.load(filename) as saved:
+            if any(saved[key].item() != value for key, value in expected.items()):
+                return None
+            return {key: saved[key] for key in saved.files}
+    except Exception:
+        return None
+
+
+def save_sidecar(filename, **arrays):
+    """Save arrays in a sidecar file. Returns True on success, False if the file could not be written.
+
+    The data are written to a temporary file in the same directory first, which then replaces the sidecar file, so
+    an interrupted write does not leave a broken sidecar file behind."""
+    tmpname = '{}.{:d}.{:d}.tmp'.format(filename, os.getpid(), threading.get_ident())
+    try:
+        with open(tmpname, 'wb') as f:
+            np.savez(f, **arrays)
+        os.replace(tmpname, filename)
+    except BaseException as exc:
+        try:
+            os.remove(tmpname)
+        except OSError:
+            pass
+        if isinstance(exc, OSError):
+            return False
+        raise
+    return True
@@ -0,0 +1,7 @@
+def print_table(header, rows):
+    """Print a table of strings (a header row and a list of rows) aligned in columns: the first column to the left,
+    the others to the right"""
+    rows = [header] + list(rows)
+    widths = [max(len(row[i]) for row in rows) for i in range(len(header))]
+    for row in rows:
+        print('  '.join([row[0].ljust(widths[0])] + [x.rjust(w) for x, w in zip(row[1:], widths[1:])]))
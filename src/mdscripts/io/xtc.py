@@ -0,0 +1,296 @@
+"""Reader for GROMACS .xtc trajectories.
+
+An .xtc frame is an XDR (big endian) header followed by the coordinates, which are compressed with the "xtc3"
+algorithm of libxdrfile: coordinates are rounded to integers (the precision is usually 1000, i.e. 0.001 nm) and
+packed in a bit stream, where atoms close to the previous one are coded as small differences in runs.
+
+The header of each frame tells the length of the compressed data, so frames can be skipped without decoding them.
+"""
+import struct
+
+import numpy as np
+
+from .frameindex import FrameIndex
+
+MAGIC = 1995
+
+# the magic integers of the xtc3 algorithm: the ranges which can be encoded on a given number of bits for 3 integers
+_MAGICINTS = [
+    0, 0, 0, 0, 0, 0, 0, 0, 0, 8, 10, 12, 16, 20, 25, 32, 40, 50, 64,
+    80, 101, 128, 161, 203, 256, 322, 406, 512, 645, 812, 1024, 1290,
+    1625, 2048, 2580, 3250, 4096, 5060, 6501, 8192, 10321, 13003,
+    16384, 20642, 26007, 32768, 41285, 52015, 65536, 82570, 104031,
+    131072, 165140, 208063, 262144, 330280, 416127, 524287, 660561,
+    832255, 1048576, 1321122, 1664510, 2097152, 2642245, 3329021,
+    4194304, 5284491, 6658042, 8388607, 10568983, 13316085, 16777216]
+_FIRSTIDX = 9
+
+_HEADER = struct.Struct('>iiif9fi')
+_COMPRESSEDHEADER = struct.Struct('>f3i3iii')
+
+
+class XTCFrame(object):
+    def __init__(self, step, time, box, coords, precision):
+        self.step = step
+        self.time = time
+        self.box = box
+        self.coords = coords
+        self.precision = precision
+
+    def __len__(self):
+        return len(self.coords)
+
+
+def frame_length(data, offset=0) -> int:
+    """The length in bytes of the frame starting at `offset` in `data`, read from its header."""
+    magic, natoms = struct.unpack_from('>ii', data, offset)
+    if magic != MAGIC:
+        raise ValueError('Invalid magic number in .xtc frame at offset {:d}'.format(offset))
+    if natoms <= 9:
+        return _HEADER.size + 12 * natoms
+    nbytes = struct.unpack_from('>i', data, offset + _HEADER.size + _COMPRESSEDHEADER.size - 4)[0]
+    return _HEADER.size + _COMPRESSEDHEADER.size + (nbytes + 3) // 4 * 4
+
+
+def decode_frame(data) -> XTCFrame:
+    """Decode an .xtc frame from a bytes-like object"""
+    magic, natoms, step, time, *box, natoms2 = _HEADER.unpack_from(data, 0)
+    if magic != MAGIC:
+        raise ValueError('Invalid magic number in .xtc frame')
+    if natoms != natoms2:
+        raise ValueError('Inconsistent number of atoms in .xtc frame header')
+    box = np.array(box, np.float32).reshape(3, 3)
+    if natoms <= 9:
+        coords = np.frombuffer(data, '>f4', 3 * natoms, _HEADER.size).astype(np.float32).reshape(natoms, 3)
+        return XTCFrame(step, time, box, coords, -1.0)
+    precision, *minmax, smallidx, nbytes = _COMPRESSEDHEADER.unpack_from(data, _HEADER.size)
+    start = _HEADER.size + _COMPRESSEDHEADER.size
+    intcoords = _decompress(bytes(data[start:start + nbytes]), natoms, minmax[:3], minmax[3:], smallidx)
+    coords = intcoords.astype(np.float32) * np.float32(1.0 / precision)
+    return XTCFrame(step, time, box, coords, precision)
+
+
+def _decompress(data, natoms, minint, maxint, smallidx):
+    """Decode the xtc3 bit stream to an (natoms, 3) array of integer coordinates.
+
+    This follows xdrfile_decompress_coord_float() of libxdrfile. The bit stream is read most significant bit first.
+    The stream consists of records: an atom coded relative to the minimum, a flag bit telling if the length of the
+    run (and the size of the small integers) changes, and the run of small differences to the previous atom. Only
+    the records with the flag set must be walked through one by one: between them the records are equally long, so
+    they are located by a vectorized search for the next flag. The integers are then unpacked and the runs are summed
+    up with NumPy.
+    """
+    # padding, so that reading a few bytes beyond the last bit is always possible
+    data = data + bytes(8)
+    buf = np.frombuffer(data, np.uint8)
+    sizeint = [maxint[i] - minint[i] + 1 for i in range(3)]
+    if (sizeint[0] | sizeint[1] | sizeint[2]) > 0xffffff:
+        # large ranges: the three integers are coded separately
+        bitsizeint = [min(s.bit_length(), 32) for s in sizeint]
+        bitsize = sum(bitsizeint)
+    else:
+        bitsizeint = None
+        bitsize = (sizeint[0] * sizeint[1] * sizeint[2]).bit_length()
+    smaller = _MAGICINTS[max(_FIRSTIDX, smallidx - 1)] // 2
+    smallnum = _MAGICINTS[smallidx] // 2
+    # the bit positions of the records and of their runs, the size and the offset of the small integers and the
+    # length of the runs: records with the flag set one by one, the others in arrays
+    records = []
+    stretches = []
+    stretchstates = []
+    bitpos = 0
+    # the length of the run is kept for the next atoms until a new one is read
+    run = 0
+    # the number of records searched for the next flag at once
+    block = 16
+    search = False
+    i = 0
+    while i < natoms:
+        if search:
+            nsmall = run // 3
+            length = bitsize + 1 + smallidx * nsmall
+            # the records after a flagged one are not where they are searched for, they may even be beyond the end
+            count = min(block, -(-(natoms - i) // (nsmall + 1)), (8 * len(buf) - 1 - bitpos - bitsize) // length + 1)
+            flagpos = bitpos + bitsize + length * np.arange(count, dtype=np.int64)
+            flags = (buf[flagpos >> 3] >> (7 - (flagpos & 7))) & 1
+            nplain = int(flags.argmax()) if flags.any() else count
+            stretches.append(flagpos[:nplain])
+            stretchstates.append((smallidx, smallnum, nsmall, nplain))
+            bitpos += length * nplain
+            i += nplain * (nsmall + 1)
+            block = min(block * 2, 1 << 16) if nplain == count else 16
+            search = False
+            continue
+        records.append(bitpos)
+        bitpos += bitsize
+        i += 1
+        flag = (data[bitpos >> 3] >> (7 - (bitpos & 7))) & 1
+        bitpos += 1
+        is_smaller = 0
+        if flag:
+            byte = bitpos >> 3
+            run = ((data[byte] << 8 | data[byte + 1]) >> (11 - (bitpos & 7))) & 0x1f
+            bitpos += 5
+            is_smaller = run % 3
+            run -= is_smaller
+            is_smaller -= 1
+        nsmall = run // 3
+        records.extend((bitpos, smallidx, smallnum, nsmall))
+        bitpos += smallidx * nsmall
+        i += nsmall
+        smallidx += is_smaller
+        if is_smaller < 0:
+            smallnum = smaller
+            if smallidx > _FIRSTIDX:
+                smaller = _MAGICINTS[smallidx - 1] // 2
+            else:
+                smaller = 0
+        elif is_smaller > 0:
+            smaller = smallnum
+            smallnum = _MAGICINTS[smallidx] // 2
+        # a run of records without the flag may follow
+        search = not flag
+    records = np.array(records, np.int64).reshape(-1, 5)
+    stretchstates = np.array(stretchstates, np.int64).reshape(-1, 4)
+    flagpos = np.concatenate([np.zeros(0, np.int64)] + stretches)
+    positions, runstart, runbits, runsmallnum, nsmall = np.concatenate([records, np.column_stack(
+        [flagpos - bitsize, flagpos + 1, np.repeat(stretchstates[:, :3], stretchstates[:, 3], axis=0)])]).T
+    order = positions.argsort(kind='stable')
+    positions, runstart, runbits, runsmallnum, nsmall = [
+        a[order] for a in [positions, runstart, runbits, runsmallnum, nsmall]]
+    # the atoms coded relative to the minimum
+    if bitsizeint is None:
+        atoms = _unpackints(data, buf, positions, bitsize, sizeint)
+    else:
+        atoms = np.empty((len(positions), 3), np.int64)
+        for k, nbits in enumerate(bitsizeint):
+            atoms[:, k] = _bits(buf, positions + sum(bitsizeint[:k]), nbits)
+    atoms += np.array(minint, np.int64)
+    # the small differences, each one relative to the previous atom of the run
+    record = np.repeat(np.arange(len(positions)), nsmall)
+    first = np.cumsum(nsmall) - nsmall
+    k = np.arange(len(record)) - first[record]
+    smallpos = runstart[record] + k * runbits[record]
+    steps = np.empty((len(record), 3), np.int64)
+    for nbits in np.unique(runbits[nsmall > 0]).tolist():
+        selected = runbits[record] == nbits
+        steps[selected] = _unpackints(data, buf, smallpos[selected], nbits, [_MAGICINTS[nbits]] * 3)
+    steps -= runsmallnum[record, np.newaxis]
+    # the cumulative sums of the differences in each run, started from the atom of the record
+    steps = np.cumsum(steps, axis=0)
+    if len(steps):
+        steps -= np.concatenate([np.zeros((1, 3), np.int64), steps[:-1]])[first[record]]
+    steps += atoms[record]
+    # the first two atoms of a run are interchanged (better compression of water molecules)
+    start = np.cumsum(nsmall + 1) - (nsmall + 1)
+    result = np.empty((natoms, 3), np.int32)
+    result[start + (nsmall > 0)] = atoms
+    result[start[record] + k + (k > 0)] = steps
+    return result
+
+
+def _bits(buf, positions, nbits):
+    """Read `nbits` (at most 57) bits starting at the bit positions, most significant bit first"""
+    byte = positions >> 3
+    window = np.zeros(len(positions), np.uint64)
+    for k in range(8):
+        window <<= np.uint64(8)
+        window |= buf[byte + k]
+    window >>= (64 - nbits - (positions & 7)).astype(np.uint64)
+    return (window & np.uint64((1 << nbits) - 1)).astype(np.int64)
+
+
+def _unpackints(data, buf, positions, nbits, sizes):
+    """Decode the triplets of integers packed on `nbits` bits at the bit positions, see _decodeints()"""
+    sizez, sizeyz = sizes[2], sizes[1] * sizes[2]
+    if nbits > 57:
+        # does not fit in 64 bits with the bit offset
+        return np.array([_decodeints(data, pos, nbits, sizez, sizeyz) for pos in positions.tolist()],
+                        np.int64).reshape(-1, 3)
+    raw = _bits(buf, positions, nbits).astype(np.uint64)
+    nfull = (nbits - 1) >> 3
+    lastbits = nbits - 8 * nfull
+    # the full bytes come first, the least significant one first
+    value = (raw & np.uint64((1 << lastbits) - 1)) << np.uint64(8 * nfull)
+    for k in range(nfull):
+        value |= ((raw >> np.uint64(lastbits + 8 * (nfull - 1 - k))) & np.uint64(0xff)) << np.uint64(8 * k)
+    xyz = np.empty((len(positions), 3), np.int64)
+    xyz[:, 0], yz = np.divmod(value, np.uint64(sizeyz))
+    xyz[:, 1], xyz[:, 2] = np.divmod(yz, np.uint64(sizez))
+    return xyz
+
+
+def _decodeints(data, bitpos, nbits, sizez, sizeyz):
+    """Decode three integers packed on `nbits` bits as a mixed-radix number.
+
+    The packed number is stored as bytes in little-endian order, each byte written with the most significant bit
+    first. The last (most significant) byte has only the remaining nbits % 8 bits."""
+    byte = bitpos >> 3
+    nb = ((bitpos & 7) + nbits + 7) >> 3
+    value = (int.from_bytes(data[byte:byte + nb], 'big') >> (nb * 8 - (bitpos & 7) - nbits)) & ((1 << nbits) - 1)
+    nfull = (nbits - 1) >> 3
+    if nfull:
+        lastbits = nbits - 8 * nfull
+        value = (int.from_bytes((value >> lastbits).to_bytes(nfull, 'big'), 'little') |
+                 ((value & ((1 << lastbits) - 1)) << (8 * nfull)))
+    yz = value % sizeyz
+    return value // sizeyz, yz // sizez, yz % sizez
+
+
+class XTCReader(object):
+    """Random and sequential access to the frames of an .xtc file.
+
+    Random access (indexing, slicing and len()) uses the persistent byte offset index of the file, see FrameIndex.
+    """
+
+    def __init__(self, filename):
+        self.filename = filename
+        self._index = None
+
+    @property
+    def index(self) -> FrameIndex:
+        if self._index is None:
+            self._index = FrameIndex.for_file(self.filename, 'xtc')
+        return self._index
+
+    def __len__(self):
+        return len(self.index)
+
+    def __getitem__(self, item):
+        if isinstance(item, slice):
+            return [self[i] for i in range(*item.indices(len(self)))]
+        with self.index:
+            return decode_frame(self.index.read(item))
+
+    def iter_frames(self, start=0, stop=None, stride=1):
+        """Iterate over the frames from #`start` to #`stop` (exclusive), taking every `stride`-th one.
+
+        The file is read sequentially from frame #`start`, which is located through the byte offset index of the file
+        (see FrameIndex). Skipped frames are not decoded."""
+        with open(self.filename, 'rb') as f:
+            iframe = 0
+            if start > 0:
+                iframe = min(start, len(self.index))
+                f.seek(self.index.offsets[iframe])
+            while stop is None or iframe < stop:
+                header = f.read(_HEADER.size + _COMPRESSEDHEADER.size)
+                if not header:
+                    return
+                if len(header) < 8:
+                    raise ValueError('Truncated frame #{:d} in file {}'.format(iframe, self.filename))
+                length = frame_length(header + bytes(_HEADER.size + _COMPRESSEDHEADER.size))
+                wanted = iframe >= start and (iframe - start) % stride == 0
+                if length <= len(header) or not wanted:
+                    # the header read can extend into the next frame for very small systems
+                    f.seek(length - len(header), 1)
+                    data = header[:length]
+                else:
+                    data = header + f.read(length - len(header))
+                if wanted:
+                    if len(data) < length:
+                        raise ValueError('Truncated frame #{:d} in file {}'.format(iframe, self.filename))
+                    yield decode_frame(data)
+                iframe += 1
+
+    def __iter__(self):
+        return self.iter_frames()
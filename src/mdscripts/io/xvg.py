@@ -0,0 +1,263 @@
+"""Reader for .xvg files written by GROMACS tools.
+
+The header (comment lines starting with '#' and xmgrace directives starting with '@') is scanned once, then the data
+block is parsed in bulk, chunk by chunk, into a preallocated array. Text columns at the end of the rows (e.g. the
+residue names written by `gmx rama`) are supported.
+"""
+import re
+import warnings
+
+import numpy as np
+
+from .frameindex import FrameIndex
+from ..analysis.timeseries import reserve
+
+_DIRECTIVES = {
+    'title': re.compile(r'^@\s+title\s+"(?P<value>.*)"'),
+    'subtitle': re.compile(r'^@\s+subtitle\s+"(?P<value>.*)"'),
+    'xlabel': re.compile(r'^@\s+xaxis\s+label\s+"(?P<value>.*)"'),
+    'ylabel': re.compile(r'^@\s+yaxis\s+label\s+"(?P<value>.*)"'),
+}
+_LEGEND = re.compile(r'^@\s*s(?P<index>\d+)\s+legend\s+"(?P<value>.*)"')
+_UNIT = re.compile(r'\(([^()]*)\)')
+
+
+class XVGFile(object):
+    """The data and the metadata of an .xvg file.
+
+    `data` is a float64 array of the numeric columns (the first one is usually the time), `text` is a bytes array of
+    the text columns following them or None if there are none. `legends` has one item for each numeric column but
+    the first one (None where the header has no legend).
+    """
+    # the size of the chunks parsed at once, in bytes
+    chunksize = 1 << 22
+
+    def __init__(self, data, text=None, title=None, subtitle=None, xlabel=None, ylabel=None, legends=None):
+        self.data = data
+        self.text = text
+        self.title = title
+        self.subtitle = subtitle
+        self.xlabel = xlabel
+        self.ylabel = ylabel
+        if legends is None:
+            legends = [None] * (data.shape[1] - 1)
+        self.legends = legends
+        # where load() or read_appended() stopped: the file name, the byte offset after the last parsed line and the
+        # numbers of numeric and text columns
+        self.filename = None
+        self.end = None
+        self._columns = None
+        self._buffer = None
+
+    @property
+    def labels(self):
+        """The x label and the legends, with defaults where they are missing from the header"""
+        return [self.xlabel if self.xlabel is not None else 'Time (ps)'] + [
+            legend if legend is not None else 'Column #{:d}'.format(i + 1) for i, legend in enumerate(self.legends)]
+
+    @property
+    def units(self):
+        """The units of the numeric columns, from the parenthesized parts of the axis labels, or None if unknown.
+
+        The y label of `gmx energy` contains the units of the terms, e.g. "(kJ/mol), (K)". If it has a single unit, it
+        is taken for all columns."""
+        xunits = _UNIT.findall(self.xlabel or '')
+        yunits = _UNIT.findall(self.ylabel or '')
+        if len(yunits) == 1:
+            yunits = yunits * len(self.legends)
+        elif len(yunits) != len(self.legends):
+            yunits = [None] * len(self.legends)
+        return [xunits[-1] if xunits else None] + yunits
+
+    def __len__(self):
+        return len(self.data)
+
+    def write(self, filename, fmt='%14.6f'):
+        with open(filename, 'wt', encoding='utf-8') as f:
+            for key, directive in [('title', 'title'), ('subtitle', 'subtitle'), ('xlabel', 'xaxis  label'),
+                                   ('ylabel', 'yaxis  label')]:
+                if getattr(self, key) is not None:
+                    f.write('@    {} "{}"\n'.format(directive, getattr(self, key)))
+            f.write('@TYPE xy\n')
+            for i, legend in enumerate(self.legends):
+                if legend is not None:
+                    f.write('@ s{:d} legend "{}"\n'.format(i, legend))
+            if self.text is None:
+                np.savetxt(f, self.data, fmt=fmt)
+            else:
+                for row, text in zip(self.data, self.text):
+                    f.write(' '.join([fmt % x for x in row] + [t.decode('utf-8') for t in text]) + '\n')
+
+    @classmethod
+    def load(cls, filename, lastline=True, tmin=None, tmax=None, start=None, stop=None):
+        """Load an .xvg file. If `lastline` is False, a last line not terminated by a newline is not read, as it can
+        be incomplete when the file is still being written. It is read by read_appended() when it is complete.
+
+        Only a part of the rows is read if `tmin` and `tmax` (the limits of the first column, inclusive) or `start` and
+        `stop` (row numbers, `stop` is exclusive) are given. The rows are located through the persistent row index of
+        the file (see FrameIndex), the rows before them are not parsed."""
+        metadata = {}
+        legends = {}
+        with open(filename, 'rb') as f:
+            while True:
+                pos = f.tell()
+                line = f.readline()
+                if not line or (not lastline and not line.endswith(b'\n')):
+                    firstrow = None
+                    break
+                stripped = line.strip()
+                if not stripped or stripped.startswith(b'#') or stripped.startswith(b'&'):
+                    continue
+                if not stripped.startswith(b'@'):
+                    firstrow = stripped
+                    f.seek(pos)
+                    break
+                directive = stripped.decode('utf-8', errors='replace')
+                m = _LEGEND.match(directive)
+                if m:
+                    legends[int(m.group('index'))] = m.group('value')
+                    continue
+                for key, regex in _DIRECTIVES.items():
+                    m = regex.match(directive)
+                    if m:
+                        metadata[key] = m.group('value')
+            if firstrow is None:
+                data, text, columns, end = np.zeros((0, 1 + len(legends))), None, None, None
+            else:
+                tokens = firstrow.split()
+                nnumeric = 0
+                for token in tokens:
+                    try:
+                        float(token)
+                    except ValueError:
+                        break
+                    nnumeric += 1
+                if not nnumeric:
+                    raise ValueError('No numeric data in file {}'.format(filename))
+                columns = nnumeric, len(tokens) - nnumeric
+                blockend = None
+                if not (tmin is None and tmax is None and start is None and stop is None):
+                    with FrameIndex.for_file(filename, 'xvg') as index:
+                        first, last = cls._row_range(index, tmin, tmax, start, stop)
+                        f.seek(index.offsets[first])
+                        if last < len(index):
+                            # otherwise up to the end of the file, which can be longer than when it was indexed
+                            blockend = index.offsets[last]
+                data, text, end = cls._read_block(f, filename, nnumeric, len(tokens) - nnumeric, len(firstrow),
+                                                  lastline, blockend)
+        xvg = cls(data, text, legends=[legends.get(i) for i in range(data.shape[1] - 1)], **metadata)
+        xvg.filename, xvg.end, xvg._columns = filename, end, columns
+        return xvg
+
+    @staticmethod
+    def _row_range(index, tmin, tmax, start, stop):
+        """The first and the last + 1 row within the limits given to load()"""
+        first = 0 if start is None else min(max(start, 0), len(index))
+        last = len(index) if stop is None else min(max(stop, 0), len(index))
+        if tmin is not None:
+            first = max(first, index.search_time(tmin))
+        if tmax is not None:
+            last = min(last, index.search_time(tmax, 'right'))
+        return first, max(first, last)
+
+    def read_appended(self):
+        """Read the complete lines appended to the file since load() (or the previous call), which are appended to
+        `data` (and `text`). Returns the number of new rows.
+
+        Rows are appended in place where possible, so the cost depends only on the amount of new data."""
+        if self._columns is None:
+            # there were no data rows yet: read the header again
+            xvg = self.load(self.filename, lastline=False)
+            self.__dict__.update(xvg.__dict__)
+            return len(self.data)
+        with open(self.filename, 'rb') as f:
+            f.seek(0, 2)
+            if f.tell() < self.end:
+                raise ValueError('File {} became shorter'.format(self.filename))
+            f.seek(self.end)
+            data, text, end = self._read_block(f, self.filename, self._columns[0], self._columns[1],
+                                               self.data.shape[1] * 10, False)
+        self.end = end
+        if len(data):
+            nrows = len(self.data)
+            self._buffer = reserve(self.data if self._buffer is None else self._buffer, nrows + len(data))
+            self._buffer[nrows:nrows + len(data)] = data
+            self.data = self._buffer[:nrows + len(data)]
+            if self.text is not None:
+                self.text = np.concatenate([self.text, text.astype(self.text.dtype)])
+        return len(data)
+
+    @classmethod
+    def _read_block(cls, f, filename, nnumeric, ntext, rowlength, lastline=True, stop=None):
+        """Parse the data lines from the current position of `f` up to the byte offset `stop` (the end of the file if
+        None). Returns the numeric and the text columns and the byte offset after the last line read."""
+        ncolumns = nnumeric + ntext
+        start = f.tell()
+        if stop is None:
+            f.seek(0, 2)
+            stop = f.tell()
+            f.seek(start)
+        estimate = (stop - start) // (rowlength + 1) + 1
+        data = np.empty((estimate, nnumeric), np.float64)
+        texts = []
+        nrows = 0
+        end = start
+        remainder = b''
+        while True:
+            chunk = f.read(min(cls.chunksize, stop - f.tell()))
+            if chunk:
+                # only complete lines are parsed, the rest is carried over to the next chunk
+                chunk = remainder + chunk
+                lastnewline = chunk.rfind(b'\n')
+                if lastnewline < 0:
+                    remainder = chunk
+                    continue
+                chunk, remainder = chunk[:lastnewline + 1], chunk[lastnewline + 1:]
+            elif remainder and lastline:
+                chunk, remainder = remainder, b''
+            else:
+                break
+            end += len(chunk)
+            if b'\n#' in chunk or b'\n@' in chunk or b'\n&' in chunk or chunk[:1] in [b'#', b'@', b'&']:
+                chunk = b'\n'.join([l for l in chunk.split(b'\n') if l.strip()[:1] not in [b'#', b'@', b'&']])
+            if ntext:
+                values = np.array(chunk.split())
+                if values.size % ncolumns:
+                    raise ValueError('Inconsistent number of columns in file {}'.format(filename))
+                values = values.reshape(-1, ncolumns)
+                texts.append(values[:, nnumeric:])
+                values = values[:, :nnumeric].astype(np.float64)
+            else:
+                values = cls._parse_numbers(chunk, filename, ncolumns)
+            if nrows + len(values) > len(data):
+                data.resize((max(nrows + len(values), int(len(data) * 1.5)), nnumeric), refcheck=False)
+            data[nrows:nrows + len(values)] = values
+            nrows += len(values)
+        data.resize((nrows, nnumeric), refcheck=False)
+        if not ntext:
+            return data, None, end
+        return data, np.concatenate(texts) if texts else np.zeros((0, ntext), 'S1'), end
+
+    @staticmethod
+    def _parse_numbers(chunk, filename, ncolumns):
+        with warnings.catch_warnings():
+            # numpy warns (older versions) or raises (newer versions) on characters which are not part of a number
+            warnings.simplefilter('error', DeprecationWarning)
+            try:
+                values = np.fromstring(chunk, np.float64, sep=' ')
+            except (ValueError, DeprecationWarning):
+                values = None
+        nrows = chunk.count(b'\n') + (not chunk.endswith(b'\n'))
+        if values is not None and values.size != nrows * ncolumns:
+            # blank lines
+            nrows = sum(1 for l in chunk.split(b'\n') if l.strip())
+        if values is None or values.size != nrows * ncolumns:
+            for line in chunk.split(b'\n'):
+                try:
+                    if line.strip() and len([float(x) for x in line.split()]) != ncolumns:
+                        raise ValueError
+                except ValueError:
+                    raise ValueError('Cannot parse line in file {}: {}'.format(
+                        filename, line.decode('utf-8', errors='replace')))
+            raise ValueError('Cannot parse file {}'.format(filename))
+        return values.reshape(nrows, ncolumns)
@@ -1,20 +1,96 @@
 import argparse
+import csv
+import json
 import os
 import sys
 
-from PyQt5 import QtWidgets
+import numpy as np
 
-from .rama_analyzer import RamaAnalyzerMain
+from ..analysis.dihedrals import load_ramachandran
+from ..analysis.ramachandran import ConformationalStates, state_statistics
+from ..io.table import print_table
+
+
+def load_states(filename):
+    """Load user-defined conformational states from a JSON file: an object mapping the names of the states to a
+    polygon (a list of [phi, psi] vertices in degrees) or to a list of polygons."""
+    with open(filename, 'rt', encoding='utf-8') as f:
+        states = json.load(f)
+    if not isinstance(states, dict):
+        raise ValueError('The states in file {} must be given as an object of names and polygons'.format(filename))
+    polygons = []
+    for name, vertices in states.items():
+        vertices = np.asarray(vertices, np.float64)
+        if vertices.ndim == 2:
+            vertices = vertices[np.newaxis]
+        if vertices.ndim != 3 or vertices.shape[2] != 2 or vertices.shape[1] < 3:
+            raise ValueError('Invalid polygon for state {} in file {}'.format(name, filename))
+        polygons.append((name, vertices.tolist()))
+    return polygons
+
+
+def print_states(residues, names, occupancy, lifetimes, transitions):
+    """Print the occupancies (in %) and the mean lifetimes (in frames) of the states for each residue and the
+    transition probabilities between the states of all residues"""
+    print('Occupancy (%):')
+    print_table(['Residue'] + names, [[residue] + ['{:.2f}'.format(100 * x) for x in row]
+                                      for residue, row in zip(residues, occupancy)])
+    print()
+    print('Mean lifetime (frames):')
+    print_table(['Residue'] + names, [[residue] + ['{:.1f}'.format(x) for x in row]
+                                      for residue, row in zip(residues, lifetimes)])
+    print()
+    print('Transition probabilities between consecutive frames, all residues (%, from row to column):')
+    counts = transitions.sum(axis=0)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        probabilities = 100 * counts / counts.sum(axis=1)[:, np.newaxis]
+    print_table([''] + names, [[name] + ['{:.2f}'.format(x) for x in row] for name, row in zip(names, probabilities)])
+
+
+def write_states(filename, residues, names, occupancy, lifetimes):
+    """Write the occupancies (in %) and the mean lifetimes (in frames) of the states of the residues to a CSV file"""
+    with open(filename, 'wt', newline='', encoding='utf-8') as f:
+        writer = csv.writer(f)
+        writer.writerow(['Residue'] + ['{} (%)'.format(n) for n in names] +
+                        ['{} lifetime (frames)'.format(n) for n in names])
+        for residue, occ, life in zip(residues, occupancy, lifetimes):
+            writer.writerow([residue] + ['{:.4f}'.format(100 * x) for x in occ] + ['{:.2f}'.format(x) for x in life])
 
 
 def run():
     p = argparse.ArgumentParser(description='Analyze Ramachandran plots of Gromacs trajectories')
-    p.add_argument('-f', action='store', dest='XVGFILE', type=str, help='.xvg file produced by gmx rama',
-                   default='rama.xvg')
+    p.add_argument('-f', action='store', dest='XVGFILE', type=str, default='rama.xvg',
+                   help='.xvg file produced by gmx rama, or a trajectory (multi-frame .gro or .xtc)')
+    p.add_argument('-s', action='store', dest='STRUCTURE', type=str, help='structure (.gro) of an .xtc trajectory',
+                   default=None)
+    p.add_argument('-p', action='store', dest='POLYGONS', type=str, default=None,
+                   help='JSON file with user-defined conformational states: names and polygons of (phi, psi) '
+                        'vertices')
+    p.add_argument('-x', action='store_true', dest='STATES', default=False,
+                   help='print the occupancies, lifetimes and transitions of the conformational states without '
+                        'opening the window')
+    p.add_argument('-o', action='store', dest='OUTPUT', type=str, default=None,
+                   help='write the occupancies and lifetimes of the conformational states to a CSV file without opening the '
+                        'window (the tables are printed too if -x is given)')
     args = vars(p.parse_args())
+    filename = os.path.expanduser(args['XVGFILE'])
+    structure = os.path.expanduser(args['STRUCTURE']) if args['STRUCTURE'] is not None else None
+    polygons = load_states(os.path.expanduser(args['POLYGONS'])) if args['POLYGONS'] is not None else []
+    if args['STATES'] or args['OUTPUT'] is not None:
+        data = load_ramachandran(filename, structure)
+        states = ConformationalStates(polygons)
+        occupancy, lifetimes, transitions = state_statistics(data.phi, data.psi, states)
+        if args['STATES']:
+            print_states(data.residues, states.names, occupancy, lifetimes, transitions)
+        if args['OUTPUT'] is not None:
+            write_states(os.path.expanduser(args['OUTPUT']), data.residues, states.names, occupancy, lifetimes)
+        return
+    from PyQt5 import QtWidgets
+    from .rama_analyzer import RamaAnalyzerMain
     app = QtWidgets.QApplication([])
     mainwin = RamaAnalyzerMain()
-    filename = os.path.expanduser(args['XVGFILE'])
+    mainwin.structurefile = structure
+    mainwin.userstates = polygons
     if os.path.exists(filename):
         mainwin.load(filename)
     mainwin.show()
@@ -1,4 +1,6 @@
 import itertools
+import os
+import time
 
 import matplotlib.colors
 import numpy as np
@@ -6,15 +8,49 @@ from PyQt5 import QtCore, QtWidgets, QtGui
 from matplotlib.axes import Axes
 from matplotlib.backends.backend_qt5agg import FigureCanvasQTAgg, NavigationToolbar2QT
 from matplotlib.figure import Figure
+from matplotlib.lines import Line2D
+from matplotlib.widgets import PolygonSelector
 
 from .rama_analyzer_ui import Ui_RamaAnalyzerMain
-from ..io.rama_xvg import load_rama_xvg
+from ..analysis.decimation import DecimatedLine
+from ..analysis.dihedrals import count_frames, load_ramachandran
+from ..analysis.ramachandran import ConformationalStates, RamachandranHistograms, free_energy, state_statistics
 
 
 class RamaAnalyzerMain(QtWidgets.QWidget, Ui_RamaAnalyzerMain):
+    # the number of bins of the density plots along phi and psi
+    histogrambins = 72
+    # the temperature for the free energy, in K
+    temperature = 300
+    # the spacing and the maximum of the free energy contours, in kJ/mol
+    freeenergystep = 2
+    freeenergymax = 20
+
     def __init__(self):
         QtWidgets.QWidget.__init__(self, None)
         self.ramachandran_data = None
+        # the structure (.gro) file of .xtc trajectories
+        self.structurefile = None
+        # the file loaded last and the number of its first loaded frame in the file: the positions of the step slider
+        # are counted from it
+        self.loadedfilename = None
+        self.firstframe = 0
+        # the histograms of the residues, computed when first needed in density mode
+        self.histograms = None
+        # the image or the contours in density mode
+        self.densityartists = []
+        # the MoviePlayer while a movie is played, the frame it was started from and the last frame shown
+        self.movie = None
+        self.moviestart = None
+        self.movieticks = 0
+        # the decimated lines on the phi and psi tabs
+        self.anglelines = {'phi': [], 'psi': []}
+        # the conformational states drawn by the user: (name, polygons) pairs, see ConformationalStates
+        self.userstates = []
+        # the states and their occupancies, lifetimes and transitions, computed when first needed
+        self.conformations = None
+        self.statestatistics = None
+        self.polygonSelector = None
         self.setupUi(self)
 
     def setupUi(self, RamaAnalyzerMain):
@@ -27,11 +63,38 @@ class RamaAnalyzerMain(QtWidgets.QWidget, Ui_RamaAnalyzerMain):
         self.figureVerticalLayout.addWidget(self.canvas)
         self.navigationToolbar = NavigationToolbar2QT(self.canvas, self.figureWidget)
         self.figureVerticalLayout.addWidget(self.navigationToolbar)
+        self.plotModeHorizontalLayout = QtWidgets.QHBoxLayout()
+        self.plotModeHorizontalLayout.addWidget(QtWidgets.QLabel('Plot:', self.figureWidget))
+        self.plotModeComboBox = QtWidgets.QComboBox(self.figureWidget)
+        self.plotModeComboBox.addItems(['Points', 'Density', 'Free energy'])
+        self.plotModeHorizontalLayout.addWidget(self.plotModeComboBox)
+        self.plotModeHorizontalLayout.addWidget(QtWidgets.QLabel('Smoothing (degrees):', self.figureWidget))
+        self.smoothingSpinBox = QtWidgets.QDoubleSpinBox(self.figureWidget)
+        self.smoothingSpinBox.setRange(0, 90)
+        self.smoothingSpinBox.setToolTip('Standard deviation of the Gaussian smoothing of the density (0: none)')
+        self.plotModeHorizontalLayout.addWidget(self.smoothingSpinBox)
+        self.plotModeHorizontalLayout.addStretch(1)
+        self.figureVerticalLayout.addLayout(self.plotModeHorizontalLayout)
+        self.plotModeComboBox.currentIndexChanged.connect(lambda *args: self.replot())
+        self.smoothingSpinBox.valueChanged.connect(lambda *args: self.replot())
         self.itemEditorFactory = QtWidgets.QItemEditorFactory()
         self.itemEditorFactory.registerEditor(
             QtCore.QVariant.Color,
             ColorListEditorCreator())
         QtWidgets.QItemEditorFactory.setDefaultFactory(self.itemEditorFactory)
+        self.framesHorizontalLayout = QtWidgets.QHBoxLayout()
+        self.framesHorizontalLayout.addWidget(QtWidgets.QLabel('Frames:', self.frame))
+        self.firstFrameSpinBox = QtWidgets.QSpinBox(self.frame)
+        self.firstFrameSpinBox.setToolTip('The first frame to load: the frames before it are skipped without reading')
+        self.framesHorizontalLayout.addWidget(self.firstFrameSpinBox)
+        self.framesHorizontalLayout.addWidget(QtWidgets.QLabel('to', self.frame))
+        self.lastFrameSpinBox = QtWidgets.QSpinBox(self.frame)
+        self.lastFrameSpinBox.setToolTip('The last frame to load')
+        self.framesHorizontalLayout.addWidget(self.lastFrameSpinBox)
+        self.frameCountLabel = QtWidgets.QLabel('', self.frame)
+        self.framesHorizontalLayout.addWidget(self.frameCountLabel)
+        self.framesHorizontalLayout.addStretch(1)
+        self.gridLayout.addLayout(self.framesHorizontalLayout, 2, 0, 1, 2)
         self.reloadPushButton.clicked.connect(self.reload)
         self.browsePushButton.clicked.connect(self.browse)
         self.stepSlider.sliderMoved.connect(self.sliderMoved)
@@ -60,6 +123,28 @@ class RamaAnalyzerMain(QtWidgets.QWidget, Ui_RamaAnalyzerMain):
         self.figurePsiVerticalLayout.addWidget(self.canvaspsi)
         self.navigationToolbarPsi = NavigationToolbar2QT(self.canvaspsi, self.psiTab)
         self.figurePsiVerticalLayout.addWidget(self.navigationToolbarPsi)
+        self.statesTab = QtWidgets.QWidget()
+        self.statesVerticalLayout = QtWidgets.QVBoxLayout(self.statesTab)
+        self.statesVerticalLayout.addWidget(QtWidgets.QLabel('Occupancies (%) and mean lifetimes (frames):',
+                                                             self.statesTab))
+        self.statesTableView = QtWidgets.QTableView(self.statesTab)
+        self.statesVerticalLayout.addWidget(self.statesTableView, 3)
+        self.statesVerticalLayout.addWidget(QtWidgets.QLabel(
+            'Transition probabilities between consecutive frames of the shown residues (%, from row to column):',
+            self.statesTab))
+        self.transitionsTableView = QtWidgets.QTableView(self.statesTab)
+        self.statesVerticalLayout.addWidget(self.transitionsTableView, 1)
+        self.statesHorizontalLayout = QtWidgets.QHBoxLayout()
+        self.drawStatePushButton = QtWidgets.QPushButton('Draw a state...', self.statesTab)
+        self.drawStatePushButton.setToolTip('Draw a polygon on the Ramachandran plot, which becomes a new state')
+        self.statesHorizontalLayout.addWidget(self.drawStatePushButton)
+        self.clearStatesPushButton = QtWidgets.QPushButton('Remove drawn states', self.statesTab)
+        self.statesHorizontalLayout.addWidget(self.clearStatesPushButton)
+        self.statesHorizontalLayout.addStretch(1)
+        self.statesVerticalLayout.addLayout(self.statesHorizontalLayout)
+        self.tabWidget.addTab(self.statesTab, 'States')
+        self.drawStatePushButton.clicked.connect(self.drawState)
+        self.clearStatesPushButton.clicked.connect(self.clearStates)
         self.tabWidget.currentChanged.connect(self.tabSwitched)
         self.hideAllPushButton.clicked.connect(self.hideAllResidues)
 
@@ -71,23 +156,25 @@ class RamaAnalyzerMain(QtWidgets.QWidget, Ui_RamaAnalyzerMain):
             self.replot()
         elif index == 1 or index == 2:
             self.plotangles()
+        elif index == 3:
+            self.tabulateStates()
 
     def plotangles(self):
-        enabledresidues = [r.encode('utf-8') for r, e in zip(self.residuesmodel.residues, self.residuesmodel.enabled) if
-                           e]
+        enabledresidues = [r for r, e in zip(self.residuesmodel.residues, self.residuesmodel.enabled) if e]
         for ax, what, ylabel, tabindex in [
             (self.axesphi, 'phi', '$\phi$ (degrees)', 1),
             (self.axespsi, 'psi', '$\psi$ (degrees)', 2)]:
             if self.tabWidget.currentIndex() != tabindex:
                 continue
             assert isinstance(ax, Axes)
-            for l in ax.lines:
+            for l in self.anglelines[what]:
                 l.remove()
-            ax.lines = []
+            self.anglelines[what] = []
+            steps = np.arange(len(self.ramachandran_data))
             for r in enabledresidues:
-                idx = self.ramachandran_data['resn'] == r
-                ax.plot(self.ramachandran_data[what][idx], color=self.residuesmodel.residueColor(r),
-                        label=r.decode('utf-8'))
+                angles = getattr(self.ramachandran_data, what)[:, self.ramachandran_data.index[r]]
+                self.anglelines[what].append(
+                    DecimatedLine(ax, steps, angles, color=self.residuesmodel.residueColor(r), label=r))
             ax.set_xlabel('Step #')
             ax.set_ylabel(ylabel)
             ax.legend(loc='best')
@@ -96,21 +183,34 @@ class RamaAnalyzerMain(QtWidgets.QWidget, Ui_RamaAnalyzerMain):
         self.canvaspsi.draw()
 
     def endMovie(self):
+        if self.movie is not None:
+            self.movie.remove()
+            self.movie = None
         self.stepByStepGroupBox.setCheckable(True)
         self.movieDelaySpinBox.setEnabled(True)
         self.stepSlider.setEnabled(True)
         self.playMoviePushButton.setText('Play')
+        self.replot(self.stepSlider.value())
 
     def playWorker(self):
         if self.playMoviePushButton.text() == 'Play':
             self.endMovie()
             return
-        self.stepSlider.setValue(min(self.stepSlider.value() + self.skipFramesSpinBox.value() + 1, self.nsteps - 1))
-        self.replot(self.stepSlider.value())
-        if self.stepSlider.value() >= self.stepSlider.maximum():
+        delay = self.movieDelaySpinBox.value()
+        # the frames are timed by the clock: if drawing falls behind, the frames which are already late are dropped
+        ticks = self.movieticks + 1
+        if delay > 0:
+            ticks = max(ticks, int((time.perf_counter() - self.moviestart[1]) / delay))
+        self.movieticks = ticks
+        position = min(self.moviestart[0] + ticks * (self.skipFramesSpinBox.value() + 1), self.nsteps - 1)
+        self.stepSlider.setValue(position)
+        self.stepLabel.setText('{:d}'.format(self.firstframe + position))
+        self.movie.show(position)
+        if position >= self.stepSlider.maximum():
             self.endMovie()
             return
-        QtCore.QTimer.singleShot(int(self.movieDelaySpinBox.value() * 1000), self.playWorker)
+        wait = self.moviestart[1] + (ticks + 1) * delay - time.perf_counter()
+        QtCore.QTimer.singleShot(max(int(wait * 1000), 0), self.playWorker)
 
     def playMovie(self):
         if self.playMoviePushButton.text() == 'Play':
@@ -120,7 +220,12 @@ class RamaAnalyzerMain(QtWidgets.QWidget, Ui_RamaAnalyzerMain):
             self.stepByStepGroupBox.setCheckable(False)
             self.movieDelaySpinBox.setEnabled(False)
             self.stepSlider.setEnabled(False)
-            self.playWorker()
+            self.movie = MoviePlayer(self.canvas, self.axes, self.ramachandran_data)
+            self.moviestart = self.stepSlider.value(), time.perf_counter()
+            self.movieticks = 0
+            # the background is drawn once, then only the points are updated
+            self.replot(self.stepSlider.value())
+            QtCore.QTimer.singleShot(int(self.movieDelaySpinBox.value() * 1000), self.playWorker)
         elif self.playMoviePushButton.text() == 'Stop':
             self.playMoviePushButton.setText('Play')
         else:
@@ -139,7 +244,9 @@ class RamaAnalyzerMain(QtWidgets.QWidget, Ui_RamaAnalyzerMain):
             self.replot(position)
 
     def browse(self):
-        filename = QtWidgets.QFileDialog.getOpenFileName(self, 'Load an XVG file', '', '*.xvg')[0]
+        filename = QtWidgets.QFileDialog.getOpenFileName(
+            self, 'Load a gmx rama output or a trajectory', '',
+            'Ramachandran data or trajectories (*.xvg *.gro *.xtc)')[0]
         print(filename)
         if filename:
             self.filenameLineEdit.setText(filename)
@@ -149,20 +256,104 @@ class RamaAnalyzerMain(QtWidgets.QWidget, Ui_RamaAnalyzerMain):
         self.load(filename)
 
     def load(self, filename):
+        """Load the output of `gmx rama` (.xvg) or compute the dihedrals from a trajectory (.gro or .xtc).
+
+        Only the frames selected with the frame spin boxes are read, located through the byte offset index of the file.
+        All frames are selected when another file is loaded, and new frames of a growing file are included if the last
+        frame was selected."""
         self.filenameLineEdit.setText(filename)
-        self.ramachandran_data = load_rama_xvg(filename)
-        self.residuesmodel = Model(sorted(set(self.ramachandran_data['resn'].tolist())))
+        extension = os.path.splitext(filename)[1].lower()
+        if extension == '.xtc' and self.structurefile is None:
+            self.structurefile = QtWidgets.QFileDialog.getOpenFileName(
+                self, 'Select the structure of the trajectory', '', 'Structure files (*.gro)')[0] or None
+            if self.structurefile is None:
+                return
+        nframes = count_frames(filename)
+        if filename != self.loadedfilename or self.lastFrameSpinBox.value() == self.lastFrameSpinBox.maximum():
+            last = nframes - 1
+        else:
+            last = min(self.lastFrameSpinBox.value(), nframes - 1)
+        first = 0 if filename != self.loadedfilename else min(self.firstFrameSpinBox.value(), max(last, 0))
+        for spinbox, value in [(self.firstFrameSpinBox, first), (self.lastFrameSpinBox, last)]:
+            spinbox.setRange(0, max(nframes - 1, 0))
+            spinbox.setValue(value)
+        self.frameCountLabel.setText('of {:d}'.format(nframes))
+        self.loadedfilename = filename
+        self.setData(load_ramachandran(filename, self.structurefile if extension == '.xtc' else None, first, last + 1),
+                     first)
+
+    def setData(self, data, firstframe=0):
+        """Show Ramachandran data (a RamachandranData instance). `firstframe` is the number of its first frame in the
+        file, for the frame numbers shown."""
+        self.ramachandran_data = data
+        self.firstframe = firstframe
+        self.histograms = None
+        self.statestatistics = None
+        self.residuesmodel = Model(self.ramachandran_data.residues)
         self.residuesListView.setModel(self.residuesmodel)
-        self.residuesmodel.dataChanged.connect(lambda *args: (self.replot(), self.plotangles()))
+        self.residuesmodel.dataChanged.connect(
+            lambda *args: (self.replot(), self.plotangles(), self.tabulateStates()))
         self.stepLabel.setText('')
-        self.nsteps = np.sum(self.ramachandran_data['resn'] == self.ramachandran_data['resn'][0])
-        self.nresidues = len(set(self.ramachandran_data['resn'].tolist()))
+        self.nsteps = len(self.ramachandran_data)
+        self.nresidues = self.ramachandran_data.nresidues
         self.stepSlider.setMinimum(0)
         self.stepSlider.setMaximum(self.nsteps - 1)
         self.stepSlider.setValue(0)
         self.stepByStepGroupBox.setEnabled(True)
         self.replot()
         self.plotangles()
+        self.tabulateStates()
+
+    def stateStatistics(self):
+        """The conformational states, and the occupancies, the mean lifetimes and the transition counts of all
+        residues"""
+        if self.statestatistics is None:
+            self.conformations = ConformationalStates(self.userstates)
+            self.statestatistics = state_statistics(self.ramachandran_data.phi, self.ramachandran_data.psi,
+                                                    self.conformations)
+        return self.statestatistics
+
+    def tabulateStates(self):
+        if self.ramachandran_data is None or self.tabWidget.currentIndex() != 3:
+            return
+        occupancy, lifetimes, transitions = self.stateStatistics()
+        names = self.conformations.names
+        residues = self.residuesmodel.residues
+        columns = [self.ramachandran_data.index[r] for r in residues]
+        self.statesTableView.setModel(TableModel(
+            residues, ['{} (%)'.format(n) for n in names] + ['{} lifetime'.format(n) for n in names],
+            np.hstack([100 * occupancy[columns], lifetimes[columns]]),
+            ['{:.2f}'] * len(names) + ['{:.1f}'] * len(names)))
+        enabled = [self.ramachandran_data.index[r] for r, e in zip(residues, self.residuesmodel.enabled) if e]
+        counts = transitions[enabled].sum(axis=0)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            probabilities = 100 * counts / counts.sum(axis=1)[:, np.newaxis]
+        self.transitionsTableView.setModel(TableModel(names, names, probabilities, ['{:.2f}'] * len(names)))
+        self.statesTableView.resizeColumnsToContents()
+        self.transitionsTableView.resizeColumnsToContents()
+
+    def drawState(self):
+        """Start drawing a polygon on the Ramachandran plot"""
+        self.tabWidget.setCurrentIndex(0)
+        if self.polygonSelector is None:
+            self.polygonSelector = PolygonSelector(self.axes, self.onStateDrawn)
+
+    def onStateDrawn(self, vertices):
+        self.polygonSelector.disconnect_events()
+        self.polygonSelector.set_visible(False)
+        self.polygonSelector = None
+        self.canvas.draw()
+        name, ok = QtWidgets.QInputDialog.getText(self, 'New conformational state', 'Name of the state:')
+        if not ok or not name:
+            return
+        self.userstates.append((name, [[(phi, psi) for phi, psi in vertices]]))
+        self.statestatistics = None
+        self.tabWidget.setCurrentIndex(3)
+
+    def clearStates(self):
+        self.userstates = []
+        self.statestatistics = None
+        self.tabulateStates()
 
     def replot(self, position=None):
         if self.tabWidget.currentIndex() != 0:
@@ -170,32 +361,167 @@ class RamaAnalyzerMain(QtWidgets.QWidget, Ui_RamaAnalyzerMain):
         if position is None and self.stepByStepGroupBox.isChecked():
             position = self.stepSlider.value()
         assert isinstance(self.axes, Axes)
-        for l in self.axes.lines:
-            l.remove()
-        self.axes.lines = []
-        enabledresidues = [r for r, e in zip(self.residuesmodel.residues, self.residuesmodel.enabled)
-                           if e]
-        if position is None:
-            ramachandran_data = self.ramachandran_data
-        else:
-            ramachandran_data = self.ramachandran_data[position * self.nresidues:(position + 1) * self.nresidues]
-            self.stepLabel.setText('{:d}'.format(position))
-        for i in range(len(self.residuesmodel.residues)):
-            r = self.residuesmodel.residues[i]
-            if r not in enabledresidues:
-                continue
-            idx = ramachandran_data['resn'] == r.encode('utf-8')
-            self.axes.plot(ramachandran_data['phi'][idx],
-                           ramachandran_data['psi'][idx], '.',
-                           color=self.residuesmodel.residueColor(r), label=r)
-        self.axes.legend(loc='best')
+        for artist in list(self.axes.lines) + self.densityartists:
+            artist.remove()
+        self.densityartists = []
+        mode = self.plotModeComboBox.currentText()
+        if mode != 'Points':
+            self.plotDensity(mode == 'Free energy')
+        if self.movie is not None:
+            # the points are drawn by the movie player, which needs a legend of its own
+            residues = [(r, self.residuesmodel.residueColor(r)) for r, e in
+                        zip(self.residuesmodel.residues, self.residuesmodel.enabled) if e]
+            if position is not None:
+                self.movie.position = position
+            self.movie.setResidues([self.ramachandran_data.index[r] for r, c in residues], [c for r, c in residues])
+            self.stepLabel.setText('{:d}'.format(self.firstframe + self.movie.position))
+            if residues:
+                self.axes.legend(handles=[Line2D([], [], linestyle='', marker='.', color=c, label=r)
+                                          for r, c in residues], loc='best')
+            elif self.axes.get_legend() is not None:
+                self.axes.get_legend().remove()
+            self.canvas.draw()
+            return
+        # in density mode, only the points of the current frame are shown in step-by-step mode
+        if mode == 'Points' or position is not None:
+            if position is None:
+                # all frames
+                frames = slice(None)
+            else:
+                frames = slice(position, position + 1)
+                self.stepLabel.setText('{:d}'.format(self.firstframe + position))
+            phi, psi = self.ramachandran_data.phi[frames], self.ramachandran_data.psi[frames]
+            for r, enabled in zip(self.residuesmodel.residues, self.residuesmodel.enabled):
+                if not enabled:
+                    continue
+                column = self.ramachandran_data.index[r]
+                self.axes.plot(phi[:, column], psi[:, column], '.', color=self.residuesmodel.residueColor(r), label=r)
+        if self.axes.lines:
+            self.axes.legend(loc='best')
+        elif self.axes.get_legend() is not None:
+            self.axes.get_legend().remove()
         self.canvas.draw()
 
+    def ramachandranHistograms(self):
+        if self.histograms is None:
+            self.histograms = RamachandranHistograms(self.ramachandran_data.phi, self.ramachandran_data.psi,
+                                                     self.histogrambins)
+        return self.histograms
+
+    def plotDensity(self, freeenergy=False):
+        """Show the density of the enabled residues as an image, or the free energy as filled contours"""
+        columns = [self.ramachandran_data.index[r] for r, e in
+                   zip(self.residuesmodel.residues, self.residuesmodel.enabled) if e]
+        if not columns:
+            return
+        histograms = self.ramachandranHistograms()
+        density = histograms.density(columns, self.smoothingSpinBox.value())
+        if not density.any():
+            return
+        # the first index of the histograms is phi, which is the horizontal axis
+        if freeenergy:
+            self.densityartists.append(self.axes.contourf(
+                histograms.centers, histograms.centers, free_energy(density, self.temperature).T,
+                levels=np.arange(0, self.freeenergymax + 0.5 * self.freeenergystep, self.freeenergystep),
+                cmap='viridis', zorder=0))
+        else:
+            self.densityartists.append(self.axes.imshow(
+                density.T, origin='lower', extent=(-180, 180, -180, 180), aspect='auto', interpolation='nearest',
+                cmap='viridis', zorder=0))
+
+
+class MoviePlayer(object):
+    """Shows the frames of a trajectory on the Ramachandran plot with blitting.
+
+    The points of the enabled residues are a single animated scatter plot. Everything else (e.g. the density and the
+    legend) is the background, which is saved whenever the canvas is drawn. Showing a frame restores the background,
+    moves the points and draws only them.
+    """
+
+    def __init__(self, canvas, axes, data):
+        self.canvas = canvas
+        self.axes = axes
+        self.data = data
+        self.columns = np.zeros(0, np.intp)
+        self.position = 0
+        self.points = axes.scatter(np.zeros(0), np.zeros(0), marker='.', animated=True, zorder=3)
+        self.background = None
+        self._drawcallback = canvas.mpl_connect('draw_event', self.onDraw)
+
+    def setResidues(self, columns, colors):
+        """Select the residues (columns of the data) to be shown and their colors"""
+        self.columns = np.asarray(columns, np.intp)
+        self.points.set_color(colors)
+        self.setFrame(self.position)
+
+    def setFrame(self, position):
+        self.position = position
+        self.points.set_offsets(np.column_stack([self.data.phi[position, self.columns],
+                                                 self.data.psi[position, self.columns]]))
+
+    def onDraw(self, event):
+        """The canvas has been drawn (e.g. resized): save the new background and draw the points over it"""
+        self.background = self.canvas.copy_from_bbox(self.axes.bbox)
+        self.axes.draw_artist(self.points)
+
+    def show(self, position):
+        """Show a frame"""
+        self.setFrame(position)
+        if self.background is None:
+            self.canvas.draw()
+            return
+        self.canvas.restore_region(self.background)
+        self.axes.draw_artist(self.points)
+        self.canvas.blit(self.axes.bbox)
+
+    def remove(self):
+        self.canvas.mpl_disconnect(self._drawcallback)
+        self.points.remove()
+
+
+class TableModel(QtCore.QAbstractItemModel):
+    """A read-only table of numbers with row and column headers. `formats` are the format strings of the columns."""
+
+    def __init__(self, rowheaders, columnheaders, values, formats):
+        QtCore.QAbstractItemModel.__init__(self, None)
+        self.rowheaders = rowheaders
+        self.columnheaders = columnheaders
+        self.values = values
+        self.formats = formats
+
+    def columnCount(self, parent=None, *args, **kwargs):
+        return len(self.columnheaders)
+
+    def rowCount(self, parent=None, *args, **kwargs):
+        return len(self.rowheaders)
+
+    def headerData(self, idx: int, orientation, role=QtCore.Qt.DisplayRole):
+        if role != QtCore.Qt.DisplayRole:
+            return None
+        return self.columnheaders[idx] if orientation == QtCore.Qt.Horizontal else self.rowheaders[idx]
+
+    def data(self, index: QtCore.QModelIndex, role=QtCore.Qt.DisplayRole):
+        if role == QtCore.Qt.DisplayRole:
+            return self.formats[index.column()].format(self.values[index.row(), index.column()])
+        elif role == QtCore.Qt.TextAlignmentRole:
+            return QtCore.Qt.AlignRight | QtCore.Qt.AlignVCenter
+        return None
+
+    def flags(self, index: QtCore.QModelIndex):
+        return QtCore.Qt.ItemIsEnabled | QtCore.Qt.ItemNeverHasChildren
+
+    def index(self, row: int, column: int, parent=None, *args, **kwargs):
+        return self.createIndex(row, column)
+
+    def parent(self, index: QtCore.QModelIndex = None):
+        return QtCore.QModelIndex()
+
 
 class Model(QtCore.QAbstractItemModel):
     def __init__(self, residues):
         QtCore.QAbstractItemModel.__init__(self, None)
-        self.residues = sorted([x.decode('utf-8') for x in residues], key=lambda x: int(x.rsplit('-', 1)[-1]))
+        self.residues = sorted(residues, key=lambda x: int(x.rsplit('-', 1)[-1]))
+        self.rows = {r: i for i, r in enumerate(self.residues)}
         self.enabled = [True] * len(self.residues)
         self.colors = [None] * len(self.residues)
         for i, color in zip(range(len(self.residues)), itertools.cycle('bgrcmyk')):
@@ -258,7 +584,7 @@ class Model(QtCore.QAbstractItemModel):
     def residueColor(self, resn):
         if isinstance(resn, bytes):
             resn = resn.decode('utf-8')
-        color = [c for c, r in zip(self.colors, self.residues) if r == resn][0]
+        color = self.colors[self.rows[resn]]
         return (color.redF(), color.greenF(), color.blueF())
 
 
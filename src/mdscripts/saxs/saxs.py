@@ -1,18 +1,32 @@
-import mdtraj
 import numpy as np
 
+from ..io.gro import GROFile
+from ..io.xtc import XTCReader
+
+# the selection of the solute atoms: everything but water and ions
+SOLUTE = 'not resname SOL HOH WAT TIP3 TIP4 SPC NA CL K NA+ CL- K+ ION'
+
+# atomic numbers from the first letter of the atom names
+ATOMICNUMBERS = {'H': 1, 'C': 6, 'N': 7, 'O': 8, 'P': 15, 'S': 16}
+
+
+def solute(topology):
+    """Indices and atomic numbers of the non-solvent atoms in a GROFile"""
+    indices = np.flatnonzero(topology.select(SOLUTE))
+    names = np.char.decode(topology.grodata['name'][indices], 'ascii')
+    return indices, np.array([ATOMICNUMBERS.get(n.lstrip('0123456789')[:1], 0) for n in names], np.float64)
+
 
 def gmx_saxs(q, trajectory, topology):
     intensity = np.zeros_like(q)
-    for chunk in mdtraj.iterload(trajectory, top=topology):
-        for c in chunk:
-            c1 = c.remove_solvent()
-            for i in range(c1.n_atoms):
-                rhoi = c1.topology.atom(i).element[0]
-                for j in range(i, c1.n_atoms):
-                    intensity += rhoi ** 2
-                    dist = np.sum((c1.xyz[0, i, :] - c1.xyz[0, j, :]) ** 2) ** 0.5
-                    intensity += 2 * rhoi * c1.topology.atom(j).element[0] * np.sin(dist * q) / (dist * q)
+    indices, rho = solute(GROFile.load(topology))
+    for frame in XTCReader(trajectory):
+        xyz = frame.coords[indices]
+        for i in range(len(indices)):
+            intensity += rho[i] ** 2
+            for j in range(i + 1, len(indices)):
+                dist = np.sum((xyz[i, :] - xyz[j, :]) ** 2) ** 0.5
+                intensity += 2 * rho[i] * rho[j] * np.sin(dist * q) / (dist * q)
     return intensity
 
 
@@ -25,18 +39,13 @@ topology = '/home/wachaandras/gromacs/cm15_folding/helix_unfold_gromos/productio
 intensity = np.zeros_like(q)
 idx = 0
 maxidx = 30
-for chunk in mdtraj.iterload(trajectory, top=topology):
-    if idx > maxidx:
-        break
-    for c in chunk:
-        if idx > maxidx:
-            break
-        idx += 1
-        print(idx)
-        c1 = c.remove_solvent()
-        for i in range(c1.n_atoms):
-            rhoi = c1.topology.atom(i).element.number
-            intensity += rhoi ** 2
-            for j in range(i + 1, c1.n_atoms):
-                dist = np.sum((c1.xyz[0, i, :] - c1.xyz[0, j, :]) ** 2) ** 0.5
-                intensity += 2 * rhoi * c1.topology.atom(j).element.number * np.sin(dist * q) / (dist * q)
+indices, rho = solute(GROFile.load(topology))
+for frame in XTCReader(trajectory).iter_frames(stop=maxidx + 1):
+    idx += 1
+    print(idx)
+    xyz = frame.coords[indices]
+    for i in range(len(indices)):
+        intensity += rho[i] ** 2
+        for j in range(i + 1, len(indices)):
+            dist = np.sum((xyz[i, :] - xyz[j, :]) ** 2) ** 0.5
+            intensity += 2 * rho[i] * rho[j] * np.sin(dist * q) / (dist * q)
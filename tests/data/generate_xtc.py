@@ -0,0 +1,30 @@
+"""Generate the .xtc fixture of test_xtc.py and its reference data with mdtraj (needed only to regenerate them):
+
+    python generate_xtc.py
+
+A chain of 100 atoms and 200 water-like triplets (which are coded in runs of small differences), 8 frames. The
+reference coordinates, times and boxes are read back from the file by mdtraj.
+"""
+import os
+
+import mdtraj as md
+import numpy as np
+
+here = os.path.dirname(os.path.abspath(__file__))
+rng = np.random.default_rng(42)
+nframes = 8
+chain = np.cumsum(rng.normal(0, 0.1, (100, 3)), axis=0) + 3
+oxygens = rng.uniform(0, 6, (200, 3))
+frames = []
+for i in range(nframes):
+    hydrogens = oxygens[:, np.newaxis] + rng.normal(0, 0.02, (200, 2, 3))
+    waters = np.concatenate([oxygens[:, np.newaxis], hydrogens], axis=1).reshape(-1, 3)
+    frames.append(np.concatenate([chain + rng.normal(0, 0.01, chain.shape), waters]))
+    oxygens = oxygens + rng.normal(0, 0.02, oxygens.shape)
+boxes = np.tile(np.diag([6.0, 6.5, 7.0]).astype(np.float32), (nframes, 1, 1))
+with md.formats.XTCTrajectoryFile(os.path.join(here, 'traj.xtc'), 'w') as f:
+    f.write(np.array(frames, np.float32), time=np.arange(nframes, dtype=np.float32) * 2.5,
+            step=np.arange(nframes, dtype=np.int32) * 1250, box=boxes)
+with md.formats.XTCTrajectoryFile(os.path.join(here, 'traj.xtc')) as f:
+    xyz, time, step, box = f.read()
+np.savez_compressed(os.path.join(here, 'traj_reference.npz'), xyz=xyz, time=time, box=box)
@@ -0,0 +1,37 @@
+"""Writing and reading .gro files"""
+import numpy as np
+import pytest
+
+from mdscripts.io.gro import GROFile
+
+GRO = """A peptide t= 0.0
+3
+    1ALA      N    1   0.100   0.200   0.300
+    1ALA     CA    2   0.400   0.500   0.600
+    2SOL     OW    3  -1.234  12.500   0.000
+   2.00000   2.50000   3.00000
+"""
+
+
+@pytest.fixture
+def grofile(tmp_path):
+    filename = tmp_path / 'conf.gro'
+    filename.write_text(GRO)
+    return str(filename)
+
+
+def test_roundtrip(grofile, tmp_path):
+    gro = GROFile.load(grofile, cache=False)
+    gro.write(str(tmp_path / 'out.gro'))
+    assert (tmp_path / 'out.gro').read_text() == GRO
+    np.testing.assert_array_equal(GROFile.load(str(tmp_path / 'out.gro'), cache=False).grodata, gro.grodata)
+
+
+def test_roundtrip_empty(grofile, tmp_path):
+    empty = GROFile.load(grofile, cache=False).filter_resn('LYS')
+    assert len(empty.grodata) == 0
+    empty.write(str(tmp_path / 'empty.gro'))
+    assert (tmp_path / 'empty.gro').read_text() == 'A peptide t= 0.0\n0\n   2.00000   2.50000   3.00000\n'
+    loaded = GROFile.load(str(tmp_path / 'empty.gro'), cache=False)
+    assert len(loaded.grodata) == 0
+    assert loaded.boxsize == pytest.approx([2.0, 2.5, 3.0])
@@ -0,0 +1,46 @@
+"""The headless report mode of gmx_extract_energy must not import the GUI and plotting stack or scipy, and must import
+quickly"""
+import json
+import os
+import subprocess
+import sys
+
+# the time of importing mdscripts.extract_energy (after numpy) must stay under this, in seconds. It is about 0.03 s on a
+# desktop machine, the budget leaves room for slow and busy machines.
+IMPORT_BUDGET = 0.5
+
+SCRIPT = r'''
+import json, sys, time
+import numpy as np
+t0 = time.perf_counter()
+import mdscripts.extract_energy
+importtime = time.perf_counter() - t0
+# the package exports the function extract_energy() under the name of the module
+ee = sys.modules['mdscripts.extract_energy']
+rng = np.random.default_rng(0)
+times = np.arange(2000) * 0.5
+data = np.column_stack([times, -1000 + 50 * np.exp(-times / 50) + rng.normal(0, 5, len(times)),
+                        300 + rng.normal(0, 2, len(times))])
+labels = ['Time (ps)', 'Potential', 'Temperature']
+equilibrated, g, neff = ee.equilibration(data)
+data = data[data[:, 0] >= equilibrated.max()]
+ee.write_report(sys.argv[1], data, labels, ['kJ/mol', 'K'])
+ee.print_statistics(data, labels)
+print(json.dumps({'importtime': importtime,
+                  'modules': sorted(m for m in sys.modules if m.split('.')[0] in ['PyQt5', 'matplotlib', 'scipy'])}))
+'''
+
+
+def test_report_imports(tmp_path):
+    env = dict(os.environ)
+    src = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'src')
+    env['PYTHONPATH'] = os.pathsep.join([src] + [p for p in [env.get('PYTHONPATH')] if p])
+    reportfile = str(tmp_path / 'report.json')
+    result = subprocess.run([sys.executable, '-c', SCRIPT, reportfile], env=env, stdout=subprocess.PIPE,
+                            check=True, universal_newlines=True)
+    status = json.loads(result.stdout.splitlines()[-1])
+    assert status['modules'] == []
+    assert status['importtime'] < IMPORT_BUDGET
+    with open(reportfile) as f:
+        report = json.load(f)
+    assert [term['term'] for term in report['terms']] == ['Potential', 'Temperature']
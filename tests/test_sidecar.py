@@ -0,0 +1,88 @@
+"""Broken or missing sidecar files must not prevent reading the original files"""
+import os
+
+import numpy as np
+import pytest
+
+from mdscripts.extract_energy import DatasetCache
+from mdscripts.io.frameindex import FrameIndex
+from mdscripts.io.gro import GROFile
+from mdscripts.io.sidecar import load_sidecar, save_sidecar
+
+GRO = """frame 0 t= 0.0
+    2
+    1ALA     CA    1   0.100   0.200   0.300
+    1ALA      C    2   0.400   0.500   0.600
+   1.00000   1.00000   1.00000
+frame 1 t= 10.0
+    2
+    1ALA     CA    1   0.110   0.210   0.310
+    1ALA      C    2   0.410   0.510   0.610
+   1.00000   1.00000   1.00000
+"""
+
+
+@pytest.fixture
+def grofile(tmp_path):
+    filename = tmp_path / 'traj.gro'
+    filename.write_text(GRO)
+    return str(filename)
+
+
+def _break(filename, how):
+    if how == 'empty':
+        open(filename, 'wb').close()
+    else:
+        with open(filename, 'rb') as f:
+            data = f.read()
+        with open(filename, 'wb') as f:
+            f.write(data[:len(data) // 2])
+
+
+@pytest.mark.parametrize('how', ['empty', 'truncated'])
+def test_broken_sidecar(tmp_path, how):
+    filename = str(tmp_path / '.data.npz')
+    assert save_sidecar(filename, values=np.arange(1000), version=1)
+    assert load_sidecar(filename, version=1)['values'].tolist() == list(range(1000))
+    assert load_sidecar(filename, version=2) is None
+    _break(filename, how)
+    assert load_sidecar(filename, version=1) is None
+    assert load_sidecar(str(tmp_path / 'missing.npz')) is None
+
+
+def test_save_sidecar_unwritable(tmp_path):
+    assert not save_sidecar(str(tmp_path / 'nonexistent' / '.data.npz'), values=np.arange(3))
+    assert os.listdir(tmp_path) == []
+
+
+@pytest.mark.parametrize('how', ['empty', 'truncated'])
+def test_broken_offsets(grofile, how):
+    offsets = FrameIndex.for_file(grofile).offsets
+    _break(FrameIndex.sidecar_filename(grofile), how)
+    np.testing.assert_array_equal(FrameIndex.for_file(grofile).offsets, offsets)
+    # the index is saved again
+    assert load_sidecar(FrameIndex.sidecar_filename(grofile)) is not None
+
+
+@pytest.mark.parametrize('how', ['empty', 'truncated'])
+def test_broken_gro_cache(grofile, how):
+    grodata = GROFile.load(grofile).grodata
+    assert GROFile._load_cache(grofile) is not None
+    _break(GROFile.cache_filename(grofile), how)
+    np.testing.assert_array_equal(GROFile.load(grofile).grodata, grodata)
+    np.testing.assert_array_equal(GROFile._load_cache(grofile).grodata, grodata)
+
+
+@pytest.mark.parametrize('how', ['empty', 'truncated'])
+def test_broken_dataset(tmp_path, how):
+    filename = str(tmp_path / 'energy.xvg')
+    with open(filename, 'wt') as f:
+        f.write('@ s0 legend "Potential"\n')
+        f.write(''.join('{:d} {:d}\n'.format(i, -1000 - i) for i in range(1000)))
+    data, labels = DatasetCache(persistent=True).load(filename)
+    assert labels == ['Time (ps)', 'Potential']
+    _break(DatasetCache.sidecar_filename(filename), how)
+    reloaded, labels = DatasetCache(persistent=True).load(filename)
+    np.testing.assert_array_equal(reloaded, data)
+    # the sidecar file is written again and used next time
+    assert DatasetCache(persistent=True)._load_sidecar(filename, os.stat(filename)) is not None
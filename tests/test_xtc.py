@@ -0,0 +1,53 @@
+"""Compare the .xtc reader with the coordinates, times and boxes read by mdtraj from a small trajectory.
+
+The trajectory (data/traj.xtc) and the reference data (data/traj_reference.npz) were written by data/generate_xtc.py.
+"""
+import os
+import shutil
+
+import numpy as np
+import pytest
+
+from mdscripts.io.xtc import XTCReader
+
+DATA = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data')
+
+
+@pytest.fixture(scope='module')
+def trajectory(tmp_path_factory):
+    """The file name (of a copy, so that the sidecar files are not written next to the fixture) and the reference
+    coordinates, times and boxes"""
+    filename = str(tmp_path_factory.mktemp('xtc') / 'traj.xtc')
+    shutil.copy(os.path.join(DATA, 'traj.xtc'), filename)
+    with np.load(os.path.join(DATA, 'traj_reference.npz')) as reference:
+        return filename, reference['xyz'], reference['time'], reference['box']
+
+
+def test_frames(trajectory):
+    filename, xyz, time, box = trajectory
+    reader = XTCReader(filename)
+    assert len(reader) == len(xyz)
+    for i, frame in enumerate(reader):
+        np.testing.assert_array_equal(frame.coords, xyz[i])
+        assert frame.time == pytest.approx(time[i])
+        np.testing.assert_allclose(frame.box, box[i])
+
+
+def test_random_access(trajectory):
+    filename, xyz, time, box = trajectory
+    reader = XTCReader(filename)
+    np.testing.assert_array_equal(reader[3].coords, xyz[3])
+    np.testing.assert_array_equal(reader[-1].coords, xyz[-1])
+    frames = reader[1:8:3]
+    assert [f.time for f in frames] == pytest.approx(time[1:8:3])
+    for frame, coords in zip(frames, xyz[1:8:3]):
+        np.testing.assert_array_equal(frame.coords, coords)
+
+
+def test_stride(trajectory):
+    filename, xyz, time, box = trajectory
+    frames = list(XTCReader(filename).iter_frames(2, 7, 3))
+    assert [f.time for f in frames] == pytest.approx(time[2:7:3])
+    for frame, coords in zip(frames, xyz[2:7:3]):
+        np.testing.assert_array_equal(frame.coords, coords)
+    assert len(list(XTCReader(filename).iter_frames(stride=4))) == len(xyz[::4])
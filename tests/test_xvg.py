@@ -0,0 +1,75 @@
+"""Reading .xvg files, also partially through the row index"""
+import numpy as np
+import pytest
+
+from mdscripts.io.frameindex import FrameIndex
+from mdscripts.io.rama_xvg import count_rama_xvg_frames, load_rama_xvg
+from mdscripts.io.xvg import XVGFile
+
+
+@pytest.fixture
+def xvgfile(tmp_path):
+    filename = str(tmp_path / 'energy.xvg')
+    with open(filename, 'wt') as f:
+        f.write('# comment\n@    title "GROMACS Energies"\n@    xaxis  label "Time (ps)"\n@ s0 legend "Potential"\n'
+                '@ s1 legend "Temperature"\n')
+        for i in range(100):
+            f.write('{:g} {:g} {:g}\n'.format(2.0 * i, -1000.0 - i, 300 + 0.1 * i))
+            if i == 50:
+                f.write('# a comment between the rows\n')
+    return filename
+
+
+@pytest.fixture
+def ramafile(tmp_path):
+    filename = str(tmp_path / 'rama.xvg')
+    residues = ['ALA-2', 'GLY-3', 'SER-4']
+    with open(filename, 'wt') as f:
+        f.write('@    title "Ramachandran Plot"\n')
+        for frame in range(20):
+            for i, residue in enumerate(residues):
+                f.write('{:g} {:g} {}\n'.format(frame - 90.0, 10.0 * i, residue))
+    return filename
+
+
+def test_index(xvgfile):
+    index = FrameIndex.for_file(xvgfile)
+    assert len(index) == 100
+    with index:
+        assert index.time(0) == 0
+        assert index.time(99) == 198
+        assert index.search_time(100) == 50
+        assert index.search_time(100, 'right') == 51
+        assert index.search_time(101) == 51
+
+
+def test_window(xvgfile):
+    xvg = XVGFile.load(xvgfile)
+    assert xvg.data.shape == (100, 3)
+    assert xvg.labels == ['Time (ps)', 'Potential', 'Temperature']
+    for tmin, tmax, rows in [(100, None, slice(50, None)), (None, 50, slice(0, 26)), (11, 101, slice(6, 51)),
+                             (500, None, slice(100, None))]:
+        window = XVGFile.load(xvgfile, tmin=tmin, tmax=tmax)
+        np.testing.assert_array_equal(window.data, xvg.data[rows])
+        assert window.labels == xvg.labels
+    np.testing.assert_array_equal(XVGFile.load(xvgfile, start=10, stop=20).data, xvg.data[10:20])
+
+
+def test_read_appended(xvgfile):
+    xvg = XVGFile.load(xvgfile, tmin=190)
+    assert len(xvg) == 5
+    with open(xvgfile, 'at') as f:
+        f.write('200 -1100 310\n')
+    assert xvg.read_appended() == 1
+    assert xvg.data[:, 0].tolist() == [190, 192, 194, 196, 198, 200]
+
+
+def test_rama_window(ramafile):
+    data = load_rama_xvg(ramafile)
+    assert data.phi.shape == (20, 3)
+    assert count_rama_xvg_frames(ramafile) == 20
+    window = load_rama_xvg(ramafile, 5, 8)
+    assert window.residues == data.residues
+    np.testing.assert_array_equal(window.phi, data.phi[5:8])
+    np.testing.assert_array_equal(window.psi, data.psi[5:8])
+    np.testing.assert_array_equal(load_rama_xvg(ramafile, 15).phi, data.phi[15:])